@@ -0,0 +1,25 @@
+from django.apps import AppConfig
+from django.core.signals import request_finished, request_started
+from django.db.backends.signals import connection_created
+from django.utils.translation import gettext_lazy as _
+
+
+class CoreConfig(AppConfig):
+    default_auto_field = "django.db.models.BigAutoField"
+    name = "apps.core"
+    verbose_name = _("Core")
+
+    def ready(self):
+        from apps.core import db
+        from apps.core.instrumentation import register_metrics
+        from apps.core.notifications import get_broker
+        from top_five.lifecycle import register_shutdown_hook
+        from top_five.warmup import startup_timings
+
+        connection_created.connect(db.connection_opened)
+        request_started.connect(db.request_started)
+        request_finished.connect(db.request_finished)
+        register_shutdown_hook(db.close_connections)
+        register_metrics("database_connections", db.connection_stats.as_dict)
+        register_metrics("startup", lambda: dict(startup_timings))
+        register_metrics("notifications", lambda: get_broker().report())
@@ -0,0 +1,62 @@
+import math
+import statistics
+import time
+
+from django.db import connections
+from django.test.utils import CaptureQueriesContext
+
+
+def percentile(sorted_values, fraction):
+    """Returns the value below which the given fraction of the sorted values
+    fall, using the nearest-rank method."""
+    if not sorted_values:
+        return 0.0
+    rank = math.ceil(fraction * len(sorted_values))
+    return sorted_values[min(max(rank, 1), len(sorted_values)) - 1]
+
+
+def measure(operation, iterations, setup=None, using="default"):
+    """Runs operation the given number of times, calling setup before each
+    run outside of the measurement, and returns the latency percentiles in
+    milliseconds together with the average number of queries per run."""
+    timings = []
+    queries = 0
+    for iteration in range(iterations):
+        if setup is not None:
+            setup(iteration)
+        with CaptureQueriesContext(connections[using]) as context:
+            started = time.perf_counter()
+            operation(iteration)
+            timings.append((time.perf_counter() - started) * 1000)
+        queries += len(context.captured_queries)
+
+    timings.sort()
+    return {
+        "iterations": iterations,
+        "mean_ms": round(statistics.fmean(timings), 3),
+        "p50_ms": round(percentile(timings, 0.50), 3),
+        "p90_ms": round(percentile(timings, 0.90), 3),
+        "p99_ms": round(percentile(timings, 0.99), 3),
+        "max_ms": round(timings[-1], 3),
+        "queries": round(queries / iterations, 2),
+    }
+
+
+def compare(results, baseline, threshold):
+    """Returns the regressions of results against a baseline: the paths whose
+    median latency grew by more than threshold (a fraction) or that run more
+    queries than before."""
+    regressions = []
+    for path, current in results.items():
+        previous = baseline.get(path)
+        if previous is None:
+            continue
+        if current["p50_ms"] > previous["p50_ms"] * (1 + threshold):
+            regressions.append(
+                f"{path}: p50 {previous['p50_ms']}ms -> {current['p50_ms']}ms"
+            )
+        if current["queries"] > previous["queries"]:
+            regressions.append(
+                f"{path}: queries {previous['queries']} -> {current['queries']}"
+            )
+    return regressions
@@ -0,0 +1,88 @@
+import random
+import threading
+
+from django.conf import settings
+from django.db import connections
+
+
+class ConnectionStats:
+    """Per-process counters of the database connection lifecycle:
+    connections opened, reused by a new request and discarded, because
+    they outlived CONN_MAX_AGE, failed a health check or broke."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.opened = 0
+            self.reused = 0
+            self.discarded = 0
+
+    def increment(self, name):
+        with self._lock:
+            setattr(self, name, getattr(self, name) + 1)
+
+    def as_dict(self):
+        with self._lock:
+            return {
+                "opened": self.opened,
+                "reused": self.reused,
+                "discarded": self.discarded,
+                "reuse_ratio": (
+                    self.reused / (self.opened + self.reused)
+                    if self.opened + self.reused
+                    else 0.0
+                ),
+            }
+
+
+connection_stats = ConnectionStats()
+
+
+def _track_closed(connection):
+    if getattr(connection, "_tracked_open", False) and connection.connection is None:
+        connection._tracked_open = False
+        connection_stats.increment("discarded")
+
+
+def connection_opened(sender, connection, **kwargs):
+    """Counts the new connection and spreads its expiry with up to
+    DATABASE_CONN_MAX_AGE_JITTER seconds, so the connections a fleet of
+    workers opened together are not recycled all at once."""
+    if getattr(connection, "_tracked_open", False):
+        # The previous connection was dropped outside of a request boundary,
+        # typically by a failed health check before the first query
+        connection_stats.increment("discarded")
+    connection._tracked_open = True
+    connection_stats.increment("opened")
+
+    jitter = min(
+        settings.DATABASE_CONN_MAX_AGE_JITTER,
+        connection.settings_dict["CONN_MAX_AGE"] or 0,
+    )
+    if connection.close_at is not None and jitter > 0:
+        connection.close_at -= random.uniform(0, jitter)
+
+
+def request_started(**kwargs):
+    """Runs after Django closed the unusable and obsolete connections at the
+    start of a request, so the ones left open are reused."""
+    for connection in connections.all(initialized_only=True):
+        _track_closed(connection)
+        if connection.connection is not None:
+            connection_stats.increment("reused")
+
+
+def request_finished(**kwargs):
+    for connection in connections.all(initialized_only=True):
+        _track_closed(connection)
+
+
+def close_connections():
+    """Closes the connections of the current thread when the worker shuts
+    down, so the database does not wait for them to time out."""
+    for connection in connections.all(initialized_only=True):
+        connection.close()
+        _track_closed(connection)
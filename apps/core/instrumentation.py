@@ -0,0 +1,113 @@
+import logging
+import os
+import re
+import threading
+import time
+from collections import Counter
+from contextlib import ExitStack, contextmanager
+from functools import wraps
+
+from django.conf import settings
+from django.db import connections
+
+logger = logging.getLogger(__name__)
+
+WHITESPACE_RE = re.compile(r"\s+")
+
+_metrics_providers = {}
+_metrics_providers_lock = threading.Lock()
+
+
+class QueryBudgetExceeded(AssertionError):
+    """Raised when a view runs more queries than its declared budget."""
+
+
+def query_budget(budget):
+    """Declares the maximum number of queries a view may run. Exceeding it
+    raises QueryBudgetExceeded when the INSTRUMENTATION_ENFORCE_QUERY_BUDGETS
+    setting is enabled, as in development and in the test suite, and logs
+    a warning otherwise."""
+
+    def decorator(view):
+        @wraps(view)
+        def wrapper(request, *args, **kwargs):
+            recorder = QueryRecorder()
+            with recorder.record():
+                response = view(request, *args, **kwargs)
+
+            if recorder.count > budget:
+                message = (
+                    f"{request.method} {request.path} exceeded its budget of "
+                    f"{budget} queries: {recorder.report()}"
+                )
+                if settings.INSTRUMENTATION_ENFORCE_QUERY_BUDGETS:
+                    raise QueryBudgetExceeded(message)
+                logger.warning(message)
+            return response
+
+        wrapper.query_budget = budget
+        return wrapper
+
+    return decorator
+
+
+def fingerprint(sql):
+    """Returns the SQL of a query with its whitespace collapsed. Parameters
+    are passed apart from the SQL, so the same query with other values gets
+    the same fingerprint."""
+    return WHITESPACE_RE.sub(" ", sql).strip()
+
+
+class QueryRecorder:
+    """Database execute wrapper recording the count, duration and
+    fingerprints of the queries run while it is installed."""
+
+    def __init__(self):
+        self.count = 0
+        self.duration = 0.0
+        self.fingerprints = Counter()
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.duration += time.perf_counter() - started
+            self.count += 1
+            self.fingerprints[fingerprint(sql)] += 1
+
+    @contextmanager
+    def record(self):
+        """Installs the recorder on every database connection of the
+        current thread."""
+        with ExitStack() as stack:
+            for connection in connections.all():
+                stack.enter_context(connection.execute_wrapper(self))
+            yield self
+
+    def duplicates(self):
+        """Returns the (fingerprint, count) pairs of the queries that ran
+        more than once, the usual sign of an N+1 pattern."""
+        return [
+            (sql, count) for sql, count in self.fingerprints.most_common() if count > 1
+        ]
+
+    def report(self):
+        lines = [f"{self.count} queries in {self.duration * 1000:.2f}ms"]
+        lines += [f"  {count}x {sql}" for sql, count in self.duplicates()]
+        return "\n".join(lines)
+
+
+def register_metrics(name, provider):
+    """Registers a callable returning a JSON serializable dict of counters,
+    published under the given name by collect_metrics()."""
+    with _metrics_providers_lock:
+        _metrics_providers[name] = provider
+
+
+def collect_metrics():
+    """Returns the counters of every registered provider. They are kept per
+    process, so the pid tells the workers apart."""
+    with _metrics_providers_lock:
+        providers = dict(_metrics_providers)
+    return {"pid": os.getpid(), **{name: get() for name, get in providers.items()}}
@@ -0,0 +1,212 @@
+import json
+import platform
+import random
+
+import django
+from django.core.cache import cache
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+from django.test import Client, override_settings
+from django.test.utils import (
+    setup_databases,
+    setup_test_environment,
+    teardown_databases,
+    teardown_test_environment,
+)
+from django.urls import reverse
+
+from apps.core.benchmarks import compare, measure
+from apps.tops.leaderboards import rebuild_leaderboards
+from apps.tops.models import Tag, TopList, TopListItem, Vote
+from apps.tops.search import rebuild_search_index
+from apps.tops.trending import score_trending
+from apps.tops.votes import apply_buffered_votes
+from apps.users.forms import CustomAuthenticationForm
+from apps.users.models import CustomUser
+
+BENCH_PASSWORD = "bench-password"
+
+WORDS = (
+    "best worst movies books songs albums games cities beaches dishes pizza "
+    "burgers coffee series anime heroes villains cars bikes trails museums"
+).split()
+
+
+class Command(BaseCommand):
+    help = (
+        "Seeds reproducible synthetic data in a throwaway test database and "
+        "times the key paths: user creation, authentication, session "
+        "authenticated requests and the home page."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--users", type=int, default=200)
+        parser.add_argument("--lists", type=int, default=500)
+        parser.add_argument("--votes", type=int, default=5000)
+        parser.add_argument(
+            "--iterations", type=int, default=30, help="Runs of each path."
+        )
+        parser.add_argument("--seed", type=int, default=0)
+        parser.add_argument("--output", help="Write the results as JSON here.")
+        parser.add_argument(
+            "--baseline", help="JSON results of a previous run to compare with."
+        )
+        parser.add_argument(
+            "--threshold",
+            type=float,
+            default=0.2,
+            help="Median slowdown, as a fraction, reported as a regression.",
+        )
+        parser.add_argument(
+            "--keepdb", action="store_true", help="Keep the benchmark database."
+        )
+
+    def handle(self, *args, **options):
+        baseline = None
+        if options["baseline"]:
+            with open(options["baseline"], encoding="utf-8") as file:
+                baseline = json.load(file)["results"]
+
+        self.random = random.Random(options["seed"])
+        setup_test_environment()
+        old_config = setup_databases(
+            verbosity=0, interactive=False, keepdb=options["keepdb"]
+        )
+        try:
+            self.seed(options["users"], options["lists"], options["votes"])
+            results = self.run_benchmarks(options["iterations"])
+        finally:
+            teardown_databases(old_config, verbosity=0, keepdb=options["keepdb"])
+            teardown_test_environment()
+
+        report = {
+            "meta": {
+                "users": options["users"],
+                "lists": options["lists"],
+                "votes": options["votes"],
+                "iterations": options["iterations"],
+                "seed": options["seed"],
+                "database": connections["default"].vendor,
+                "django": django.get_version(),
+                "python": platform.python_version(),
+            },
+            "results": results,
+        }
+        self.print_results(results)
+        if options["output"]:
+            with open(options["output"], "w", encoding="utf-8") as file:
+                json.dump(report, file, indent=2, sort_keys=True)
+
+        if baseline is not None:
+            regressions = compare(results, baseline, options["threshold"])
+            if regressions:
+                raise CommandError(
+                    "Performance regressions:\n" + "\n".join(regressions)
+                )
+            self.stdout.write(self.style.SUCCESS("No regressions against baseline."))
+
+    def seed(self, users, lists, votes):
+        result = CustomUser.objects.bulk_create_users(
+            {"username": f"benchuser{number}", "password": BENCH_PASSWORD}
+            for number in range(users)
+        )
+        self.users = result.created
+        tags = Tag.objects.bulk_create(
+            [Tag(name=f"benchtag{number}") for number in range(20)]
+        )
+
+        TopList.objects.bulk_create(
+            [
+                TopList(
+                    owner=self.random.choice(self.users),
+                    name=" ".join(self.random.sample(WORDS, 3)),
+                )
+                for _ in range(lists)
+            ]
+        )
+        top_lists = list(TopList.objects.order_by("pk"))
+        TopListItem.objects.bulk_create(
+            [
+                TopListItem(
+                    top_list=top_list, position=position, title=f"Item {position}"
+                )
+                for top_list in top_lists
+                for position in range(1, 6)
+            ]
+        )
+        through = TopList.tags.through
+        through.objects.bulk_create(
+            [
+                through(toplist_id=top_list.pk, tag_id=tag.pk)
+                for top_list in top_lists
+                for tag in self.random.sample(tags, self.random.randint(0, 3))
+            ]
+        )
+        apply_buffered_votes(
+            {
+                (
+                    self.random.choice(self.users).pk,
+                    self.random.choice(top_lists).pk,
+                ): self.random.choice([Vote.LIKE, Vote.LIKE, Vote.DISLIKE])
+                for _ in range(votes)
+            }
+        )
+        TopList.objects.refresh_snapshots([top_list.pk for top_list in top_lists])
+        rebuild_leaderboards()
+        rebuild_search_index()
+        # The home page ranks the lists by their trending scores
+        score_trending(full=True)
+
+    def run_benchmarks(self, iterations):
+        client = Client()
+        results = {}
+
+        results["user_creation"] = measure(
+            lambda iteration: CustomUser.objects.create_user(
+                username=f"benchnewuser{iteration}", password=BENCH_PASSWORD
+            ),
+            iterations,
+        )
+
+        def authenticate(iteration):
+            user = self.users[iteration % len(self.users)]
+            form = CustomAuthenticationForm(
+                data={"username": user.username, "password": BENCH_PASSWORD}
+            )
+            if not form.is_valid():
+                raise CommandError(f"Could not authenticate {user.username}.")
+
+        # The same few users log in over and over, which the login rate
+        # limits would soon reject
+        with override_settings(USERS_LOGIN_IP_LIMIT=0, USERS_LOGIN_USERNAME_LIMIT=0):
+            results["authentication"] = measure(authenticate, iterations)
+
+        client.force_login(self.users[0])
+        # The admin checks request.user on every hit and redirects non staff
+        # users, so it measures session and user resolution alone
+        admin_url = reverse("admin:index")
+        results["session_request"] = measure(
+            lambda iteration: client.get(admin_url), iterations
+        )
+        client.logout()
+
+        home_url = reverse("home")
+        results["home_render_cold"] = measure(
+            lambda iteration: client.get(home_url),
+            iterations,
+            setup=lambda iteration: cache.clear(),
+        )
+        results["home_render_warm"] = measure(
+            lambda iteration: client.get(home_url), iterations
+        )
+        return results
+
+    def print_results(self, results):
+        self.stdout.write(
+            f"{'path':<18} {'p50 ms':>9} {'p90 ms':>9} {'p99 ms':>9} {'queries':>8}"
+        )
+        for path, result in results.items():
+            self.stdout.write(
+                f"{path:<18} {result['p50_ms']:>9.2f} {result['p90_ms']:>9.2f} "
+                f"{result['p99_ms']:>9.2f} {result['queries']:>8}"
+            )
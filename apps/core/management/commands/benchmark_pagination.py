@@ -0,0 +1,81 @@
+import statistics
+import time
+
+from django.contrib.auth.hashers import make_password
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from apps.core.pagination import NEXT, CursorPaginator
+from apps.users.models import CustomUser
+
+
+class Command(BaseCommand):
+    help = (
+        "Compares the latency of deep pages of the user directory with OFFSET "
+        "and with keyset pagination. The users are seeded inside a "
+        "transaction that is rolled back at the end."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--users", type=int, default=250_000)
+        parser.add_argument(
+            "--pages",
+            nargs="+",
+            type=int,
+            default=[1, 100, 1_000, 10_000],
+            help="Page numbers to measure.",
+        )
+        parser.add_argument("--page-size", type=int, default=20)
+        parser.add_argument("--runs", type=int, default=20, help="Runs per page.")
+
+    def handle(self, *args, **options):
+        page_size = options["page_size"]
+        if max(options["pages"]) * page_size > options["users"]:
+            raise CommandError("Not enough --users for the deepest page.")
+
+        with transaction.atomic():
+            self.seed(options["users"])
+            self.benchmark(options["pages"], page_size, options["runs"])
+            transaction.set_rollback(True)
+
+    def seed(self, count):
+        password = make_password(None)
+        batch_size = 10_000
+        for offset in range(0, count, batch_size):
+            CustomUser.objects.bulk_create(
+                [
+                    CustomUser(username=f"benchmarkpage{number}", password=password)
+                    for number in range(offset, min(offset + batch_size, count))
+                ],
+                batch_size=1000,
+            )
+
+    def benchmark(self, pages, page_size, runs):
+        paginator = CursorPaginator(("id",), page_size)
+        users = CustomUser.objects.values("id", "username")
+        self.stdout.write(
+            f"{'page':>7} {'offset ms':>10} {'keyset ms':>10} {'speedup':>8}"
+        )
+        for number in pages:
+            offset = (number - 1) * page_size
+            # The cursor a client would hold after reading the previous page
+            cursor = None
+            if offset:
+                cursor = paginator.encode_cursor(users.order_by("id")[offset - 1], NEXT)
+
+            offset_ms = self.time(
+                lambda: list(users.order_by("id")[offset : offset + page_size]), runs
+            )
+            keyset_ms = self.time(lambda: paginator.page(users, cursor).items, runs)
+            self.stdout.write(
+                f"{number:>7} {offset_ms:>10.2f} {keyset_ms:>10.2f} "
+                f"{offset_ms / keyset_ms:>7.1f}x"
+            )
+
+    def time(self, operation, runs):
+        timings = []
+        for _ in range(runs):
+            started = time.perf_counter()
+            operation()
+            timings.append((time.perf_counter() - started) * 1000)
+        return statistics.median(timings)
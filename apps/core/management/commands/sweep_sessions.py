@@ -0,0 +1,62 @@
+import time
+
+from django.conf import settings
+from django.contrib.sessions.models import Session
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+
+class Command(BaseCommand):
+    help = (
+        "Deletes expired sessions in small batches with a pause between "
+        "them, so the session table is never locked for long. Unlike "
+        "clearsessions it can stop after --limit sessions, to work through a "
+        "large backlog over several runs."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, help="Sessions per DELETE.")
+        parser.add_argument(
+            "--pause", type=float, help="Seconds to wait between two batches."
+        )
+        parser.add_argument("--limit", type=int, help="Sessions to delete at most.")
+
+    def handle(self, *args, **options):
+        deleted = self.sweep(
+            batch_size=options["batch_size"] or settings.SESSION_SWEEP_BATCH_SIZE,
+            pause=(
+                settings.SESSION_SWEEP_PAUSE
+                if options["pause"] is None
+                else options["pause"]
+            ),
+            limit=options["limit"],
+        )
+        self.stdout.write(self.style.SUCCESS(f"Deleted {deleted} expired sessions."))
+
+    def sweep(self, batch_size, pause, limit):
+        """Deletes the expired sessions, found through the index on
+        expire_date, in batches of batch_size each in its own short
+        transaction. Returns the number of sessions deleted."""
+        now = timezone.now()
+        deleted = 0
+        while limit is None or deleted < limit:
+            size = batch_size if limit is None else min(batch_size, limit - deleted)
+            keys = list(
+                Session.objects.filter(expire_date__lt=now)
+                .order_by("expire_date")
+                .values_list("session_key", flat=True)[:size]
+            )
+            if not keys:
+                break
+
+            # The expiry is checked again in case a session was extended
+            # since it was selected
+            count, _ = Session.objects.filter(
+                session_key__in=keys, expire_date__lt=now
+            ).delete()
+            deleted += count
+            if len(keys) < size:
+                break
+            if pause:
+                time.sleep(pause)
+        return deleted
@@ -0,0 +1,25 @@
+import json
+
+from django.core.management.base import BaseCommand
+
+from top_five.warmup import warm_up
+
+
+class Command(BaseCommand):
+    help = (
+        "Runs the warm-up of the WSGI and ASGI workers and prints the "
+        "duration of each step, to track cold start regressions."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--json", action="store_true", help="Print the timings as JSON."
+        )
+
+    def handle(self, *args, **options):
+        timings = warm_up()
+        if options["json"]:
+            self.stdout.write(json.dumps(timings))
+            return
+        for name, value in timings.items():
+            self.stdout.write(f"{name:<24}{value:>10.2f}")
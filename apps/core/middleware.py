@@ -0,0 +1,89 @@
+import json
+import logging
+import random
+import time
+
+from django.conf import settings
+
+from apps.core.instrumentation import QueryRecorder
+from apps.core.routers import pin_to_primary, wrote_to_primary
+
+logger = logging.getLogger("apps.core.instrumentation")
+
+
+class InstrumentationMiddleware:
+    """Records, for a sample of the requests set by
+    INSTRUMENTATION_SAMPLE_RATE, the number of queries, the time spent in the
+    database, the fingerprints of duplicated queries and the wall time of the
+    request. The measures are logged as a JSON line and, when
+    INSTRUMENTATION_SERVER_TIMING is enabled, sent back in a Server-Timing
+    header. Place it first so the queries of the other middleware count."""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if random.random() >= settings.INSTRUMENTATION_SAMPLE_RATE:
+            return self.get_response(request)
+
+        recorder = QueryRecorder()
+        started = time.perf_counter()
+        with recorder.record():
+            response = self.get_response(request)
+        self.emit(request, response, recorder, time.perf_counter() - started)
+        return response
+
+    def emit(self, request, response, recorder, duration):
+        db_ms = recorder.duration * 1000
+        total_ms = duration * 1000
+        if settings.INSTRUMENTATION_SERVER_TIMING:
+            response["Server-Timing"] = (
+                f'db;dur={db_ms:.2f};desc="{recorder.count} queries", '
+                f"app;dur={total_ms - db_ms:.2f}, total;dur={total_ms:.2f}"
+            )
+        logger.info(
+            json.dumps(
+                {
+                    "method": request.method,
+                    "path": request.path,
+                    "status": response.status_code,
+                    "queries": recorder.count,
+                    "db_ms": round(db_ms, 2),
+                    "total_ms": round(total_ms, 2),
+                    "duplicates": [
+                        {"sql": sql, "count": count}
+                        for sql, count in recorder.duplicates()
+                    ],
+                }
+            )
+        )
+
+
+class ReplicaStickinessMiddleware:
+    """Keeps the reads of a client on the primary database for
+    DATABASE_REPLICA_STICKY_SECONDS after it wrote, so it reads its own
+    writes despite the replication lag. The window is carried by a cookie,
+    which costs nothing on the server and follows the client across
+    workers."""
+
+    cookie_name = "pin_primary"
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if not settings.DATABASE_REPLICAS:
+            return self.get_response(request)
+
+        with pin_to_primary(self.cookie_name in request.COOKIES):
+            response = self.get_response(request)
+            if wrote_to_primary():
+                response.set_cookie(
+                    self.cookie_name,
+                    "1",
+                    max_age=settings.DATABASE_REPLICA_STICKY_SECONDS,
+                    secure=request.is_secure(),
+                    httponly=True,
+                    samesite="Lax",
+                )
+        return response
@@ -0,0 +1,353 @@
+"""
+Real-time notifications pushed to the connected users as Server-Sent Events.
+
+Events are published to channels, one per user, through a broker whose class
+is set by NOTIFICATIONS_BROKER. The default InProcessBroker fans events out
+to the connections held by the worker it runs in, which is enough when a
+single ASGI worker serves the notifications; several workers need a broker
+relaying the events between them, written against the Broker interface.
+
+The stream is served by serve_notifications(), a plain ASGI application that
+asgi.py routes to with NotificationsRouter, outside Django's ASGI handler: the
+handler keeps a thread per request until its response ends, which for
+streams held open for hours would mean one thread per connected user.
+"""
+
+import asyncio
+import itertools
+import json
+import threading
+import time
+from collections import defaultdict
+from importlib import import_module
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.contrib.auth import get_user
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import close_old_connections
+from django.http import HttpRequest
+from django.http.cookie import parse_cookie
+from django.urls import reverse
+from django.utils.module_loading import import_string
+
+from top_five.lifecycle import register_shutdown_hook
+
+
+def user_channel(user_id):
+    return f"user:{user_id}"
+
+
+class Event:
+    """Published event, encoded once as an SSE message whatever the number
+    of connections it is sent to."""
+
+    __slots__ = ("id", "type", "message", "published_at")
+
+    def __init__(self, event_id, event_type, data):
+        self.id = event_id
+        self.type = event_type
+        payload = json.dumps(data, separators=(",", ":"), cls=DjangoJSONEncoder)
+        self.message = f"id: {event_id}\nevent: {event_type}\ndata: {payload}\n\n"
+        self.published_at = time.monotonic()
+
+
+class Subscription:
+    """Connection to a channel, bound to the event loop that serves it. At
+    most queue_size events wait to be sent; when a slow client lets the
+    queue fill up, the oldest events are dropped."""
+
+    def __init__(self, broker, channel, queue_size):
+        self.broker = broker
+        self.channel = channel
+        self.loop = asyncio.get_running_loop()
+        self.queue = asyncio.Queue(queue_size)
+        self.dropped = 0
+
+    def push(self, event):
+        """Queues an event, from the event loop of the subscription."""
+        if self.queue.full():
+            self.queue.get_nowait()
+            self.dropped += 1
+            self.broker.stats.increment("dropped")
+        self.queue.put_nowait(event)
+
+    async def get(self):
+        return await self.queue.get()
+
+
+class BrokerStats:
+    """Per-process counters of the notification broker."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.published = 0
+            self.delivered = 0
+            self.dropped = 0
+            self.reaped = 0
+
+    def increment(self, name, value=1):
+        with self._lock:
+            setattr(self, name, getattr(self, name) + value)
+
+    def as_dict(self):
+        with self._lock:
+            return {
+                "published": self.published,
+                "delivered": self.delivered,
+                "dropped": self.dropped,
+                "reaped": self.reaped,
+            }
+
+
+class Broker:
+    """Interface of the notification brokers. subscribe() and unsubscribe()
+    are called from the event loop serving the connection, publish() from
+    any thread."""
+
+    def __init__(self, queue_size=100):
+        self.queue_size = queue_size
+        self.stats = BrokerStats()
+
+    def subscribe(self, channel):
+        raise NotImplementedError
+
+    def unsubscribe(self, subscription):
+        raise NotImplementedError
+
+    def publish(self, channel, event_type, data):
+        raise NotImplementedError
+
+    def report(self):
+        return self.stats.as_dict()
+
+    def close(self):
+        pass
+
+
+class InProcessBroker(Broker):
+    """Broker fanning the events out to the subscriptions of the process.
+    Publishing from a thread hands the event over to each event loop with
+    a single call, which then queues it on all of its subscriptions."""
+
+    def __init__(self, queue_size=100):
+        super().__init__(queue_size)
+        self._channels = defaultdict(set)
+        self._lock = threading.Lock()
+        self._ids = itertools.count(1)
+        self.connections = 0
+
+    def subscribe(self, channel):
+        subscription = Subscription(self, channel, self.queue_size)
+        with self._lock:
+            self._channels[channel].add(subscription)
+            self.connections += 1
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            subscriptions = self._channels.get(subscription.channel)
+            if subscriptions is None or subscription not in subscriptions:
+                return
+            subscriptions.discard(subscription)
+            if not subscriptions:
+                del self._channels[subscription.channel]
+            self.connections -= 1
+
+    def publish(self, channel, event_type, data):
+        """Publishes an event to the subscriptions of the channel and returns
+        it."""
+        with self._lock:
+            event = Event(next(self._ids), event_type, data)
+            subscriptions = list(self._channels.get(channel, ()))
+        self.stats.increment("published")
+
+        by_loop = defaultdict(list)
+        for subscription in subscriptions:
+            by_loop[subscription.loop].append(subscription)
+        try:
+            current = asyncio.get_running_loop()
+        except RuntimeError:
+            current = None
+        for loop, subscriptions in by_loop.items():
+            if loop is current:
+                self._deliver(subscriptions, event)
+                continue
+            try:
+                loop.call_soon_threadsafe(self._deliver, subscriptions, event)
+            except RuntimeError:
+                # The loop was closed along with its connections
+                continue
+        return event
+
+    def _deliver(self, subscriptions, event):
+        for subscription in subscriptions:
+            subscription.push(event)
+        self.stats.increment("delivered", len(subscriptions))
+
+    def report(self):
+        report = super().report()
+        with self._lock:
+            report["connections"] = self.connections
+            report["channels"] = len(self._channels)
+        return report
+
+
+async def event_stream(broker, channel, heartbeat_interval, idle_timeout):
+    """Yields the SSE messages of a connection to the channel. A comment is
+    sent every heartbeat_interval seconds without events, so proxies keep
+    the connection open and dead clients are noticed when it fails to be
+    written. Connections that got no event for idle_timeout seconds are
+    closed, which reaps those whose client vanished without the socket
+    being closed; live clients reconnect on their own."""
+    # Subscribed on first iteration, in the event loop that sends the stream
+    subscription = broker.subscribe(channel)
+    loop = subscription.loop
+    try:
+        yield f"retry: {int(heartbeat_interval * 1000)}\n\n"
+        last_event = loop.time()
+        while True:
+            try:
+                async with asyncio.timeout(heartbeat_interval):
+                    event = await subscription.get()
+            except TimeoutError:
+                if loop.time() - last_event >= idle_timeout:
+                    broker.stats.increment("reaped")
+                    return
+                yield ": heartbeat\n\n"
+                continue
+            last_event = loop.time()
+            yield event.message
+    finally:
+        broker.unsubscribe(subscription)
+
+
+_broker = None
+_broker_lock = threading.Lock()
+
+
+def get_broker():
+    """Returns the notification broker of the process, an instance of the
+    NOTIFICATIONS_BROKER class."""
+    global _broker
+    if _broker is None:
+        with _broker_lock:
+            if _broker is None:
+                broker_class = import_string(settings.NOTIFICATIONS_BROKER)
+                _broker = broker_class(queue_size=settings.NOTIFICATIONS_QUEUE_SIZE)
+                register_shutdown_hook(_broker.close)
+    return _broker
+
+
+def notify_user(user_id, event_type, data):
+    """Sends an event to the connections of a user."""
+    return get_broker().publish(user_channel(user_id), event_type, data)
+
+
+def get_scope_user(scope):
+    """Returns the user of the session cookie of an ASGI scope, as the
+    authentication middleware would for a request."""
+    cookies = parse_cookie(
+        "; ".join(
+            value.decode("latin-1")
+            for name, value in scope["headers"]
+            if name == b"cookie"
+        )
+    )
+    request = HttpRequest()
+    request.session = import_module(settings.SESSION_ENGINE).SessionStore(
+        cookies.get(settings.SESSION_COOKIE_NAME)
+    )
+    try:
+        return get_user(request)
+    finally:
+        close_old_connections()
+
+
+async def respond(send, status, body=b""):
+    await send(
+        {
+            "type": "http.response.start",
+            "status": status,
+            "headers": [(b"content-type", b"text/plain; charset=utf-8")],
+        }
+    )
+    await send({"type": "http.response.body", "body": body})
+
+
+async def wait_for_disconnect(receive):
+    while (await receive())["type"] != "http.disconnect":
+        pass
+
+
+async def serve_notifications(scope, receive, send):
+    """ASGI application streaming the notifications of the user of the
+    session as Server-Sent Events. Reading the session and the user takes
+    the thread of the sync code for a moment, then a connection only costs
+    the coroutine waiting for its events, which ends when the client
+    disconnects."""
+    if scope["method"] != "GET":
+        return await respond(send, 405)
+    user = await sync_to_async(get_scope_user)(scope)
+    if not user.is_authenticated:
+        return await respond(send, 401)
+
+    await send(
+        {
+            "type": "http.response.start",
+            "status": 200,
+            "headers": [
+                (b"content-type", b"text/event-stream"),
+                (b"cache-control", b"no-cache"),
+                # Stops nginx from buffering the stream
+                (b"x-accel-buffering", b"no"),
+            ],
+        }
+    )
+    stream = event_stream(
+        get_broker(),
+        user_channel(user.pk),
+        settings.NOTIFICATIONS_HEARTBEAT_INTERVAL,
+        settings.NOTIFICATIONS_IDLE_TIMEOUT,
+    )
+    disconnected = asyncio.ensure_future(wait_for_disconnect(receive))
+    try:
+        while True:
+            message = asyncio.ensure_future(anext(stream))
+            await asyncio.wait(
+                (message, disconnected), return_when=asyncio.FIRST_COMPLETED
+            )
+            if not message.done():
+                # Cancelling the wait for an event unsubscribes the stream
+                message.cancel()
+                await asyncio.wait((message,))
+                return
+            try:
+                body = message.result()
+            except StopAsyncIteration:
+                break
+            await send(
+                {"type": "http.response.body", "body": body.encode(), "more_body": True}
+            )
+        await send({"type": "http.response.body", "body": b""})
+    finally:
+        disconnected.cancel()
+        await stream.aclose()
+
+
+class NotificationsRouter:
+    """ASGI middleware serving the notifications path with
+    serve_notifications() and the other requests with app."""
+
+    def __init__(self, app):
+        self.app = app
+        self.path = reverse("core:notifications")
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "http" and scope["path"] == self.path:
+            return await serve_notifications(scope, receive, send)
+        return await self.app(scope, receive, send)
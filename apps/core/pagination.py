@@ -0,0 +1,244 @@
+import datetime
+import json
+from functools import reduce
+from operator import or_
+
+from django.core import signing
+from django.core.exceptions import EmptyResultSet
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import connections
+from django.db.models import Q
+
+NEXT = "n"
+PREVIOUS = "p"
+
+
+# Estimates below this are replaced by exact counts, which are cheap there
+# and right after a table was created, before the planner gathered statistics
+EXACT_COUNT_BELOW = 10_000
+
+
+def _planner_estimate(queryset):
+    """Rows the query planner expects the queryset to return, or None when
+    the database gives no estimate."""
+    connection = connections[queryset.db]
+    if connection.vendor not in ("postgresql", "mysql"):
+        return None
+    query = queryset.order_by().values("pk").query
+    try:
+        sql, params = query.get_compiler(using=queryset.db).as_sql()
+    except EmptyResultSet:
+        return 0
+    with connection.cursor() as cursor:
+        if connection.vendor == "postgresql":
+            cursor.execute(f"EXPLAIN (FORMAT JSON) {sql}", params)
+            plan = cursor.fetchone()[0]
+            if isinstance(plan, str):
+                plan = json.loads(plan)
+            return plan[0]["Plan"]["Plan Rows"]
+        cursor.execute(f"EXPLAIN {sql}", params)
+        columns = [column[0].lower() for column in cursor.description]
+        return cursor.fetchone()[columns.index("rows")]
+
+
+def estimated_count(queryset):
+    """Number of rows of the queryset as estimated by the query planner of
+    PostgreSQL or MySQL from its statistics, which costs the same however
+    many rows match, unlike COUNT(*). Exact on the other databases and for
+    small results."""
+    estimate = _planner_estimate(queryset)
+    if estimate is None or estimate < EXACT_COUNT_BELOW:
+        return queryset.count()
+    return int(estimate)
+
+
+class InvalidCursor(ValueError):
+    """Raised when a cursor was forged, corrupted or made for another
+    listing."""
+
+
+class CursorEncoder(DjangoJSONEncoder):
+    """DjangoJSONEncoder keeping the microseconds of the times, which it
+    rounds to milliseconds: a rounded cursor would skip the rows created
+    within the same millisecond."""
+
+    def default(self, o):
+        if isinstance(o, (datetime.datetime, datetime.time)):
+            value = o.isoformat()
+            return value[:-6] + "Z" if value.endswith("+00:00") else value
+        return super().default(o)
+
+
+class CursorSerializer:
+    """signing serializer that accepts dates and decimals in the cursor
+    values, decoded back by the model fields."""
+
+    def dumps(self, obj):
+        return json.dumps(obj, separators=(",", ":"), cls=CursorEncoder).encode(
+            "latin-1"
+        )
+
+    def loads(self, data):
+        return json.loads(data.decode("latin-1"))
+
+
+class CursorPage:
+    def __init__(self, items, next_cursor=None, previous_cursor=None):
+        self.items = items
+        self.next_cursor = next_cursor
+        self.previous_cursor = previous_cursor
+
+    @property
+    def has_next(self):
+        return self.next_cursor is not None
+
+    @property
+    def has_previous(self):
+        return self.previous_cursor is not None
+
+    def __iter__(self):
+        return iter(self.items)
+
+    def __len__(self):
+        return len(self.items)
+
+
+class CursorPaginator:
+    """Keyset pagination: pages are fetched with a WHERE on the ordering
+    values of the last row seen instead of an OFFSET, so every page costs
+    the same as the first one when an index covers the ordering. The
+    ordering must be unique, typically by ending with the primary key, and
+    its fields must not be null.
+
+    Cursors are opaque strings signed with the salt, which ties them to the
+    listing, and remember the direction to page in."""
+
+    def __init__(self, ordering, page_size=20, salt="core.pagination"):
+        self.ordering = [(name.lstrip("-"), name.startswith("-")) for name in ordering]
+        self.page_size = page_size
+        self.salt = salt
+
+    def encode_cursor(self, row, direction):
+        values = [self._value(row, name) for name, _descending in self.ordering]
+        return signing.dumps(
+            [direction, values], salt=self.salt, serializer=CursorSerializer
+        )
+
+    def decode_cursor(self, cursor):
+        try:
+            direction, values = signing.loads(
+                cursor, salt=self.salt, serializer=CursorSerializer
+            )
+        except (signing.BadSignature, TypeError, ValueError):
+            raise InvalidCursor("Invalid cursor.")
+        if direction not in (NEXT, PREVIOUS) or len(values) != len(self.ordering):
+            raise InvalidCursor("Invalid cursor.")
+        return direction, values
+
+    def page(self, queryset, cursor=None):
+        """Returns the CursorPage of the queryset that follows, or precedes,
+        the given cursor, the first page without one."""
+        direction, values = self.decode_cursor(cursor) if cursor else (NEXT, None)
+        backwards = direction == PREVIOUS
+        ordering = [
+            (name, descending != backwards) for name, descending in self.ordering
+        ]
+        queryset = queryset.order_by(
+            *[("-" if descending else "") + name for name, descending in ordering]
+        )
+        if values is not None:
+            opts = queryset.model._meta
+            try:
+                values = [
+                    opts.get_field(name).to_python(value)
+                    for (name, _descending), value in zip(ordering, values)
+                ]
+            except Exception:
+                raise InvalidCursor("Invalid cursor.")
+            queryset = queryset.filter(self._after(ordering, values))
+
+        rows = list(queryset[: self.page_size + 1])
+        has_more = len(rows) > self.page_size
+        rows = rows[: self.page_size]
+        if backwards:
+            rows.reverse()
+        return self._make_page(rows, has_more, values is not None, backwards)
+
+    def page_of_list(self, rows, cursor=None):
+        """Same as page() for rows already sorted in the ordering of the
+        paginator, such as a ranking held in memory. Rows are found by
+        comparing their values, so those must be JSON native."""
+        direction, values = self.decode_cursor(cursor) if cursor else (NEXT, None)
+        backwards = direction == PREVIOUS
+        if values is None:
+            start, stop = 0, self.page_size
+        elif backwards:
+            stop = next(
+                (
+                    index
+                    for index, row in enumerate(rows)
+                    if not self._precedes(row, values)
+                ),
+                len(rows),
+            )
+            start = max(stop - self.page_size, 0)
+        else:
+            start = next(
+                (index for index, row in enumerate(rows) if self._follows(row, values)),
+                len(rows),
+            )
+            stop = start + self.page_size
+
+        page_rows = rows[start:stop]
+        has_more = start > 0 if backwards else stop < len(rows)
+        return self._make_page(page_rows, has_more, values is not None, backwards)
+
+    def _make_page(self, rows, has_more, from_cursor, backwards):
+        # Coming from a cursor means there are rows on the side it came from
+        if backwards:
+            has_next, has_previous = from_cursor, has_more
+        else:
+            has_next, has_previous = has_more, from_cursor
+        next_cursor = previous_cursor = None
+        if rows and has_next:
+            next_cursor = self.encode_cursor(rows[-1], NEXT)
+        if rows and has_previous:
+            previous_cursor = self.encode_cursor(rows[0], PREVIOUS)
+        return CursorPage(rows, next_cursor, previous_cursor)
+
+    @staticmethod
+    def _value(row, name):
+        return row[name] if isinstance(row, dict) else getattr(row, name)
+
+    @staticmethod
+    def _after(ordering, values):
+        """Q matching the rows after values in the ordering. The leading
+        range on the first field lets the database scan the index from the
+        cursor on."""
+        conditions = []
+        for position, (name, descending) in enumerate(ordering):
+            equal = {
+                previous: value
+                for (previous, _), value in zip(ordering[:position], values)
+            }
+            lookup = "lt" if descending else "gt"
+            conditions.append(Q(**equal, **{f"{name}__{lookup}": values[position]}))
+        first, descending = ordering[0]
+        leading = Q(**{f"{first}__{'lte' if descending else 'gte'}": values[0]})
+        return leading & reduce(or_, conditions)
+
+    def _compare(self, row, values):
+        """Returns -1, 0 or 1 as row comes before, at or after values in the
+        ordering."""
+        for (name, descending), value in zip(self.ordering, values):
+            current = self._value(row, name)
+            if current != value:
+                after = current < value if descending else current > value
+                return 1 if after else -1
+        return 0
+
+    def _follows(self, row, values):
+        return self._compare(row, values) > 0
+
+    def _precedes(self, row, values):
+        return self._compare(row, values) < 0
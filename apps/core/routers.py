@@ -0,0 +1,152 @@
+import contextvars
+import logging
+import threading
+import time
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, DatabaseError, connections
+
+logger = logging.getLogger(__name__)
+
+# Whether the reads of the current request, task or command must go to the
+# primary, for a client that wrote within the sticky window
+_pinned = contextvars.ContextVar("pinned_to_primary", default=False)
+
+# Monotonic time until which the reads go to the primary after a write of
+# the current request, task or command. Threads and commands run outside
+# pin_to_primary() never reset it, so it expires after the sticky window
+_pinned_until = contextvars.ContextVar("pinned_to_primary_until", default=0.0)
+
+# Whether the current request, task or command wrote to the primary
+_wrote = contextvars.ContextVar("wrote_to_primary", default=False)
+
+
+def is_pinned_to_primary():
+    return _pinned.get() or time.monotonic() < _pinned_until.get()
+
+
+@contextmanager
+def pin_to_primary(pinned=True):
+    """Sends the reads of the block to the primary, restoring the previous
+    state on exit. ReplicaStickinessMiddleware wraps each request in it."""
+    pinned_token = _pinned.set(pinned)
+    pinned_until_token = _pinned_until.set(0.0)
+    wrote_token = _wrote.set(False)
+    try:
+        yield
+    finally:
+        _wrote.reset(wrote_token)
+        _pinned_until.reset(pinned_until_token)
+        _pinned.reset(pinned_token)
+
+
+def wrote_to_primary():
+    return _wrote.get()
+
+
+class ReplicaPool:
+    """Round-robin selection among the read replicas that answered their
+    last health check. A replica found down, by a health check or because
+    a read could not connect to it, is skipped until it is checked again,
+    at most every health_check_interval seconds."""
+
+    def __init__(self, aliases, health_check_interval=30, check=None, connect=None):
+        self.aliases = list(aliases)
+        self.health_check_interval = health_check_interval
+        self.check = check or self.check_connection
+        self.connect = connect or self.open_connection
+        self._lock = threading.Lock()
+        self._next = 0
+        self._healthy = {alias: True for alias in self.aliases}
+        self._checked_at = {alias: 0.0 for alias in self.aliases}
+
+    @staticmethod
+    def check_connection(alias):
+        connection = connections[alias]
+        try:
+            connection.ensure_connection()
+            return connection.is_usable()
+        except DatabaseError:
+            return False
+
+    @staticmethod
+    def open_connection(alias):
+        """Opens the connection of the thread to the replica, unless already
+        open. A connection broken by a failed query was closed at the end of
+        the request, so this is where a replica gone down is noticed."""
+        try:
+            connections[alias].ensure_connection()
+            return True
+        except DatabaseError:
+            return False
+
+    def is_healthy(self, alias):
+        now = time.monotonic()
+        with self._lock:
+            due = now - self._checked_at[alias] >= self.health_check_interval
+            if due:
+                self._checked_at[alias] = now
+        if due:
+            healthy = self.check(alias)
+            if healthy != self._healthy[alias]:
+                logger.warning(
+                    "Replica %s is %s.", alias, "back up" if healthy else "down"
+                )
+            self._healthy[alias] = healthy
+        return self._healthy[alias]
+
+    def mark_down(self, alias):
+        """Takes the replica out of rotation until its next health check."""
+        with self._lock:
+            self._healthy[alias] = False
+            self._checked_at[alias] = time.monotonic()
+
+    def choose(self):
+        """Returns the next healthy replica, or None when all are down."""
+        for _ in range(len(self.aliases)):
+            with self._lock:
+                alias = self.aliases[self._next % len(self.aliases)]
+                self._next += 1
+            if not self.is_healthy(alias):
+                continue
+            if self.connect(alias):
+                return alias
+            logger.warning("Replica %s is down.", alias)
+            self.mark_down(alias)
+        return None
+
+
+class PrimaryReplicaRouter:
+    """Sends writes to the default database and reads to the replicas listed
+    in the DATABASE_REPLICAS setting. Reads go to the primary instead inside
+    a transaction on the primary and during the
+    DATABASE_REPLICA_STICKY_SECONDS that follow a write of the current
+    request, task or command, or of the same client, so users always read
+    their own writes."""
+
+    def __init__(self, pool=None):
+        self.pool = pool or ReplicaPool(
+            settings.DATABASE_REPLICAS,
+            settings.DATABASE_REPLICA_HEALTH_CHECK_INTERVAL,
+        )
+
+    def db_for_read(self, model, **hints):
+        if (
+            not self.pool.aliases
+            or is_pinned_to_primary()
+            or connections[DEFAULT_DB_ALIAS].in_atomic_block
+        ):
+            return DEFAULT_DB_ALIAS
+        return self.pool.choose() or DEFAULT_DB_ALIAS
+
+    def db_for_write(self, model, **hints):
+        _pinned_until.set(time.monotonic() + settings.DATABASE_REPLICA_STICKY_SECONDS)
+        _wrote.set(True)
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        databases = {DEFAULT_DB_ALIAS, *self.pool.aliases}
+        if obj1._state.db in databases and obj2._state.db in databases:
+            return True
+        return None
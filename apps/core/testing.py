@@ -0,0 +1,43 @@
+from contextlib import contextmanager
+
+from django.test import override_settings
+from django.test.runner import DiscoverRunner
+from django.urls import resolve
+
+from apps.core.instrumentation import QueryRecorder
+
+
+class QueryBudgetTestRunner(DiscoverRunner):
+    """Test runner making the views that exceed their @query_budget fail,
+    whatever INSTRUMENTATION_ENFORCE_QUERY_BUDGETS is set to."""
+
+    def setup_test_environment(self, **kwargs):
+        super().setup_test_environment(**kwargs)
+        self.enforce_budgets = override_settings(
+            INSTRUMENTATION_ENFORCE_QUERY_BUDGETS=True
+        )
+        self.enforce_budgets.enable()
+
+    def teardown_test_environment(self, **kwargs):
+        self.enforce_budgets.disable()
+        super().teardown_test_environment(**kwargs)
+
+
+class QueryBudgetTestMixin:
+    """TestCase mixin to fail tests that run more queries than expected."""
+
+    @contextmanager
+    def assertQueryBudget(self, budget=None, view=None):
+        """Fails when the block runs more than budget queries, listing the
+        duplicated ones. The budget defaults to the one view, a view or the
+        path of one, declares with @query_budget. Unlike assertNumQueries,
+        using fewer queries than the budget is fine."""
+        if budget is None:
+            if isinstance(view, str):
+                view = resolve(view).func
+            budget = view.query_budget
+        recorder = QueryRecorder()
+        with recorder.record():
+            yield recorder
+        if recorder.count > budget:
+            self.fail(f"Query budget of {budget} exceeded: {recorder.report()}")
@@ -0,0 +1,757 @@
+import asyncio
+import json
+import random
+import threading
+import time
+from datetime import timedelta
+from io import StringIO
+from types import SimpleNamespace
+from unittest import mock
+
+from django.conf import settings
+from django.contrib.sessions.backends.cached_db import SessionStore
+from django.contrib.sessions.models import Session
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import transaction
+from django.http import HttpResponse
+from django.test import RequestFactory, SimpleTestCase, TestCase, override_settings
+from django.urls import resolve, reverse
+from django.utils import timezone
+
+from apps.core import db, routers
+from apps.core.benchmarks import compare, measure, percentile
+from apps.core.instrumentation import (
+    QueryBudgetExceeded,
+    QueryRecorder,
+    collect_metrics,
+    fingerprint,
+    query_budget,
+)
+from apps.core.management.commands import bench
+from apps.core.middleware import ReplicaStickinessMiddleware
+from apps.core.notifications import (
+    InProcessBroker,
+    NotificationsRouter,
+    event_stream,
+)
+from apps.core.pagination import CursorPaginator, InvalidCursor
+from apps.core.routers import (
+    PrimaryReplicaRouter,
+    ReplicaPool,
+    is_pinned_to_primary,
+    pin_to_primary,
+)
+from apps.core.testing import QueryBudgetTestMixin
+from apps.tops import search
+from apps.tops.models import LeaderboardScore, TopList
+from apps.users import availability
+from apps.users.availability import UsernameFilter
+from apps.users.models import CustomUser
+from top_five import warmup
+
+
+class BenchmarksTest(TestCase):
+
+    def test_percentile(self):
+        """Test the nearest-rank percentiles of sorted values."""
+        values = list(range(1, 101))
+        self.assertEqual(percentile(values, 0.5), 50)
+        self.assertEqual(percentile(values, 0.99), 99)
+        self.assertEqual(percentile(values, 1), 100)
+        self.assertEqual(percentile([], 0.5), 0.0)
+
+    def test_measure_counts_queries_per_run(self):
+        """Test that measure reports the runs and their average queries."""
+        calls = []
+        result = measure(
+            lambda iteration: list(CustomUser.objects.all()),
+            iterations=4,
+            setup=calls.append,
+        )
+        self.assertEqual(calls, [0, 1, 2, 3])
+        self.assertEqual(result["iterations"], 4)
+        self.assertEqual(result["queries"], 1)
+        self.assertLessEqual(result["p50_ms"], result["max_ms"])
+
+    def test_compare_reports_slower_paths_and_extra_queries(self):
+        """Test that only medians beyond the threshold and query increases
+        are reported as regressions."""
+        baseline = {
+            "home": {"p50_ms": 10.0, "queries": 2},
+            "login": {"p50_ms": 100.0, "queries": 1},
+        }
+        results = {
+            "home": {"p50_ms": 11.0, "queries": 3},
+            "login": {"p50_ms": 130.0, "queries": 1},
+            "new": {"p50_ms": 1.0, "queries": 1},
+        }
+        self.assertEqual(
+            compare(results, baseline, threshold=0.2),
+            ["home: queries 2 -> 3", "login: p50 100.0ms -> 130.0ms"],
+        )
+
+    @override_settings(USERS_LOGIN_USERNAME_LIMIT=10, USERS_LOGIN_IP_LIMIT=30)
+    def test_bench_logins_are_not_throttled(self):
+        """Test that the benchmark logs the same users in more times than the
+        login limits allow."""
+        command = bench.Command(stdout=StringIO())
+        command.random = random.Random(0)
+        command.seed(users=1, lists=3, votes=5)
+        results = command.run_benchmarks(iterations=11)
+        self.assertEqual(results["authentication"]["iterations"], 11)
+
+
+class InstrumentationTest(QueryBudgetTestMixin, TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.owner = CustomUser.objects.create_user(username="owner", password="x")
+        cls.top_list = TopList.objects.create(owner=cls.owner, name="Best movies")
+
+    def test_fingerprint_collapses_whitespace(self):
+        """Test that the same query formatted differently gets one
+        fingerprint."""
+        self.assertEqual(
+            fingerprint("SELECT *\n  FROM  users\tWHERE id = %s "),
+            "SELECT * FROM users WHERE id = %s",
+        )
+
+    def test_recorder_reports_duplicated_queries(self):
+        """Test that a query run in a loop is reported as a duplicate."""
+        recorder = QueryRecorder()
+        with recorder.record():
+            for pk in (1, 2, 3):
+                CustomUser.objects.filter(pk=pk).exists()
+            list(TopList.objects.all())
+        self.assertEqual(recorder.count, 4)
+        self.assertEqual(len(recorder.duplicates()), 1)
+        self.assertEqual(recorder.duplicates()[0][1], 3)
+        self.assertIn("3x SELECT", recorder.report())
+
+    @override_settings(
+        INSTRUMENTATION_SAMPLE_RATE=1.0, INSTRUMENTATION_SERVER_TIMING=True
+    )
+    def test_middleware_logs_and_sets_server_timing(self):
+        """Test that a sampled request is logged as JSON and gets a
+        Server-Timing header."""
+        url = reverse("tops:detail", args=[self.top_list.pk])
+        with self.assertLogs("apps.core.instrumentation", "INFO") as logs:
+            response = self.client.get(url)
+
+        self.assertRegex(response["Server-Timing"], r'^db;dur=[\d.]+;desc="1 queries"')
+        record = json.loads(logs.records[0].getMessage())
+        self.assertEqual(record["path"], url)
+        self.assertEqual(record["status"], 200)
+        self.assertEqual(record["queries"], 1)
+        self.assertEqual(record["duplicates"], [])
+
+    @override_settings(INSTRUMENTATION_SAMPLE_RATE=0.0)
+    def test_middleware_skips_unsampled_requests(self):
+        """Test that requests outside the sample are neither logged nor
+        timed."""
+        with self.assertNoLogs("apps.core.instrumentation", "INFO"):
+            response = self.client.get(reverse("tops:detail", args=[self.top_list.pk]))
+        self.assertNotIn("Server-Timing", response)
+
+    def test_query_budget_enforced(self):
+        """Test that a view over its budget fails when budgets are enforced
+        and only logs a warning otherwise."""
+
+        @query_budget(1)
+        def view(request):
+            for pk in (1, 2):
+                CustomUser.objects.filter(pk=pk).exists()
+            return HttpResponse()
+
+        request = RequestFactory().get("/")
+        self.assertEqual(view.query_budget, 1)
+        with override_settings(INSTRUMENTATION_ENFORCE_QUERY_BUDGETS=True):
+            with self.assertRaisesMessage(QueryBudgetExceeded, "budget of 1"):
+                view(request)
+        with override_settings(INSTRUMENTATION_ENFORCE_QUERY_BUDGETS=False):
+            with self.assertLogs("apps.core.instrumentation", "WARNING"):
+                self.assertEqual(view(request).status_code, 200)
+
+    def test_assert_query_budget(self):
+        """Test that the mixin allows fewer queries than the budget and
+        fails beyond it."""
+        with self.assertQueryBudget(2):
+            CustomUser.objects.exists()
+        with self.assertRaisesMessage(self.failureException, "budget of 1"):
+            with self.assertQueryBudget(1):
+                CustomUser.objects.exists()
+                TopList.objects.exists()
+
+    def test_assert_query_budget_defaults_to_the_view(self):
+        """Test that the mixin applies the budget declared by a view, given
+        itself or by path."""
+        url = reverse("tops:detail", args=[self.top_list.pk])
+        with self.assertQueryBudget(view=url):
+            self.client.get(url)
+        with self.assertRaisesMessage(self.failureException, "budget of 1"):
+            with self.assertQueryBudget(view=resolve(url).func):
+                self.client.get(url)
+                self.client.get(url)
+
+    def test_test_runner_enforces_query_budgets(self):
+        """Test that the test runner makes the views exceeding their budget
+        fail."""
+        self.assertTrue(settings.INSTRUMENTATION_ENFORCE_QUERY_BUDGETS)
+
+
+class PrimaryReplicaRouterTest(TestCase):
+
+    def setUp(self):
+        self.down = set()
+        self.checks = []
+
+        def check(alias):
+            self.checks.append(alias)
+            return alias not in self.down
+
+        self.unreachable = set()
+        self.pool = ReplicaPool(
+            ["replica_0", "replica_1"],
+            30,
+            check=check,
+            connect=lambda alias: alias not in self.unreachable,
+        )
+        self.router = PrimaryReplicaRouter(self.pool)
+
+    def read(self):
+        # TestCase wraps each test in a transaction, which pins the reads
+        # to the primary, so the routing is checked from a clean context
+        with pin_to_primary(False):
+            connection = transaction.get_connection()
+            in_atomic_block = connection.in_atomic_block
+            connection.in_atomic_block = False
+            try:
+                return self.router.db_for_read(CustomUser)
+            finally:
+                connection.in_atomic_block = in_atomic_block
+
+    def test_reads_round_robin_across_replicas(self):
+        """Test that reads alternate between the replicas and writes go to
+        the primary."""
+        self.assertEqual(
+            [self.read() for _ in range(4)],
+            ["replica_0", "replica_1", "replica_0", "replica_1"],
+        )
+        with pin_to_primary(False):
+            self.assertEqual(self.router.db_for_write(CustomUser), "default")
+
+    def test_unhealthy_replicas_are_skipped(self):
+        """Test that a replica failing its health check or a connection is
+        skipped until it is checked again, and that reads fall back to the
+        primary when every replica is down."""
+        self.down.add("replica_0")
+        with self.assertLogs("apps.core.routers", "WARNING"):
+            self.assertEqual({self.read() for _ in range(4)}, {"replica_1"})
+        self.assertEqual(self.checks, ["replica_0", "replica_1"])
+
+        # A read failing to connect takes the replica out of rotation at
+        # once, without waiting for its next health check
+        self.unreachable.add("replica_1")
+        with self.assertLogs("apps.core.routers", "WARNING"):
+            self.assertEqual(self.read(), "default")
+        self.unreachable.clear()
+        self.assertEqual(self.read(), "default")
+        self.assertEqual(self.checks, ["replica_0", "replica_1"])
+
+        self.pool.health_check_interval = 0
+        self.down.clear()
+        with self.assertLogs("apps.core.routers", "WARNING"):
+            self.assertIn(self.read(), self.pool.aliases)
+
+    def test_reads_after_a_write_stick_to_the_primary(self):
+        """Test that the reads following a write in the same context go to
+        the primary, until the context ends."""
+        with pin_to_primary(False):
+            self.router.db_for_write(CustomUser)
+            self.assertTrue(is_pinned_to_primary())
+            self.assertEqual(self.router.db_for_read(CustomUser), "default")
+        self.assertEqual(self.read(), "replica_0")
+
+    @override_settings(DATABASE_REPLICA_STICKY_SECONDS=5)
+    def test_writes_outside_a_request_pin_for_the_sticky_window(self):
+        """Test that a thread or command writing outside pin_to_primary() is
+        pinned to the primary for the sticky window only."""
+        reads = []
+
+        def task():
+            with mock.patch.object(routers.time, "monotonic", return_value=100):
+                self.router.db_for_write(CustomUser)
+                reads.append(self.router.db_for_read(CustomUser))
+            with mock.patch.object(routers.time, "monotonic", return_value=106):
+                reads.append(self.router.db_for_read(CustomUser))
+
+        # A new thread starts out of any transaction and pin_to_primary()
+        thread = threading.Thread(target=task)
+        thread.start()
+        thread.join()
+        self.assertEqual(reads, ["default", "replica_0"])
+
+    def test_reads_in_a_transaction_go_to_the_primary(self):
+        """Test that reads inside a transaction on the primary do not go to
+        a replica."""
+        with pin_to_primary(False):
+            self.assertEqual(self.router.db_for_read(CustomUser), "default")
+
+    def test_check_connection(self):
+        """Test the health check and the connection of the read path against
+        a working database."""
+        self.assertTrue(ReplicaPool.check_connection("default"))
+        self.assertTrue(ReplicaPool.open_connection("default"))
+
+
+@override_settings(DATABASE_REPLICAS=["replica_0"], DATABASE_REPLICA_STICKY_SECONDS=5)
+class ReplicaStickinessMiddlewareTest(SimpleTestCase):
+
+    def get(self, view, cookies=None):
+        request = RequestFactory().get("/")
+        request.COOKIES.update(cookies or {})
+        return ReplicaStickinessMiddleware(view)(request)
+
+    def test_write_sets_the_sticky_cookie(self):
+        """Test that a request that wrote pins the client to the primary for
+        the sticky window."""
+
+        def view(request):
+            PrimaryReplicaRouter(ReplicaPool([])).db_for_write(CustomUser)
+            return HttpResponse()
+
+        with pin_to_primary(False):
+            response = self.get(view)
+            self.assertFalse(is_pinned_to_primary())
+        cookie = response.cookies[ReplicaStickinessMiddleware.cookie_name]
+        self.assertEqual(cookie["max-age"], 5)
+
+    def test_sticky_cookie_pins_reads(self):
+        """Test that the requests of a pinned client read from the primary
+        and that read only requests set no cookie."""
+        pinned = []
+
+        def view(request):
+            pinned.append(is_pinned_to_primary())
+            return HttpResponse()
+
+        response = self.get(view, {ReplicaStickinessMiddleware.cookie_name: "1"})
+        self.get(view)
+        self.assertEqual(pinned, [True, False])
+        self.assertNotIn(ReplicaStickinessMiddleware.cookie_name, response.cookies)
+
+
+class ConnectionStatsTest(TestCase):
+
+    def setUp(self):
+        db.connection_stats.reset()
+        self.addCleanup(db.connection_stats.reset)
+
+    def fake_connection(self, max_age=60):
+        return SimpleNamespace(
+            settings_dict={"CONN_MAX_AGE": max_age},
+            close_at=None if max_age is None else time.monotonic() + max_age,
+            connection=object(),
+        )
+
+    @override_settings(DATABASE_CONN_MAX_AGE_JITTER=10)
+    def test_opened_connections_expire_with_jitter(self):
+        """Test that new connections are counted and expire up to the
+        jitter before their maximum age."""
+        connection = self.fake_connection()
+        close_at = connection.close_at
+        db.connection_opened(sender=None, connection=connection)
+        self.assertLessEqual(connection.close_at, close_at)
+        self.assertGreaterEqual(connection.close_at, close_at - 10)
+
+        unlimited = self.fake_connection(max_age=None)
+        db.connection_opened(sender=None, connection=unlimited)
+        self.assertIsNone(unlimited.close_at)
+        self.assertEqual(db.connection_stats.opened, 2)
+
+    def test_closed_and_replaced_connections_are_discarded(self):
+        """Test that a connection closed at a request boundary or replaced
+        after a failed health check counts as discarded once."""
+        connection = self.fake_connection()
+        db.connection_opened(sender=None, connection=connection)
+        db.connection_opened(sender=None, connection=connection)
+        self.assertEqual(db.connection_stats.discarded, 1)
+
+        connection.connection = None
+        db._track_closed(connection)
+        db._track_closed(connection)
+        self.assertEqual(
+            db.connection_stats.as_dict(),
+            {"opened": 2, "reused": 0, "discarded": 2, "reuse_ratio": 0.0},
+        )
+
+    def test_open_connections_are_reused_by_the_next_request(self):
+        """Test that the connections still open when a request starts are
+        counted as reused."""
+        CustomUser.objects.exists()
+        db.request_started()
+        self.assertEqual(db.connection_stats.reused, 1)
+
+
+class MetricsViewTest(TestCase):
+
+    def test_staff_only(self):
+        """Test that the metrics are hidden from non staff users."""
+        self.client.force_login(
+            CustomUser.objects.create_user(username="user", password="x")
+        )
+        response = self.client.get(reverse("core:metrics"))
+        self.assertEqual(response.status_code, 302)
+
+    def test_metrics_of_the_worker(self):
+        """Test that staff users get the counters of every provider."""
+        self.client.force_login(
+            CustomUser.objects.create_user(
+                username="staff", password="x", is_staff=True
+            )
+        )
+        response = self.client.get(reverse("core:metrics"))
+        metrics = response.json()
+        self.assertEqual(set(metrics), set(collect_metrics()))
+        for name in ("pid", "database_connections", "user_cache", "home_cache"):
+            self.assertIn(name, metrics)
+
+
+class WarmUpTest(TestCase):
+
+    def setUp(self):
+        # Neither close the connections of the test nor freeze its objects
+        for name in ("connections", "gc"):
+            patcher = mock.patch.object(warmup, name)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        # Nor build the indexes of the process from the test database
+        self.username_filter = UsernameFilter()
+        patcher = mock.patch.object(
+            availability, "_username_filter", self.username_filter
+        )
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        patcher = mock.patch.object(search, "_search_index", None)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_steps_are_timed(self):
+        """Test that the warm-up records the duration of each step and of
+        the application loading."""
+        with self.assertLogs("top_five.warmup", "INFO"):
+            timings = warmup.warm_up(loading_seconds=0.5)
+        self.assertEqual(timings["loading_ms"], 500.0)
+        for name, _step in warmup.STEPS:
+            self.assertIn(f"{name}_ms", timings)
+        self.assertEqual(collect_metrics()["startup"], timings)
+        warmup.connections.close_all.assert_called_once_with()
+        warmup.gc.freeze.assert_called_once_with()
+
+    def test_steps_warm_the_caches(self):
+        """Test that the steps find the URLs and templates of the apps."""
+        self.assertGreater(warmup.resolve_urls(), 10)
+        self.assertGreater(warmup.compile_templates(), 1)
+        self.assertGreater(warmup.prime_password_hasher(), 0)
+        CustomUser.objects.create_user(username="warm", password="x")
+        self.assertEqual(warmup.build_username_filter(), 1)
+        self.assertIn("warm", self.username_filter.get_filter())
+        self.assertEqual(warmup.build_search_index(), 0)
+        self.assertIsNotNone(search.get_built_search_index())
+
+    def test_failing_step(self):
+        """Test that a failing step is logged without stopping the
+        others."""
+        steps = [("broken", mock.Mock(side_effect=RuntimeError)), *warmup.STEPS]
+        with mock.patch.object(warmup, "STEPS", steps), self.assertLogs(
+            "top_five.warmup", "ERROR"
+        ):
+            timings = warmup.warm_up()
+        self.assertNotIn("broken_ms", timings)
+        self.assertIn("urls_ms", timings)
+
+    def test_command(self):
+        """Test that the warm_up command prints the timings."""
+        out = StringIO()
+        with self.assertLogs("top_five.warmup", "INFO"):
+            call_command("warm_up", "--json", stdout=out)
+        self.assertIn("warm_up_ms", json.loads(out.getvalue()))
+
+
+class NotificationsTest(TestCase):
+
+    async def test_fan_out_with_bounded_queues(self):
+        """Test that an event reaches every connection of the channel and
+        that a lagging connection keeps the latest events only."""
+        broker = InProcessBroker(queue_size=2)
+        first, second = broker.subscribe("user:1"), broker.subscribe("user:1")
+        other = broker.subscribe("user:2")
+        for number in range(3):
+            broker.publish("user:1", "like", {"number": number})
+
+        for subscription in (first, second):
+            events = [await subscription.get() for _ in range(2)]
+            self.assertEqual([event.id for event in events], [2, 3])
+            self.assertEqual(subscription.dropped, 1)
+        self.assertTrue(other.queue.empty())
+        self.assertEqual(broker.report()["delivered"], 6)
+        self.assertEqual(broker.report()["dropped"], 2)
+
+        broker.unsubscribe(first)
+        broker.unsubscribe(first)
+        self.assertEqual(broker.report()["connections"], 2)
+
+    async def test_publish_from_another_thread(self):
+        """Test that events published by a sync thread are handed over to
+        the event loop of the connections."""
+        broker = InProcessBroker()
+        subscription = broker.subscribe("user:1")
+        thread = threading.Thread(
+            target=broker.publish, args=("user:1", "like", {"top_list": 1})
+        )
+        thread.start()
+        thread.join()
+        event = await asyncio.wait_for(subscription.get(), 1)
+        self.assertEqual(event.message, 'id: 1\nevent: like\ndata: {"top_list":1}\n\n')
+
+    async def test_heartbeat_and_idle_reaping(self):
+        """Test that the stream sends heartbeats while waiting and is closed,
+        unsubscribing it, after idle_timeout seconds without events."""
+        broker = InProcessBroker()
+        stream = event_stream(
+            broker, "user:1", heartbeat_interval=0.01, idle_timeout=0.05
+        )
+        self.assertEqual(await anext(stream), "retry: 10\n\n")
+        broker.publish("user:1", "like", {})
+        self.assertIn("event: like", await anext(stream))
+        messages = [message async for message in stream]
+        self.assertGreaterEqual(len(messages), 3)
+        self.assertEqual(set(messages), {": heartbeat\n\n"})
+        self.assertEqual(broker.report()["reaped"], 1)
+        self.assertEqual(broker.report()["connections"], 0)
+
+    def test_only_served_over_asgi(self):
+        """Test that WSGI requests are refused."""
+        response = self.client.get(reverse("core:notifications"))
+        self.assertEqual(response.status_code, 501)
+
+    async def connect(self, count, cookie=None, method="GET"):
+        """Opens count connections to the notifications path through the
+        ASGI application of asgi.py and returns them with their tasks."""
+        app = NotificationsRouter(mock.AsyncMock())
+        headers = []
+        if cookie is not None:
+            headers.append(
+                (b"cookie", f"{settings.SESSION_COOKIE_NAME}={cookie}".encode())
+            )
+        scope = {
+            "type": "http",
+            "method": method,
+            "path": reverse("core:notifications"),
+            "headers": headers,
+        }
+        connections = [ASGIConnection() for _ in range(count)]
+        tasks = [
+            asyncio.create_task(app(scope, connection.receive, connection.send))
+            for connection in connections
+        ]
+        return connections, tasks
+
+    async def login(self):
+        user = await CustomUser.objects.acreate(username="myusername")
+        await self.async_client.aforce_login(user)
+        return user, self.async_client.cookies[settings.SESSION_COOKIE_NAME].value
+
+    async def test_stream_of_the_user(self):
+        """Test that users logged in through the session cookie get their
+        events as a stream, others a 401 response."""
+        for cookie, method, status in [(None, "GET", 401), ("x", "POST", 405)]:
+            (connection,), (task,) = await self.connect(1, cookie, method)
+            await task
+            self.assertEqual(connection.status, status)
+
+        user, cookie = await self.login()
+        broker = InProcessBroker()
+        with mock.patch("apps.core.notifications.get_broker", return_value=broker):
+            (connection,), (task,) = await self.connect(1, cookie)
+            async with asyncio.timeout(5):
+                while not broker.report().get("connections"):
+                    await asyncio.sleep(0.01)
+                broker.publish(f"user:{user.pk}", "like", {"top_list": 1})
+                while b"event: like" not in connection.body:
+                    await asyncio.sleep(0.01)
+            self.assertEqual(connection.status, 200)
+            self.assertEqual(connection.headers[b"content-type"], b"text/event-stream")
+
+            connection.disconnected.set()
+            await task
+        self.assertEqual(broker.report()["connections"], 0)
+
+    async def test_connections_hold_no_thread(self):
+        """Test that the number of threads of the process stays the same
+        however many streams are open."""
+        user, cookie = await self.login()
+        broker = InProcessBroker()
+        threads = threading.active_count()
+        with mock.patch("apps.core.notifications.get_broker", return_value=broker):
+            connections, tasks = await self.connect(200, cookie)
+            async with asyncio.timeout(10):
+                while broker.report().get("connections") < 200:
+                    await asyncio.sleep(0.01)
+                self.assertEqual(threading.active_count(), threads)
+
+                broker.publish(f"user:{user.pk}", "like", {"top_list": 1})
+                while any(b"event: like" not in c.body for c in connections):
+                    await asyncio.sleep(0.01)
+            for connection in connections:
+                connection.disconnected.set()
+            await asyncio.gather(*tasks)
+        self.assertEqual(broker.report()["connections"], 0)
+        self.assertEqual(threading.active_count(), threads)
+
+
+class ASGIConnection:
+    """Client side of an in-memory ASGI connection."""
+
+    def __init__(self):
+        self.status = None
+        self.headers = {}
+        self.body = b""
+        self.disconnected = asyncio.Event()
+        self._requested = False
+
+    async def receive(self):
+        if not self._requested:
+            self._requested = True
+            return {"type": "http.request", "body": b"", "more_body": False}
+        await self.disconnected.wait()
+        return {"type": "http.disconnect"}
+
+    async def send(self, message):
+        if message["type"] == "http.response.start":
+            self.status = message["status"]
+            self.headers = dict(message["headers"])
+        else:
+            self.body += message.get("body", b"")
+
+
+class SweepSessionsTest(TestCase):
+
+    def test_expired_sessions_are_deleted_in_batches(self):
+        """Test that only expired sessions are deleted, in batches and up to
+        the limit."""
+        session = SessionStore()
+        session["user"] = 1
+        session.create()
+        expired = timezone.now() - timedelta(minutes=1)
+        Session.objects.bulk_create(
+            Session(
+                session_key=f"expired{number}", session_data="", expire_date=expired
+            )
+            for number in range(7)
+        )
+        out = StringIO()
+        with self.assertNumQueries(4):
+            call_command("sweep_sessions", batch_size=3, pause=0, limit=4, stdout=out)
+        self.assertIn("Deleted 4 expired sessions.", out.getvalue())
+        call_command("sweep_sessions", batch_size=2, pause=0, stdout=StringIO())
+        self.assertEqual(
+            list(Session.objects.values_list("pk", flat=True)), [session.session_key]
+        )
+
+
+class CursorPaginatorTest(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        owner = CustomUser.objects.create_user(username="owner", password="x")
+        top_lists = [
+            TopList.objects.create(owner=owner, name=f"List {number}")
+            for number in range(7)
+        ]
+        # Ties on the score are broken by the list id
+        LeaderboardScore.objects.bulk_create(
+            LeaderboardScore(window="day", top_list=top_list, score=score)
+            for top_list, score in zip(top_lists, [5, 3, 3, 9, 3, 1, 5])
+        )
+        cls.expected = [
+            (row["top_list_id"], row["score"])
+            for row in LeaderboardScore.objects.order_by(
+                "-score", "top_list_id"
+            ).values("top_list_id", "score")
+        ]
+
+    def setUp(self):
+        self.paginator = CursorPaginator(("-score", "top_list_id"), page_size=3)
+        self.scores = LeaderboardScore.objects.values("top_list_id", "score")
+
+    def rows(self, page):
+        return [(row["top_list_id"], row["score"]) for row in page]
+
+    def test_pages_forward_and_backward(self):
+        """Test that following the next cursors lists every row once in
+        order, and the previous cursors walk back to the first page."""
+        pages = [self.paginator.page(self.scores)]
+        self.assertFalse(pages[0].has_previous)
+        while pages[-1].has_next:
+            pages.append(self.paginator.page(self.scores, pages[-1].next_cursor))
+        self.assertEqual(
+            [row for page in pages for row in self.rows(page)], self.expected
+        )
+        self.assertEqual([len(page) for page in pages], [3, 3, 1])
+
+        page = self.paginator.page(self.scores, pages[-1].previous_cursor)
+        self.assertEqual(self.rows(page), self.expected[3:6])
+        page = self.paginator.page(self.scores, page.previous_cursor)
+        self.assertEqual(self.rows(page), self.expected[:3])
+        self.assertFalse(page.has_previous)
+        self.assertTrue(page.has_next)
+
+    def test_pages_of_a_list_match_the_queryset(self):
+        """Test that a ranking held in memory pages like the queryset."""
+        rows = list(self.scores.order_by("-score", "top_list_id"))
+        cursor = None
+        while True:
+            page = self.paginator.page_of_list(rows, cursor)
+            self.assertEqual(
+                self.rows(page), self.rows(self.paginator.page(self.scores, cursor))
+            )
+            if not page.has_next:
+                break
+            cursor = page.next_cursor
+        back = self.paginator.page_of_list(rows, page.previous_cursor)
+        self.assertEqual(self.rows(back), self.expected[3:6])
+
+    def test_deep_pages_do_not_use_offset(self):
+        """Test that a page after a cursor is fetched with a WHERE on the
+        ordering values instead of an OFFSET."""
+        cursor = self.paginator.page(self.scores).next_cursor
+        with self.assertNumQueries(1) as queries:
+            self.paginator.page(self.scores, cursor)
+        self.assertNotIn("OFFSET", queries.captured_queries[0]["sql"])
+
+    def test_invalid_cursors_are_rejected(self):
+        """Test that forged cursors and cursors of other listings fail."""
+        cursor = self.paginator.page(self.scores).next_cursor
+        other = CursorPaginator(("-score", "top_list_id"), salt="other")
+        for invalid in (cursor[:-1] + "x", "garbage"):
+            with self.assertRaises(InvalidCursor):
+                self.paginator.page(self.scores, invalid)
+        with self.assertRaises(InvalidCursor):
+            other.page(self.scores, cursor)
+
+    def test_datetimes_keep_their_microseconds(self):
+        """Test that rows created within the same millisecond are not
+        skipped when the cursor falls between them."""
+        created_at = timezone.now().replace(microsecond=123000)
+        TopList.objects.update(created_at=created_at)
+        TopList.objects.filter(pk__in=[row[0] for row in self.expected[:2]]).update(
+            created_at=created_at.replace(microsecond=123456)
+        )
+        paginator = CursorPaginator(("-created_at", "-id"), page_size=1)
+        top_lists = TopList.objects.values("id", "created_at")
+        pages = [paginator.page(top_lists)]
+        while pages[-1].has_next:
+            pages.append(paginator.page(top_lists, pages[-1].next_cursor))
+        self.assertEqual(len(pages), TopList.objects.count())
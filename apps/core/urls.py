@@ -0,0 +1,10 @@
+from django.urls import path
+
+from apps.core import views
+
+app_name = "core"
+
+urlpatterns = [
+    path("metrics/", views.metrics, name="metrics"),
+    path("notifications/", views.notifications, name="notifications"),
+]
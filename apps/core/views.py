@@ -0,0 +1,20 @@
+from django.contrib.admin.views.decorators import staff_member_required
+from django.http import HttpResponse, JsonResponse
+from django.views.decorators.http import require_GET
+
+from apps.core.instrumentation import collect_metrics
+
+
+@staff_member_required
+@require_GET
+def metrics(request):
+    """Returns the counters of the worker that serves the request."""
+    return JsonResponse(collect_metrics())
+
+
+@require_GET
+def notifications(request):
+    """Placeholder of the notifications stream, which the ASGI application
+    serves with apps.core.notifications.serve_notifications() before the
+    requests reach Django, so only WSGI requests get here."""
+    return HttpResponse("Notifications are only served over ASGI.", status=501)
@@ -0,0 +1,15 @@
+from django.apps import AppConfig
+from django.utils.translation import gettext_lazy as _
+
+
+class TopsConfig(AppConfig):
+    default_auto_field = "django.db.models.BigAutoField"
+    name = "apps.tops"
+    verbose_name = _("Tops")
+
+    def ready(self):
+        from apps.core.instrumentation import register_metrics
+        from apps.tops import signals  # noqa: F401
+        from apps.tops.views import home_cache
+
+        register_metrics("home_cache", home_cache.stats.as_dict)
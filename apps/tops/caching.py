@@ -0,0 +1,144 @@
+import hashlib
+import logging
+import threading
+import time
+
+from django.core.cache import caches
+from django.db import connection
+
+logger = logging.getLogger(__name__)
+
+
+class CacheStats:
+    """Per-process counters of a StaleWhileRevalidateCache."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.hits = 0
+            self.stale_hits = 0
+            self.misses = 0
+            self.recomputes = 0
+            self.recompute_seconds = 0.0
+
+    def increment(self, name):
+        with self._lock:
+            setattr(self, name, getattr(self, name) + 1)
+
+    def add_recompute(self, duration):
+        with self._lock:
+            self.recomputes += 1
+            self.recompute_seconds += duration
+
+    def as_dict(self):
+        with self._lock:
+            lookups = self.hits + self.stale_hits + self.misses
+            return {
+                "hits": self.hits,
+                "stale_hits": self.stale_hits,
+                "misses": self.misses,
+                "hit_ratio": (
+                    (self.hits + self.stale_hits) / lookups if lookups else 0.0
+                ),
+                "recomputes": self.recomputes,
+                "avg_recompute_ms": (
+                    self.recompute_seconds * 1000 / self.recomputes
+                    if self.recomputes
+                    else 0.0
+                ),
+            }
+
+
+class StaleWhileRevalidateCache:
+    """Cache of computed values that keeps serving an expired value for up
+    to stale_ttl seconds while it is recomputed in the background.
+
+    A lock taken with cache.add() makes the recomputation single-flight
+    across threads and, with a shared backend, across workers: only the
+    holder recomputes an expired or missing entry. Others serve the stale
+    copy or, when there is none, wait up to lock_timeout for the holder
+    before computing it themselves. Works with any cache backend, including
+    the local-memory one."""
+
+    def __init__(self, alias, prefix, ttl, stale_ttl, lock_timeout=10):
+        self.alias = alias
+        self.prefix = prefix
+        self.ttl = ttl
+        self.stale_ttl = stale_ttl
+        self.lock_timeout = lock_timeout
+        self.stats = CacheStats()
+
+    @property
+    def cache(self):
+        return caches[self.alias]
+
+    def make_key(self, *parts):
+        digest = hashlib.md5(repr(parts).encode(), usedforsecurity=False)
+        return f"{self.prefix}:{digest.hexdigest()}"
+
+    def get_or_compute(self, key, compute):
+        entry = self.cache.get(key)
+        if entry is not None:
+            value, expires_at = entry
+            if expires_at > time.time():
+                self.stats.increment("hits")
+            else:
+                self.stats.increment("stale_hits")
+                if self._acquire(key):
+                    self._spawn(lambda: self._refresh(key, compute, background=True))
+            return value
+
+        self.stats.increment("misses")
+        if not self._acquire(key):
+            value = self._wait_for(key)
+            if value is not None:
+                return value
+            # The lock holder did not finish in time, compute without it
+            return self._store(key, compute)
+        return self._refresh(key, compute)
+
+    def _refresh(self, key, compute, background=False):
+        try:
+            return self._store(key, compute)
+        except Exception:
+            if not background:
+                raise
+            logger.exception("Failed to refresh the cache entry %s.", key)
+        finally:
+            self.cache.delete(self._lock_key(key))
+
+    def _store(self, key, compute):
+        started = time.perf_counter()
+        value = compute()
+        self.stats.add_recompute(time.perf_counter() - started)
+        self.cache.set(key, (value, time.time() + self.ttl), self.ttl + self.stale_ttl)
+        return value
+
+    def _acquire(self, key):
+        return self.cache.add(self._lock_key(key), True, self.lock_timeout)
+
+    def _wait_for(self, key):
+        deadline = time.monotonic() + self.lock_timeout
+        while time.monotonic() < deadline:
+            time.sleep(0.05)
+            entry = self.cache.get(key)
+            if entry is not None:
+                return entry[0]
+        return None
+
+    def _lock_key(self, key):
+        return f"{key}:lock"
+
+    def _spawn(self, function):
+        def run():
+            try:
+                function()
+            finally:
+                # The thread ends here, a connection kept for CONN_MAX_AGE
+                # would never be reused
+                connection.close()
+
+        threading.Thread(target=run, daemon=True).start()
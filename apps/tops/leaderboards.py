@@ -0,0 +1,141 @@
+from collections import Counter
+from datetime import timedelta
+
+from django.db import IntegrityError, transaction
+from django.db.models import F, Sum
+from django.utils import timezone
+from django.utils.translation import gettext_lazy as _
+
+from apps.tops.models import DailyVoteCount, LeaderboardScore, TrendingScore, Vote
+
+# Ranking by the time decayed scores of apps.tops.trending
+TRENDING = "trending"
+
+RANKINGS = [(TRENDING, _("Trending")), *LeaderboardScore.WINDOW_CHOICES]
+
+WINDOW_DAYS = {
+    LeaderboardScore.DAY: 1,
+    LeaderboardScore.WEEK: 7,
+    LeaderboardScore.MONTH: 30,
+}
+
+# Daily buckets older than the widest window are dropped by compaction
+RETENTION_DAYS = max(WINDOW_DAYS.values())
+
+
+def _increment(model, delta, **lookup):
+    """Adds delta to the score of the row matching lookup, creating it when
+    missing, with a single UPDATE in the common case."""
+    if not delta:
+        return
+
+    if model.objects.filter(**lookup).update(score=F("score") + delta):
+        return
+
+    try:
+        with transaction.atomic():
+            model.objects.create(score=delta, **lookup)
+    except IntegrityError:
+        # Another writer created the row in the meantime
+        model.objects.filter(**lookup).update(score=F("score") + delta)
+
+
+def windows_containing(day, today):
+    """Returns the windows that currently include the given day."""
+    age = (today - day).days
+    return [window for window, days in WINDOW_DAYS.items() if 0 <= age < days]
+
+
+def record_votes(deltas, today=None):
+    """Applies net vote deltas, keyed by (top_list_id, day) where day is the
+    day the vote was first cast, to the daily buckets and to the scores of
+    the windows that include that day."""
+    today = today or timezone.localdate()
+    window_deltas = Counter()
+    for (top_list_id, day), delta in deltas.items():
+        _increment(DailyVoteCount, delta, top_list_id=top_list_id, day=day)
+        for window in windows_containing(day, today):
+            window_deltas[window, top_list_id] += delta
+
+    for (window, top_list_id), delta in window_deltas.items():
+        _increment(LeaderboardScore, delta, window=window, top_list_id=top_list_id)
+
+
+def record_vote(top_list_id, delta, voted_at, today=None):
+    record_votes({(top_list_id, timezone.localdate(voted_at)): delta}, today)
+
+
+def ranking(window):
+    """Returns the queryset of the scores of the lists in the window, or in
+    the trending ranking, leaving out the lists without votes."""
+    if window == TRENDING:
+        return TrendingScore.objects.exclude(score=0)
+    return LeaderboardScore.objects.filter(window=window).exclude(score=0)
+
+
+def get_top_lists(window, limit=10):
+    """Returns the (top_list_id, score) pairs of the most popular lists of
+    the window, read from the precomputed ranking."""
+    return list(
+        ranking(window)
+        .order_by("-score", "top_list_id")
+        .values_list("top_list_id", "score")[:limit]
+    )
+
+
+@transaction.atomic
+def compact_leaderboards(today=None):
+    """Drops the daily buckets that fell out of every window and recomputes
+    the window scores from the remaining buckets. Meant to run on a
+    schedule, at least once a day right after midnight, so the windows roll
+    forward."""
+    today = today or timezone.localdate()
+    DailyVoteCount.objects.filter(
+        day__lte=today - timedelta(days=RETENTION_DAYS)
+    ).delete()
+    DailyVoteCount.objects.filter(score=0).delete()
+
+    LeaderboardScore.objects.all().delete()
+    for window, days in WINDOW_DAYS.items():
+        totals = (
+            DailyVoteCount.objects.filter(
+                day__gt=today - timedelta(days=days), day__lte=today
+            )
+            .values("top_list")
+            .annotate(total=Sum("score"))
+            .exclude(total=0)
+        )
+        LeaderboardScore.objects.bulk_create(
+            [
+                LeaderboardScore(
+                    window=window, top_list_id=row["top_list"], score=row["total"]
+                )
+                for row in totals.iterator()
+            ],
+            batch_size=1000,
+        )
+
+
+@transaction.atomic
+def rebuild_leaderboards(today=None):
+    """Rebuilds the daily buckets and the window scores from the raw votes."""
+    today = today or timezone.localdate()
+    DailyVoteCount.objects.all().delete()
+    buckets = (
+        Vote.objects.filter(created_at__date__gt=today - timedelta(days=RETENTION_DAYS))
+        .values("top_list", "created_at__date")
+        .annotate(total=Sum("value"))
+        .exclude(total=0)
+    )
+    DailyVoteCount.objects.bulk_create(
+        [
+            DailyVoteCount(
+                top_list_id=row["top_list"],
+                day=row["created_at__date"],
+                score=row["total"],
+            )
+            for row in buckets.iterator()
+        ],
+        batch_size=1000,
+    )
+    compact_leaderboards(today)
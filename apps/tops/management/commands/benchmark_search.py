@@ -0,0 +1,131 @@
+import random
+import statistics
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from apps.tops.models import Tag, TopList
+from apps.tops.search import SearchIndex
+from apps.users.models import CustomUser
+
+WORDS = (
+    "best worst movies books songs albums games cities beaches dishes "
+    "pizza burgers coffee series anime heroes villains cars bikes trails "
+    "museums parks players teams goals moments quotes scenes endings "
+    "openings covers drummers guitarists singers directors actors novels "
+    "comics poems podcasts apps gadgets laptops phones cameras lenses "
+    "recipes desserts cocktails wines beers breakfasts sandwiches soups"
+).split()
+
+
+class Command(BaseCommand):
+    help = (
+        "Compares the search index with the ORM icontains lookups on "
+        "synthetic top lists. The data is seeded inside a transaction that "
+        "is rolled back at the end."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--sizes",
+            nargs="+",
+            type=int,
+            default=[10_000, 100_000, 1_000_000],
+            help="Number of lists to benchmark with.",
+        )
+        parser.add_argument(
+            "--queries", type=int, default=50, help="Queries per filter."
+        )
+        parser.add_argument("--seed", type=int, default=0)
+
+    def handle(self, *args, **options):
+        self.random = random.Random(options["seed"])
+        with transaction.atomic():
+            owner = CustomUser(username="benchmarksearch")
+            owner.set_unusable_password()
+            owner.save()
+            self.tags = Tag.objects.bulk_create(
+                [Tag(name=f"benchmarktag{number}") for number in range(50)]
+            )
+            seeded = 0
+            for size in sorted(options["sizes"]):
+                self.seed(owner, seeded, size)
+                seeded = size
+                self.benchmark(size, options["queries"])
+            transaction.set_rollback(True)
+
+    def seed(self, owner, start, stop):
+        through = TopList.tags.through
+        batch_size = 10_000
+        for offset in range(start, stop, batch_size):
+            top_lists = TopList.objects.bulk_create(
+                [
+                    TopList(owner=owner, name=self.random_name())
+                    for _ in range(offset, min(offset + batch_size, stop))
+                ],
+                batch_size=1000,
+            )
+            if top_lists[0].pk is None:
+                # Backends that do not return primary keys from bulk_create
+                top_lists = TopList.objects.order_by("-pk")[: len(top_lists)]
+            through.objects.bulk_create(
+                [
+                    through(toplist_id=top_list.pk, tag_id=tag.pk)
+                    for top_list in top_lists
+                    for tag in self.random.sample(self.tags, self.random.randint(0, 3))
+                ],
+                batch_size=1000,
+            )
+
+    def random_name(self):
+        """Three common words plus a rare one, so that both unselective and
+        selective filters are measured."""
+        rare = "".join(self.random.choices("abcdefghijklmnopqrstuvwxyz", k=6))
+        return " ".join([*self.random.sample(WORDS, 3), rare])
+
+    def benchmark(self, size, queries):
+        started = time.perf_counter()
+        index = SearchIndex().build()
+        build_duration = time.perf_counter() - started
+
+        names = [word[: self.random.randint(3, len(word))] for word in WORDS]
+        rare_names = [self.random_name().split()[-1] for _ in range(queries)]
+        cases = {
+            "name": [(self.random.choice(names), None) for _ in range(queries)],
+            "rare name": [(name, None) for name in rare_names],
+            "tag": [(None, self.random.choice(self.tags).name) for _ in range(queries)],
+            "name+tag": [
+                (self.random.choice(names), self.random.choice(self.tags).name)
+                for _ in range(queries)
+            ],
+        }
+
+        self.stdout.write(f"\n{size} lists, index built in {build_duration:.2f}s")
+        self.stdout.write(
+            f"{'filter':<11} {'path':<8} {'median ms':>10} {'p95 ms':>10}"
+        )
+        for case, filters in cases.items():
+            for path, run in (("index", self.run_index), ("orm", self.run_orm)):
+                timings = []
+                for query, tag in filters:
+                    started = time.perf_counter()
+                    run(index, query, tag)
+                    timings.append((time.perf_counter() - started) * 1000)
+                timings.sort()
+                self.stdout.write(
+                    f"{case:<11} {path:<8} {statistics.median(timings):>10.2f} "
+                    f"{timings[int(len(timings) * 0.95) - 1]:>10.2f}"
+                )
+
+    def run_index(self, index, query, tag):
+        ids = index.search(query, [tag] if tag else None, 20)
+        return list(TopList.objects.filter(pk__in=ids).values_list("pk", "snapshot"))
+
+    def run_orm(self, index, query, tag):
+        top_lists = TopList.objects.all()
+        if query:
+            top_lists = top_lists.filter(name__icontains=query)
+        if tag:
+            top_lists = top_lists.filter(tags__name=tag)
+        return list(top_lists.order_by("-pk").values_list("pk", "snapshot")[:20])
@@ -0,0 +1,131 @@
+import random
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.contrib.auth.hashers import make_password
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.utils import timezone
+
+from apps.tops import trending
+from apps.tops.models import TopList, Vote
+from apps.users.models import CustomUser
+
+
+class Command(BaseCommand):
+    help = (
+        "Measures the throughput of the trending scores: the scoring alone "
+        "on synthetic votes held in memory, with NumPy and in pure Python, "
+        "then full and incremental runs against votes seeded inside a "
+        "transaction that is rolled back at the end."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--sizes",
+            nargs="+",
+            type=int,
+            default=[1_000_000, 5_000_000],
+            help="Number of votes scored in memory.",
+        )
+        parser.add_argument(
+            "--db-votes", type=int, default=500_000, help="Number of votes seeded."
+        )
+        parser.add_argument("--lists", type=int, default=10_000)
+        parser.add_argument("--seed", type=int, default=0)
+
+    def handle(self, *args, **options):
+        self.random = random.Random(options["seed"])
+        self.half_life = settings.TOPS_TRENDING_HALF_LIFE
+        if trending.np is None:
+            self.stdout.write("NumPy is not installed, only pure Python is measured.")
+
+        self.stdout.write(f"{'votes':>10} {'path':<8} {'votes/s':>12}")
+        for size in options["sizes"]:
+            votes = self.synthetic_votes(size, options["lists"])
+            paths = [("python", False)]
+            if trending.np is not None:
+                paths.insert(0, ("numpy", True))
+            for path, vectorized in paths:
+                started = time.perf_counter()
+                trending.hot_scores(*votes, self.half_life, vectorized)
+                rate = size / (time.perf_counter() - started)
+                self.stdout.write(f"{size:>10} {path:<8} {rate:>12,.0f}")
+
+        if options["db_votes"]:
+            with transaction.atomic():
+                self.seed(options["db_votes"], options["lists"])
+                self.benchmark_runs(options["db_votes"], options["lists"])
+                transaction.set_rollback(True)
+
+    def synthetic_votes(self, count, list_count):
+        """Votes over the last 30 days, three likes for one dislike, grouped
+        by list as the database returns them."""
+        now = time.time()
+        list_ids = sorted(self.random.randrange(list_count) for _ in range(count))
+        timestamps = [now - self.random.random() * 30 * 86400 for _ in range(count)]
+        values = [self.random.choice((1, 1, 1, -1)) for _ in range(count)]
+        return list_ids, timestamps, values
+
+    def seed(self, count, list_count):
+        password = make_password(None)
+        voter_count = -(-count // list_count)
+        voters = CustomUser.objects.bulk_create(
+            [
+                CustomUser(username=f"benchmarktrending{number}", password=password)
+                for number in range(voter_count)
+            ],
+            batch_size=1000,
+        )
+        top_lists = TopList.objects.bulk_create(
+            [
+                TopList(owner=voters[0], name=f"List {number}")
+                for number in range(list_count)
+            ],
+            batch_size=1000,
+        )
+        if voters[0].pk is None or top_lists[0].pk is None:
+            # Backends that do not return primary keys from bulk_create
+            voters = CustomUser.objects.order_by("-pk")[:voter_count]
+            top_lists = TopList.objects.order_by("-pk")[:list_count]
+        voter_ids = [voter.pk for voter in voters]
+        list_ids = [top_list.pk for top_list in top_lists]
+
+        batch_size = 10_000
+        for offset in range(0, count, batch_size):
+            Vote.objects.bulk_create(
+                [
+                    Vote(
+                        user_id=voter_ids[number // list_count],
+                        top_list_id=list_ids[number % list_count],
+                        value=self.random.choice((1, 1, 1, -1)),
+                    )
+                    for number in range(offset, min(offset + batch_size, count))
+                ],
+                batch_size=1000,
+            )
+        # Voted on before the full run, so only the lists voted on after it
+        # are picked by the incremental run
+        TopList.objects.filter(pk__in=list_ids).update(
+            votes_changed_at=timezone.now() - timedelta(days=1)
+        )
+        self.list_ids = list_ids
+
+    def benchmark_runs(self, count, list_count):
+        started = time.perf_counter()
+        trending.score_trending(full=True)
+        duration = time.perf_counter() - started
+        self.stdout.write(
+            f"\nFull run: {list_count} lists and {count} votes in {duration:.2f}s, "
+            f"{count / duration:,.0f} votes/s"
+        )
+
+        changed = self.random.sample(self.list_ids, max(1, list_count // 100))
+        TopList.objects.filter(pk__in=changed).update(votes_changed_at=timezone.now())
+        started = time.perf_counter()
+        rescored = trending.score_trending()
+        duration = time.perf_counter() - started
+        self.stdout.write(
+            f"Incremental run: {rescored} lists rescored in {duration:.2f}s"
+        )
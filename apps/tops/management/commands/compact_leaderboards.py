@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from apps.tops.leaderboards import compact_leaderboards
+
+
+class Command(BaseCommand):
+    help = (
+        "Drops expired daily vote buckets and rolls the leaderboard windows "
+        "forward. Schedule it to run daily, right after midnight."
+    )
+
+    def handle(self, *args, **options):
+        compact_leaderboards()
+        self.stdout.write(self.style.SUCCESS("Leaderboards compacted."))
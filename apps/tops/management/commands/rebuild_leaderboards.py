@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from apps.tops.leaderboards import rebuild_leaderboards
+
+
+class Command(BaseCommand):
+    help = "Rebuilds the daily vote buckets and the leaderboards from the raw votes."
+
+    def handle(self, *args, **options):
+        rebuild_leaderboards()
+        self.stdout.write(self.style.SUCCESS("Leaderboards rebuilt."))
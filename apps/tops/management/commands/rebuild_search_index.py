@@ -0,0 +1,18 @@
+from django.core.management.base import BaseCommand
+
+from apps.tops.search import rebuild_search_index
+
+
+class Command(BaseCommand):
+    help = (
+        "Rebuilds the in-memory search index of the top lists. Running "
+        "workers rebuild theirs on their next search."
+    )
+
+    def handle(self, *args, **options):
+        index = rebuild_search_index()
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Indexed {len(index)} lists in {index.build_duration:.2f}s."
+            )
+        )
@@ -0,0 +1,20 @@
+from django.core.management.base import BaseCommand
+
+from apps.tops.trending import score_trending
+
+
+class Command(BaseCommand):
+    help = (
+        "Rescores the trending lists whose votes changed since the last run. "
+        "Meant to run every few minutes, with --full from time to time."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--full", action="store_true", help="Rescore every list.")
+        parser.add_argument("--chunk-size", type=int, help="Lists scored at once.")
+
+    def handle(self, *args, **options):
+        rescored = score_trending(
+            full=options["full"], chunk_size=options["chunk_size"]
+        )
+        self.stdout.write(self.style.SUCCESS(f"Rescored {rescored} lists."))
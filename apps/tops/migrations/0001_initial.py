@@ -0,0 +1,157 @@
+# Generated by Django 5.0.6 on 2026-10-17 18:50
+
+import django.core.validators
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="Tag",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                (
+                    "name",
+                    models.CharField(
+                        error_messages={
+                            "unique": "A tag with that name already exists."
+                        },
+                        max_length=50,
+                        unique=True,
+                        verbose_name="name",
+                    ),
+                ),
+            ],
+        ),
+        migrations.CreateModel(
+            name="TopList",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("name", models.CharField(max_length=100, verbose_name="name")),
+                (
+                    "description",
+                    models.TextField(blank=True, verbose_name="description"),
+                ),
+                (
+                    "likes_count",
+                    models.PositiveIntegerField(default=0, verbose_name="likes"),
+                ),
+                (
+                    "dislikes_count",
+                    models.PositiveIntegerField(default=0, verbose_name="dislikes"),
+                ),
+                (
+                    "snapshot",
+                    models.JSONField(
+                        default=dict,
+                        editable=False,
+                        help_text="Denormalized copy of the list, its items, tags, author and votes used to render it without joins. Refreshed on every write.",
+                        verbose_name="snapshot",
+                    ),
+                ),
+                (
+                    "created_at",
+                    models.DateTimeField(auto_now_add=True, verbose_name="created at"),
+                ),
+                (
+                    "updated_at",
+                    models.DateTimeField(auto_now=True, verbose_name="updated at"),
+                ),
+                (
+                    "owner",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="top_lists",
+                        to=settings.AUTH_USER_MODEL,
+                        verbose_name="owner",
+                    ),
+                ),
+                (
+                    "tags",
+                    models.ManyToManyField(
+                        blank=True,
+                        related_name="top_lists",
+                        to="tops.tag",
+                        verbose_name="tags",
+                    ),
+                ),
+            ],
+            options={
+                "ordering": ["-created_at", "-id"],
+            },
+        ),
+        migrations.CreateModel(
+            name="TopListItem",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                (
+                    "position",
+                    models.PositiveSmallIntegerField(
+                        validators=[
+                            django.core.validators.MinValueValidator(1),
+                            django.core.validators.MaxValueValidator(5),
+                        ],
+                        verbose_name="position",
+                    ),
+                ),
+                ("title", models.CharField(max_length=100, verbose_name="title")),
+                (
+                    "description",
+                    models.TextField(blank=True, verbose_name="description"),
+                ),
+                (
+                    "top_list",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="items",
+                        to="tops.toplist",
+                        verbose_name="top list",
+                    ),
+                ),
+            ],
+            options={
+                "ordering": ["top_list", "position"],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name="toplistitem",
+            constraint=models.UniqueConstraint(
+                fields=("top_list", "position"),
+                name="tops_toplistitem_unique_position",
+                violation_error_message="The list already has an item in that position.",
+            ),
+        ),
+    ]
@@ -0,0 +1,153 @@
+# Generated by Django 5.0.6 on 2026-10-17 18:52
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("tops", "0001_initial"),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="LeaderboardScore",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                (
+                    "window",
+                    models.CharField(
+                        choices=[("day", "Day"), ("week", "Week"), ("month", "Month")],
+                        max_length=5,
+                        verbose_name="window",
+                    ),
+                ),
+                ("score", models.IntegerField(default=0, verbose_name="score")),
+                (
+                    "top_list",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="leaderboard_scores",
+                        to="tops.toplist",
+                        verbose_name="top list",
+                    ),
+                ),
+            ],
+        ),
+        migrations.CreateModel(
+            name="Vote",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                (
+                    "value",
+                    models.SmallIntegerField(
+                        choices=[(1, "Like"), (-1, "Dislike")], verbose_name="value"
+                    ),
+                ),
+                (
+                    "created_at",
+                    models.DateTimeField(auto_now_add=True, verbose_name="created at"),
+                ),
+                (
+                    "updated_at",
+                    models.DateTimeField(auto_now=True, verbose_name="updated at"),
+                ),
+                (
+                    "top_list",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="votes",
+                        to="tops.toplist",
+                        verbose_name="top list",
+                    ),
+                ),
+                (
+                    "user",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="votes",
+                        to=settings.AUTH_USER_MODEL,
+                        verbose_name="user",
+                    ),
+                ),
+            ],
+        ),
+        migrations.CreateModel(
+            name="DailyVoteCount",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("day", models.DateField(verbose_name="day")),
+                ("score", models.IntegerField(default=0, verbose_name="score")),
+                (
+                    "top_list",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="daily_vote_counts",
+                        to="tops.toplist",
+                        verbose_name="top list",
+                    ),
+                ),
+            ],
+            options={
+                "indexes": [
+                    models.Index(fields=["day"], name="tops_dailyvotecount_day_idx")
+                ],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name="dailyvotecount",
+            constraint=models.UniqueConstraint(
+                fields=("top_list", "day"),
+                name="tops_dailyvotecount_unique_top_list_day",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="leaderboardscore",
+            index=models.Index(
+                fields=["window", "-score", "top_list"],
+                name="tops_leaderboard_rank_idx",
+            ),
+        ),
+        migrations.AddConstraint(
+            model_name="leaderboardscore",
+            constraint=models.UniqueConstraint(
+                fields=("window", "top_list"),
+                name="tops_leaderboardscore_unique_window_top_list",
+            ),
+        ),
+        migrations.AddConstraint(
+            model_name="vote",
+            constraint=models.UniqueConstraint(
+                fields=("user", "top_list"),
+                name="tops_vote_unique_user_top_list",
+                violation_error_message="The user already voted this list.",
+            ),
+        ),
+    ]
@@ -0,0 +1,22 @@
+# Generated by Django 5.0.6 on 2026-10-17 19:24
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("tops", "0002_votes_and_leaderboards"),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="toplist",
+            index=models.Index(
+                fields=["owner", "-created_at", "-id"],
+                name="tops_toplist_owner_created_idx",
+            ),
+        ),
+    ]
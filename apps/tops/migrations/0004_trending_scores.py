@@ -0,0 +1,59 @@
+# Generated by Django 5.0.6 on 2026-10-17 19:49
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("tops", "0003_toplist_owner_created_index"),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="TrendingScore",
+            fields=[
+                (
+                    "top_list",
+                    models.OneToOneField(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        primary_key=True,
+                        related_name="trending_score",
+                        serialize=False,
+                        to="tops.toplist",
+                        verbose_name="top list",
+                    ),
+                ),
+                ("score", models.FloatField(default=0.0, verbose_name="score")),
+                ("scored_at", models.DateTimeField(verbose_name="scored at")),
+            ],
+        ),
+        migrations.AddField(
+            model_name="toplist",
+            name="votes_changed_at",
+            field=models.DateTimeField(
+                blank=True, editable=False, null=True, verbose_name="votes changed at"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="toplist",
+            index=models.Index(
+                fields=["votes_changed_at"], name="tops_toplist_votes_changed_idx"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="trendingscore",
+            index=models.Index(
+                fields=["-score", "top_list"], name="tops_trending_rank_idx"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="trendingscore",
+            index=models.Index(
+                fields=["scored_at"], name="tops_trending_scored_at_idx"
+            ),
+        ),
+    ]
@@ -0,0 +1,305 @@
+from django.conf import settings
+from django.core.validators import MaxValueValidator, MinValueValidator
+from django.db import models
+from django.utils.translation import gettext_lazy as _
+
+TOP_LIST_SIZE = 5
+
+
+class Tag(models.Model):
+    name = models.CharField(
+        _("name"),
+        max_length=50,
+        unique=True,
+        error_messages={
+            "unique": _("A tag with that name already exists."),
+        },
+    )
+
+    def __str__(self):
+        return self.name
+
+    def save(self, *args, **kwargs):
+        # Parse the name to lowercase so tags are matched regardless of case
+        self.name = self.name.lower()
+        super().save(*args, **kwargs)
+
+
+class TopListManager(models.Manager):
+    def get_snapshot(self, pk):
+        """Returns the denormalized snapshot of a top list with a single
+        primary key read and no joins."""
+        return self.filter(pk=pk).values_list("snapshot", flat=True).get()
+
+    def refresh_snapshots(self, pks):
+        """Rebuilds and stores the snapshots of the given top lists. The
+        snapshots are written with UPDATE statements, so refreshing does not
+        fire the post_save signal of TopList again.
+
+        A flush of buffered votes may update the counters and the snapshot
+        votes of a list between its read and its write, so a snapshot is
+        only written if the counters are still the ones it was built with.
+        The lists whose counters changed are read and built again."""
+        pks = list(pks)
+        while pks:
+            top_lists = (
+                self.filter(pk__in=pks)
+                .select_related("owner")
+                .prefetch_related("items", "tags")
+            )
+            pks = []
+            for top_list in top_lists:
+                top_list.snapshot = top_list.build_snapshot()
+                written = self.filter(
+                    pk=top_list.pk,
+                    likes_count=top_list.likes_count,
+                    dislikes_count=top_list.dislikes_count,
+                ).update(snapshot=top_list.snapshot)
+                if not written:
+                    pks.append(top_list.pk)
+
+
+class TopList(models.Model):
+    owner = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.CASCADE,
+        related_name="top_lists",
+        verbose_name=_("owner"),
+    )
+
+    name = models.CharField(_("name"), max_length=100)
+
+    description = models.TextField(_("description"), blank=True)
+
+    tags = models.ManyToManyField(
+        Tag, blank=True, related_name="top_lists", verbose_name=_("tags")
+    )
+
+    likes_count = models.PositiveIntegerField(_("likes"), default=0)
+
+    dislikes_count = models.PositiveIntegerField(_("dislikes"), default=0)
+
+    snapshot = models.JSONField(
+        _("snapshot"),
+        default=dict,
+        editable=False,
+        help_text=_(
+            "Denormalized copy of the list, its items, tags, author and votes "
+            "used to render it without joins. Refreshed on every write."
+        ),
+    )
+
+    created_at = models.DateTimeField(_("created at"), auto_now_add=True)
+
+    updated_at = models.DateTimeField(_("updated at"), auto_now=True)
+
+    votes_changed_at = models.DateTimeField(
+        _("votes changed at"), null=True, blank=True, editable=False
+    )
+
+    objects = TopListManager()
+
+    class Meta:
+        ordering = ["-created_at", "-id"]
+        indexes = [
+            # Keyset pagination of the lists of a user, newest first
+            models.Index(
+                fields=["owner", "-created_at", "-id"],
+                name="tops_toplist_owner_created_idx",
+            ),
+            # Lists to rescore by the incremental trending runs
+            models.Index(
+                fields=["votes_changed_at"], name="tops_toplist_votes_changed_idx"
+            ),
+        ]
+
+    def __str__(self):
+        return self.name
+
+    def build_snapshot(self):
+        """Returns the JSON serializable snapshot of the list. Uses the
+        prefetched items and tags when available."""
+        return {
+            "id": self.pk,
+            "name": self.name,
+            "description": self.description,
+            "author": self.owner.username,
+            "items": [
+                {
+                    "position": item.position,
+                    "title": item.title,
+                    "description": item.description,
+                }
+                for item in sorted(self.items.all(), key=lambda item: item.position)
+            ],
+            "tags": sorted(tag.name for tag in self.tags.all()),
+            "votes": {
+                "likes": self.likes_count,
+                "dislikes": self.dislikes_count,
+            },
+            "created_at": self.created_at.isoformat(),
+            "updated_at": self.updated_at.isoformat(),
+        }
+
+
+class TopListItem(models.Model):
+    top_list = models.ForeignKey(
+        TopList,
+        on_delete=models.CASCADE,
+        related_name="items",
+        verbose_name=_("top list"),
+    )
+
+    position = models.PositiveSmallIntegerField(
+        _("position"),
+        validators=[MinValueValidator(1), MaxValueValidator(TOP_LIST_SIZE)],
+    )
+
+    title = models.CharField(_("title"), max_length=100)
+
+    description = models.TextField(_("description"), blank=True)
+
+    class Meta:
+        ordering = ["top_list", "position"]
+        constraints = [
+            models.UniqueConstraint(
+                fields=["top_list", "position"],
+                name="tops_toplistitem_unique_position",
+                violation_error_message=_(
+                    "The list already has an item in that position."
+                ),
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.position}. {self.title}"
+
+
+class Vote(models.Model):
+    LIKE = 1
+    DISLIKE = -1
+    VALUE_CHOICES = [
+        (LIKE, _("Like")),
+        (DISLIKE, _("Dislike")),
+    ]
+
+    user = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.CASCADE,
+        related_name="votes",
+        verbose_name=_("user"),
+    )
+
+    top_list = models.ForeignKey(
+        TopList,
+        on_delete=models.CASCADE,
+        related_name="votes",
+        verbose_name=_("top list"),
+    )
+
+    value = models.SmallIntegerField(_("value"), choices=VALUE_CHOICES)
+
+    created_at = models.DateTimeField(_("created at"), auto_now_add=True)
+
+    updated_at = models.DateTimeField(_("updated at"), auto_now=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=["user", "top_list"],
+                name="tops_vote_unique_user_top_list",
+                violation_error_message=_("The user already voted this list."),
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.user_id} -> {self.top_list_id}: {self.value}"
+
+
+class DailyVoteCount(models.Model):
+    """Net votes (likes minus dislikes) received by a list on a day, kept
+    up to date incrementally by apps.tops.leaderboards."""
+
+    top_list = models.ForeignKey(
+        TopList,
+        on_delete=models.CASCADE,
+        related_name="daily_vote_counts",
+        verbose_name=_("top list"),
+    )
+
+    day = models.DateField(_("day"))
+
+    score = models.IntegerField(_("score"), default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=["top_list", "day"],
+                name="tops_dailyvotecount_unique_top_list_day",
+            ),
+        ]
+        indexes = [
+            models.Index(fields=["day"], name="tops_dailyvotecount_day_idx"),
+        ]
+
+
+class LeaderboardScore(models.Model):
+    """Score of a list in a popularity window, ranked by an index on
+    (window, -score) so top-N reads never aggregate votes."""
+
+    DAY = "day"
+    WEEK = "week"
+    MONTH = "month"
+    WINDOW_CHOICES = [
+        (DAY, _("Day")),
+        (WEEK, _("Week")),
+        (MONTH, _("Month")),
+    ]
+
+    window = models.CharField(_("window"), max_length=5, choices=WINDOW_CHOICES)
+
+    top_list = models.ForeignKey(
+        TopList,
+        on_delete=models.CASCADE,
+        related_name="leaderboard_scores",
+        verbose_name=_("top list"),
+    )
+
+    score = models.IntegerField(_("score"), default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=["window", "top_list"],
+                name="tops_leaderboardscore_unique_window_top_list",
+            ),
+        ]
+        indexes = [
+            models.Index(
+                fields=["window", "-score", "top_list"],
+                name="tops_leaderboard_rank_idx",
+            ),
+        ]
+
+
+class TrendingScore(models.Model):
+    """Time decayed score of a list, computed in batches from its votes by
+    apps.tops.trending."""
+
+    top_list = models.OneToOneField(
+        TopList,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name="trending_score",
+        verbose_name=_("top list"),
+    )
+
+    score = models.FloatField(_("score"), default=0.0)
+
+    scored_at = models.DateTimeField(_("scored at"))
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["-score", "top_list"], name="tops_trending_rank_idx"),
+            models.Index(fields=["scored_at"], name="tops_trending_scored_at_idx"),
+        ]
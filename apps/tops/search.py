@@ -0,0 +1,383 @@
+import bisect
+import heapq
+import itertools
+import logging
+import re
+import threading
+import time
+from collections import defaultdict
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connection
+
+from apps.tops.models import Tag, TopList
+
+logger = logging.getLogger(__name__)
+
+GENERATION_CACHE_KEY = "tops:search-index:generation"
+
+# Number of changes made to the lists and tags by all the workers, the
+# lists and tags of each change being kept for CHANGE_LOG_TIMEOUT seconds
+CHANGES_CACHE_KEY = "tops:search-index:changes"
+
+CHANGE_LOG_TIMEOUT = 3600
+
+
+def change_key(number):
+    return f"{CHANGES_CACHE_KEY}:{number}"
+
+
+TOKEN_RE = re.compile(r"\w+")
+
+
+def normalize(text):
+    return " ".join(TOKEN_RE.findall(text.lower()))
+
+
+def trigrams(text):
+    return {text[i : i + 3] for i in range(len(text) - 2)}
+
+
+class SearchIndex:
+    """In-memory inverted index of the top lists for the home page filters.
+
+    A name filter matches like an icontains lookup and is ranked in tiers:
+    lists with a word equal to the query first, then lists with a word
+    starting with it, then any other match, newest first within each tier.
+    The first two tiers come straight from the word postings and the sorted
+    vocabulary, and only when they do not fill the page are the remaining
+    matches found by intersecting the trigram postings of the query. Tags
+    are indexed by id."""
+
+    def __init__(self, generation=None, changes=None):
+        self.generation = generation
+        self.changes = changes
+        self.built_at = None
+        self.refreshed_at = None
+        self.build_duration = None
+        self._names = {}
+        self._tags = defaultdict(set)
+        self._word_postings = defaultdict(set)
+        self._vocabulary = []
+        self._trigram_postings = defaultdict(set)
+        self._tag_postings = defaultdict(set)
+        self._tag_ids = {}
+        self._tag_names = {}
+        self._lock = threading.RLock()
+
+    def __len__(self):
+        return len(self._names)
+
+    def build(self):
+        """Loads every list name and tag from the database."""
+        started = time.perf_counter()
+        for pk, name in Tag.objects.values_list("pk", "name").iterator():
+            self.set_tag(pk, name)
+        for pk, name in TopList.objects.values_list("pk", "name").iterator():
+            name = normalize(name)
+            self._names[pk] = name
+            for word in name.split():
+                self._word_postings[word].add(pk)
+            for trigram in trigrams(name):
+                self._trigram_postings[trigram].add(pk)
+        self._vocabulary = sorted(self._word_postings)
+        for top_list_id, tag_id in TopList.tags.through.objects.values_list(
+            "toplist_id", "tag_id"
+        ).iterator():
+            self.add_tags(top_list_id, [tag_id])
+        self.built_at = self.refreshed_at = time.time()
+        self.build_duration = time.perf_counter() - started
+        return self
+
+    def index_list(self, pk, name):
+        name = normalize(name)
+        with self._lock:
+            if self._names.get(pk) == name:
+                return
+            self._unindex_name(pk)
+            self._names[pk] = name
+            for word in name.split():
+                if word not in self._word_postings:
+                    bisect.insort(self._vocabulary, word)
+                self._word_postings[word].add(pk)
+            for trigram in trigrams(name):
+                self._trigram_postings[trigram].add(pk)
+
+    def remove_list(self, pk):
+        with self._lock:
+            self._unindex_name(pk)
+            self._names.pop(pk, None)
+            for tag_id in self._tags.pop(pk, ()):
+                self._discard(self._tag_postings, tag_id, pk)
+
+    def set_tag(self, tag_id, name):
+        with self._lock:
+            self._tag_ids.pop(self._tag_names.get(tag_id), None)
+            self._tag_names[tag_id] = name.lower()
+            self._tag_ids[name.lower()] = tag_id
+
+    def remove_tag(self, tag_id):
+        with self._lock:
+            self._tag_ids.pop(self._tag_names.pop(tag_id, None), None)
+            for top_list_id in self._tag_postings.pop(tag_id, ()):
+                self._tags[top_list_id].discard(tag_id)
+
+    def add_tags(self, top_list_id, tag_ids):
+        with self._lock:
+            for tag_id in tag_ids:
+                self._tags[top_list_id].add(tag_id)
+                self._tag_postings[tag_id].add(top_list_id)
+
+    def remove_tags(self, top_list_id, tag_ids=None):
+        """Removes the given tags, or all of them, from a list."""
+        with self._lock:
+            if tag_ids is None:
+                tag_ids = list(self._tags.get(top_list_id, ()))
+            for tag_id in tag_ids:
+                self._tags[top_list_id].discard(tag_id)
+                self._discard(self._tag_postings, tag_id, top_list_id)
+
+    def reload(self, top_list_ids=(), tag_ids=()):
+        """Reloads the given lists and tags from the database, removing
+        those that no longer exist, with up to three queries."""
+        if tag_ids:
+            names = dict(Tag.objects.filter(pk__in=tag_ids).values_list("pk", "name"))
+            for tag_id in tag_ids:
+                if tag_id in names:
+                    self.set_tag(tag_id, names[tag_id])
+                else:
+                    self.remove_tag(tag_id)
+        if top_list_ids:
+            names = dict(
+                TopList.objects.filter(pk__in=top_list_ids).values_list("pk", "name")
+            )
+            links = TopList.tags.through.objects.filter(
+                toplist_id__in=names
+            ).values_list("toplist_id", "tag_id")
+            with self._lock:
+                for pk in top_list_ids:
+                    if pk in names:
+                        self.index_list(pk, names[pk])
+                        self.remove_tags(pk)
+                    else:
+                        self.remove_list(pk)
+                for top_list_id, tag_id in links:
+                    self.add_tags(top_list_id, [tag_id])
+        self.refreshed_at = time.time()
+
+    def search(self, query=None, tags=None, limit=None):
+        """Returns the ids of the lists whose name contains query and that
+        have every one of the given tags, best matches first."""
+        with self._lock:
+            candidates = None
+            for tag in tags or ():
+                postings = self._tag_postings.get(self._tag_ids.get(tag.lower()), set())
+                candidates = (
+                    set(postings) if candidates is None else candidates & postings
+                )
+                if not candidates:
+                    return []
+
+            query = normalize(query or "")
+            if not query:
+                return self._newest(
+                    self._names.keys() if candidates is None else candidates, limit
+                )
+
+            results = []
+            seen = set()
+            for tier in self._tiers(query, candidates):
+                if candidates is not None:
+                    tier = tier & candidates
+                tier -= seen
+                remaining = None if limit is None else limit - len(results)
+                results.extend(self._newest(tier, remaining))
+                if limit is not None and len(results) >= limit:
+                    break
+                seen |= tier
+        return results
+
+    def _tiers(self, query, candidates):
+        """Lazily yields the lists having a word equal to the query, then the
+        ones having a word starting with it and finally every list containing
+        it. Multi word queries only have the last tier."""
+        if " " not in query:
+            yield set(self._word_postings.get(query, ()))
+
+            prefixed = set()
+            start = bisect.bisect_left(self._vocabulary, query)
+            for word in itertools.islice(self._vocabulary, start, None):
+                if not word.startswith(query):
+                    break
+                prefixed |= self._word_postings[word]
+            yield prefixed
+
+        yield self._substring_matches(query, candidates)
+
+    def _substring_matches(self, query, candidates):
+        if len(query) >= 3:
+            postings = sorted(
+                (
+                    self._trigram_postings.get(trigram, set())
+                    for trigram in trigrams(query)
+                ),
+                key=len,
+            )
+            if candidates is not None:
+                postings.insert(0, candidates)
+            candidates = set(postings[0]).intersection(*postings[1:])
+        elif candidates is None:
+            candidates = self._names.keys()
+        return {pk for pk in candidates if query in self._names[pk]}
+
+    def _unindex_name(self, pk):
+        name = self._names.get(pk)
+        if name is None:
+            return
+        for word in name.split():
+            self._discard(self._word_postings, word, pk)
+            if word not in self._word_postings:
+                index = bisect.bisect_left(self._vocabulary, word)
+                if index < len(self._vocabulary) and self._vocabulary[index] == word:
+                    del self._vocabulary[index]
+        for trigram in trigrams(name):
+            self._discard(self._trigram_postings, trigram, pk)
+
+    @staticmethod
+    def _newest(ids, limit):
+        if limit is None:
+            return sorted(ids, reverse=True)
+        return heapq.nlargest(limit, ids)
+
+    @staticmethod
+    def _discard(postings, key, pk):
+        values = postings.get(key)
+        if values is not None:
+            values.discard(pk)
+            if not values:
+                del postings[key]
+
+
+_search_index = None
+_search_index_lock = threading.Lock()
+
+
+def get_search_index():
+    """Returns the search index of the process, building it on first use,
+    which the warm-up does, and rebuilding it whenever rebuild_search_index()
+    bumped the generation shared through the cache.
+
+    The changes of the current process are applied to its index by the
+    signals. Those of the other workers are numbered in the cache, which
+    keeps the lists and tags of each of them. Once the count differs from
+    the one the index reflects, the index reloads the lists and tags of the
+    changes it missed in the background while it keeps answering, at most
+    once every TOPS_SEARCH_INDEX_REFRESH_INTERVAL seconds. A change made by
+    another worker thus shows up after that interval plus a few queries.
+    The index is only rebuilt from scratch when it missed changes the cache
+    no longer holds."""
+    global _search_index
+    values = cache.get_many([GENERATION_CACHE_KEY, CHANGES_CACHE_KEY])
+    generation = values.get(GENERATION_CACHE_KEY)
+    changes = values.get(CHANGES_CACHE_KEY)
+    index = _search_index
+    if index is None or index.generation != generation:
+        with _search_index_lock:
+            if _search_index is None or _search_index.generation != generation:
+                _search_index = SearchIndex(generation, changes).build()
+            return _search_index
+
+    stale = changes is not None and changes != index.changes
+    age = time.time() - index.refreshed_at
+    if (
+        stale
+        and age >= settings.TOPS_SEARCH_INDEX_REFRESH_INTERVAL
+        and _search_index_lock.acquire(blocking=False)
+    ):
+        threading.Thread(
+            target=_background_refresh,
+            args=(index, changes),
+            name="search-index-refresh",
+            daemon=True,
+        ).start()
+    return index
+
+
+def catch_up(index, changes):
+    """Applies the changes numbered after the last one the index reflects,
+    up to changes, and returns whether the cache still held them."""
+    first = (index.changes or 0) + 1
+    if changes < first:
+        return False
+    numbers = range(first, changes + 1)
+    entries = cache.get_many([change_key(number) for number in numbers])
+    top_list_ids, tag_ids = set(), set()
+    applied = None
+    for number in numbers:
+        entry = entries.get(change_key(number))
+        if entry is None:
+            break
+        top_list_ids.update(entry[0])
+        tag_ids.update(entry[1])
+        applied = number
+    if applied is None or len(entries) > applied - first + 1:
+        # Expired or evicted changes, only changes still being recorded
+        # may be missing after the ones found
+        return False
+    index.reload(top_list_ids, tag_ids)
+    index.changes = applied
+    return True
+
+
+def _background_refresh(index, changes):
+    global _search_index
+    try:
+        if not catch_up(index, changes):
+            _search_index = SearchIndex(index.generation, changes).build()
+    except Exception:
+        logger.exception("Failed to refresh the search index.")
+        index.refreshed_at = time.time()
+    finally:
+        _search_index_lock.release()
+        connection.close()
+
+
+def record_search_index_change(index=None, top_list_ids=(), tag_ids=()):
+    """Numbers a change of the given lists and tags in the cache, so the
+    other workers reload them. The index of the process, which the change
+    was applied to, stays current unless another worker changed something in
+    the meantime."""
+    cache.add(CHANGES_CACHE_KEY, 0, None)
+    try:
+        changes = cache.incr(CHANGES_CACHE_KEY)
+    except ValueError:
+        # Evicted between the two calls, the next change adds it again
+        return
+    cache.set(
+        change_key(changes),
+        (list(top_list_ids), list(tag_ids)),
+        CHANGE_LOG_TIMEOUT,
+    )
+    if index is not None and changes == (index.changes or 0) + 1:
+        index.changes = changes
+
+
+def get_built_search_index():
+    """Returns the search index only if it was already built."""
+    return _search_index
+
+
+def rebuild_search_index():
+    """Makes every worker rebuild its search index from the database on its
+    next search, and rebuilds the index of the current process."""
+    cache.set(GENERATION_CACHE_KEY, time.time_ns(), None)
+    return get_search_index()
+
+
+def search_top_lists(query=None, tags=None, limit=20):
+    """Returns the snapshots of the lists matching the filters, ranked by
+    the search index and fetched with a single pk__in query."""
+    ids = get_search_index().search(query, tags, limit)
+    snapshots = dict(TopList.objects.filter(pk__in=ids).values_list("pk", "snapshot"))
+    return [snapshots[pk] for pk in ids if pk in snapshots]
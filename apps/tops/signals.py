@@ -0,0 +1,152 @@
+import threading
+
+from django.db import transaction
+from django.db.models.signals import m2m_changed, post_delete, post_save, pre_delete
+from django.dispatch import receiver
+
+from apps.tops.models import Tag, TopList, TopListItem
+from apps.tops.search import get_built_search_index, record_search_index_change
+from apps.users.models import CustomUser
+
+_pending = threading.local()
+
+
+def refresh_snapshots_on_commit(pks):
+    """Schedules the refresh of the given snapshots for when the current
+    transaction commits. Lists written together with their items and tags
+    are collected in a per-thread set, so each one is rebuilt only once."""
+    if not hasattr(_pending, "pks"):
+        _pending.pks = set()
+    _pending.pks.update(pks)
+    transaction.on_commit(flush_pending_snapshots)
+
+
+def flush_pending_snapshots():
+    pks, _pending.pks = getattr(_pending, "pks", set()), set()
+    if pks:
+        TopList.objects.refresh_snapshots(pks)
+
+
+def update_search_index_on_commit(update, top_list_ids=(), tag_ids=()):
+    """Applies update to the search index of the process once the current
+    transaction commits, and records the lists and tags it changes for the
+    other workers. The index is left alone until it is first built, as it
+    will be loaded from the database then."""
+
+    def apply():
+        index = get_built_search_index()
+        if index is not None:
+            update(index)
+        record_search_index_change(index, top_list_ids, tag_ids)
+
+    transaction.on_commit(apply)
+
+
+@receiver(post_save, sender=TopList)
+def index_top_list(sender, instance, **kwargs):
+    name = instance.name
+    update_search_index_on_commit(
+        lambda index: index.index_list(instance.pk, name), [instance.pk]
+    )
+
+
+@receiver(post_delete, sender=TopList)
+def unindex_top_list(sender, instance, **kwargs):
+    pk = instance.pk
+    update_search_index_on_commit(lambda index: index.remove_list(pk), [pk])
+
+
+@receiver(m2m_changed, sender=TopList.tags.through)
+def index_top_list_tags(sender, instance, action, reverse, pk_set, **kwargs):
+    if action == "pre_clear" and reverse:
+        # The lists are only known before the relation is cleared
+        pairs = [
+            (top_list_id, instance.pk)
+            for top_list_id in instance.top_lists.values_list("pk", flat=True)
+        ]
+        action = "post_remove"
+    elif action == "post_clear" and not reverse:
+        pk = instance.pk
+        update_search_index_on_commit(lambda index: index.remove_tags(pk), [pk])
+        return
+    elif action in ("post_add", "post_remove"):
+        if reverse:
+            pairs = [(top_list_id, instance.pk) for top_list_id in pk_set]
+        else:
+            pairs = [(instance.pk, tag_id) for tag_id in pk_set]
+    else:
+        return
+
+    def update(index):
+        for top_list_id, tag_id in pairs:
+            if action == "post_add":
+                index.add_tags(top_list_id, [tag_id])
+            else:
+                index.remove_tags(top_list_id, [tag_id])
+
+    update_search_index_on_commit(
+        update, {top_list_id for top_list_id, _tag_id in pairs}
+    )
+
+
+@receiver(post_save, sender=Tag)
+def index_tag(sender, instance, **kwargs):
+    pk, name = instance.pk, instance.name
+    update_search_index_on_commit(lambda index: index.set_tag(pk, name), tag_ids=[pk])
+
+
+@receiver(post_delete, sender=Tag)
+def unindex_tag(sender, instance, **kwargs):
+    pk = instance.pk
+    update_search_index_on_commit(lambda index: index.remove_tag(pk), tag_ids=[pk])
+
+
+@receiver(post_save, sender=TopList)
+def refresh_snapshot_on_top_list_change(sender, instance, **kwargs):
+    refresh_snapshots_on_commit([instance.pk])
+
+
+@receiver(post_save, sender=TopListItem)
+@receiver(post_delete, sender=TopListItem)
+def refresh_snapshot_on_item_change(sender, instance, **kwargs):
+    refresh_snapshots_on_commit([instance.top_list_id])
+
+
+@receiver(m2m_changed, sender=TopList.tags.through)
+def refresh_snapshot_on_tags_change(
+    sender, instance, action, reverse, pk_set, **kwargs
+):
+    if action in ("pre_clear", "post_clear") and reverse:
+        # The lists are only known before the relation is cleared
+        if action == "pre_clear":
+            refresh_snapshots_on_commit(instance.top_lists.values_list("pk", flat=True))
+        return
+
+    if not action.startswith("post_"):
+        return
+
+    if reverse:
+        refresh_snapshots_on_commit(pk_set)
+    else:
+        refresh_snapshots_on_commit([instance.pk])
+
+
+@receiver(post_save, sender=Tag)
+def refresh_snapshots_on_tag_rename(sender, instance, created, **kwargs):
+    if not created:
+        refresh_snapshots_on_commit(instance.top_lists.values_list("pk", flat=True))
+
+
+@receiver(pre_delete, sender=Tag)
+def refresh_snapshots_on_tag_delete(sender, instance, **kwargs):
+    refresh_snapshots_on_commit(instance.top_lists.values_list("pk", flat=True))
+
+
+@receiver(post_save, sender=CustomUser)
+def refresh_snapshots_on_username_change(
+    sender, instance, created, update_fields=None, **kwargs
+):
+    # Logins only update last_login, skip them to keep logins cheap
+    if created or (update_fields is not None and "username" not in update_fields):
+        return
+    refresh_snapshots_on_commit(instance.top_lists.values_list("pk", flat=True))
@@ -0,0 +1,932 @@
+import asyncio
+import threading
+from datetime import timedelta
+from io import StringIO
+
+from unittest import mock
+
+from asgiref.sync import sync_to_async
+from django.core.cache import cache
+from django.core.exceptions import ValidationError
+from django.core.management import call_command
+from django.db import IntegrityError, connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from apps.core.pagination import NEXT
+from apps.tops.caching import StaleWhileRevalidateCache
+from apps.tops.leaderboards import (
+    TRENDING,
+    compact_leaderboards,
+    get_top_lists,
+    rebuild_leaderboards,
+    record_vote,
+)
+from apps.tops import trending
+from apps.tops.models import (
+    LeaderboardScore,
+    Tag,
+    TopList,
+    TopListItem,
+    TrendingScore,
+    Vote,
+)
+from apps.tops.search import (
+    CHANGES_CACHE_KEY,
+    change_key,
+    get_search_index,
+    rebuild_search_index,
+    record_search_index_change,
+)
+from apps.tops.views import home_cache, home_paginator, rank_matches
+from apps.tops.votes import (
+    NO_VOTE,
+    VoteBuffer,
+    VoteBufferFull,
+    cast_vote,
+    retract_vote,
+)
+from apps.users.models import CustomUser
+from top_five import lifecycle
+from top_five.lifecycle import (
+    LifespanMiddleware,
+    register_shutdown_hook,
+    run_shutdown_hooks,
+)
+
+
+class TopListSnapshotTest(TestCase):
+
+    def setUp(self):
+        self.owner = CustomUser.objects.create_user(
+            username="myusername",
+            password="secure-password",
+        )
+        with self.captureOnCommitCallbacks(execute=True):
+            self.top_list = TopList.objects.create(owner=self.owner, name="Best movies")
+            for position, title in enumerate(["Alien", "Heat", "Ran"], start=1):
+                TopListItem.objects.create(
+                    top_list=self.top_list, position=position, title=title
+                )
+            self.top_list.tags.add(
+                Tag.objects.create(name="Movies"), Tag.objects.create(name="classics")
+            )
+
+    def get_snapshot(self):
+        return TopList.objects.get_snapshot(self.top_list.pk)
+
+    def test_snapshot_is_built_on_write(self):
+        """Test that the snapshot holds the items, tags, author and votes of
+        the list once the transaction commits."""
+        snapshot = self.get_snapshot()
+        self.assertEqual(snapshot["name"], "Best movies")
+        self.assertEqual(snapshot["author"], "myusername")
+        self.assertEqual(
+            [item["title"] for item in snapshot["items"]], ["Alien", "Heat", "Ran"]
+        )
+        self.assertEqual(snapshot["tags"], ["classics", "movies"])
+        self.assertEqual(snapshot["votes"], {"likes": 0, "dislikes": 0})
+
+    def test_snapshot_is_refreshed_on_item_and_tag_changes(self):
+        """Test that editing, deleting items and renaming or removing tags
+        refreshes the snapshot."""
+        with self.captureOnCommitCallbacks(execute=True):
+            item = self.top_list.items.get(position=1)
+            item.title = "Aliens"
+            item.save()
+            self.top_list.items.get(position=3).delete()
+        self.assertEqual(
+            [item["title"] for item in self.get_snapshot()["items"]],
+            ["Aliens", "Heat"],
+        )
+
+        with self.captureOnCommitCallbacks(execute=True):
+            tag = Tag.objects.get(name="movies")
+            tag.name = "films"
+            tag.save()
+        self.assertEqual(self.get_snapshot()["tags"], ["classics", "films"])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            Tag.objects.get(name="classics").delete()
+        self.assertEqual(self.get_snapshot()["tags"], ["films"])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.top_list.tags.clear()
+        self.assertEqual(self.get_snapshot()["tags"], [])
+
+    def test_snapshot_is_refreshed_on_username_change(self):
+        """Test that renaming the author refreshes the snapshot."""
+        with self.captureOnCommitCallbacks(execute=True):
+            self.owner.username = "johndoe"
+            self.owner.save()
+        self.assertEqual(self.get_snapshot()["author"], "johndoe")
+
+    def test_snapshot_is_refreshed_once_per_transaction(self):
+        """Test that a list written with several items is rebuilt once."""
+        with self.captureOnCommitCallbacks() as callbacks:
+            top_list = TopList.objects.create(owner=self.owner, name="Best books")
+            for position in range(1, 6):
+                TopListItem.objects.create(
+                    top_list=top_list, position=position, title=f"Book {position}"
+                )
+
+        with self.assertNumQueries(4):
+            for callback in callbacks:
+                callback()
+        self.assertEqual(len(TopList.objects.get_snapshot(top_list.pk)["items"]), 5)
+
+    def test_item_position_is_unique_and_limited(self):
+        """Test that a list holds at most one item per position from 1 to 5."""
+        with self.assertRaises(ValidationError):
+            TopListItem(top_list=self.top_list, position=6, title="Jaws").full_clean()
+
+        with self.assertRaises(IntegrityError):
+            TopListItem.objects.create(top_list=self.top_list, position=1, title="Jaws")
+
+
+class TopListDetailViewTest(TestCase):
+
+    def setUp(self):
+        owner = CustomUser.objects.create_user(
+            username="myusername",
+            password="secure-password",
+        )
+        with self.captureOnCommitCallbacks(execute=True):
+            self.top_list = TopList.objects.create(owner=owner, name="Best movies")
+
+    def test_detail_is_rendered_with_a_single_query(self):
+        """Test that the detail response costs one primary key read."""
+        url = reverse("tops:detail", args=[self.top_list.pk])
+        with self.assertNumQueries(1):
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()["name"], "Best movies")
+
+    def test_detail_of_missing_list_returns_404(self):
+        """Test that unknown lists return a 404 response."""
+        response = self.client.get(reverse("tops:detail", args=[0]))
+        self.assertEqual(response.status_code, 404)
+
+
+class VoteTest(TestCase):
+
+    def setUp(self):
+        self.owner = CustomUser.objects.create_user(
+            username="myusername",
+            password="secure-password",
+        )
+        self.voter = CustomUser.objects.create_user(
+            username="johndoe",
+            password="secure-password",
+        )
+        with self.captureOnCommitCallbacks(execute=True):
+            self.top_list = TopList.objects.create(owner=self.owner, name="Best movies")
+
+    def test_cast_and_retract_vote_update_totals_and_snapshot(self):
+        """Test that casting, changing and retracting a vote keeps the vote
+        totals of the list and its snapshot up to date."""
+        with self.captureOnCommitCallbacks(execute=True):
+            cast_vote(self.voter, self.top_list, Vote.LIKE)
+            cast_vote(self.owner, self.top_list, Vote.LIKE)
+        self.top_list.refresh_from_db()
+        self.assertEqual(self.top_list.likes_count, 2)
+        self.assertEqual(self.top_list.snapshot["votes"], {"likes": 2, "dislikes": 0})
+
+        with self.captureOnCommitCallbacks(execute=True):
+            cast_vote(self.voter, self.top_list, Vote.DISLIKE)
+        self.top_list.refresh_from_db()
+        self.assertEqual(self.top_list.snapshot["votes"], {"likes": 1, "dislikes": 1})
+
+        with self.captureOnCommitCallbacks(execute=True):
+            retract_vote(self.voter, self.top_list)
+            retract_vote(self.voter, self.top_list)
+        self.top_list.refresh_from_db()
+        self.assertEqual(self.top_list.snapshot["votes"], {"likes": 1, "dislikes": 0})
+        self.assertEqual(Vote.objects.count(), 1)
+
+    def test_likes_notify_the_owner(self):
+        """Test that the owner is notified of the likes of other users once
+        they are committed."""
+        with mock.patch("apps.tops.votes.notify_user") as notify_user:
+            with self.captureOnCommitCallbacks(execute=True):
+                cast_vote(self.voter, self.top_list, Vote.LIKE)
+                cast_vote(self.voter, self.top_list, Vote.LIKE)
+                cast_vote(self.owner, self.top_list, Vote.LIKE)
+                notify_user.assert_not_called()
+        notify_user.assert_called_once_with(
+            self.owner.pk, "like", {"top_list": self.top_list.pk, "user": self.voter.pk}
+        )
+
+
+class LeaderboardTest(TestCase):
+
+    def setUp(self):
+        self.owner = CustomUser.objects.create_user(
+            username="myusername",
+            password="secure-password",
+        )
+        self.voters = [
+            CustomUser.objects.create_user(
+                username=f"voter{number}", password="secure-password"
+            )
+            for number in range(4)
+        ]
+        self.top_lists = [
+            TopList.objects.create(owner=self.owner, name=f"List {number}")
+            for number in range(3)
+        ]
+
+    def vote(self, voter, top_list, value, days_ago):
+        """Casts a vote and moves its creation date to the given day."""
+        vote = cast_vote(voter, top_list, value)
+        voted_at = timezone.now() - timedelta(days=days_ago)
+        Vote.objects.filter(pk=vote.pk).update(created_at=voted_at)
+        return vote
+
+    def seed_votes(self):
+        """Records votes cast on different days through the incremental
+        path, as if each one was recorded on the day it was cast."""
+        first, second, third = self.top_lists
+        votes = [
+            (0, first, Vote.LIKE, 0),
+            (1, first, Vote.LIKE, 3),
+            (2, first, Vote.LIKE, 20),
+            (0, second, Vote.LIKE, 0),
+            (1, second, Vote.DISLIKE, 0),
+            (2, second, Vote.LIKE, 1),
+            (3, second, Vote.LIKE, 2),
+            (0, third, Vote.LIKE, 10),
+            (1, third, Vote.LIKE, 12),
+            (2, third, Vote.LIKE, 45),
+        ]
+        for voter, top_list, value, days_ago in votes:
+            voted_at = timezone.now() - timedelta(days=days_ago)
+            vote = Vote.objects.create(
+                user=self.voters[voter], top_list=top_list, value=value
+            )
+            Vote.objects.filter(pk=vote.pk).update(created_at=voted_at)
+            record_vote(top_list.pk, value, voted_at)
+
+    def ranking(self, window):
+        return [
+            (self.top_lists.index(TopList(pk=pk)), score)
+            for pk, score in get_top_lists(window)
+        ]
+
+    def test_incremental_and_rebuilt_leaderboards_match(self):
+        """Test that the leaderboards kept up to date vote by vote match the
+        ones rebuilt from the raw votes, for every window."""
+        self.seed_votes()
+        incremental = {
+            window: self.ranking(window)
+            for window, _ in LeaderboardScore.WINDOW_CHOICES
+        }
+
+        call_command("rebuild_leaderboards", stdout=StringIO())
+        rebuilt = {
+            window: self.ranking(window)
+            for window, _ in LeaderboardScore.WINDOW_CHOICES
+        }
+
+        self.assertEqual(incremental, rebuilt)
+        self.assertEqual(incremental["day"], [(0, 1)])
+        self.assertEqual(incremental["week"], [(0, 2), (1, 2)])
+        self.assertEqual(incremental["month"], [(0, 3), (1, 2), (2, 2)])
+
+    def test_vote_changes_are_applied_to_the_day_the_vote_was_cast(self):
+        """Test that changing an old vote updates the bucket of its day."""
+        vote = self.vote(self.voters[0], self.top_lists[0], Vote.LIKE, 3)
+        rebuild_leaderboards()
+        self.assertEqual(self.ranking("week"), [(0, 1)])
+
+        cast_vote(self.voters[0], self.top_lists[0], Vote.DISLIKE)
+        self.assertEqual(self.ranking("week"), [(0, -1)])
+        self.assertEqual(self.ranking("day"), [])
+
+        rebuild_leaderboards()
+        self.assertEqual(self.ranking("week"), [(0, -1)])
+
+    def test_compaction_rolls_windows_forward(self):
+        """Test that compacting on a later day drops the votes that left the
+        windows and the buckets older than the widest window."""
+        self.seed_votes()
+        compact_leaderboards(timezone.localdate() + timedelta(days=1))
+        self.assertEqual(self.ranking("day"), [])
+        self.assertEqual(self.ranking("week"), [(0, 2), (1, 2)])
+
+        call_command("compact_leaderboards", stdout=StringIO())
+        self.assertEqual(self.ranking("day"), [(0, 1)])
+
+        compact_leaderboards(timezone.localdate() + timedelta(days=40))
+        self.assertFalse(LeaderboardScore.objects.exists())
+
+
+class VoteBufferTest(TestCase):
+
+    def setUp(self):
+        self.owner = CustomUser.objects.create_user(
+            username="myusername",
+            password="secure-password",
+        )
+        self.voters = [
+            CustomUser.objects.create_user(
+                username=f"voter{number}", password="secure-password"
+            )
+            for number in range(3)
+        ]
+        self.top_lists = [
+            TopList.objects.create(owner=self.owner, name=f"List {number}")
+            for number in range(2)
+        ]
+        self.buffer = VoteBuffer(max_size=10, flush_size=10, flush_interval=None)
+
+    def submit(self, voter, top_list, value):
+        self.buffer.submit(self.voters[voter].pk, self.top_lists[top_list].pk, value)
+
+    def test_repeated_toggles_are_coalesced(self):
+        """Test that only the last vote of a user on a list is written."""
+        for value in [Vote.LIKE, Vote.DISLIKE, NO_VOTE, Vote.LIKE, Vote.DISLIKE]:
+            self.submit(0, 0, value)
+        self.assertEqual(len(self.buffer), 1)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.buffer.flush()
+        self.assertEqual(len(self.buffer), 0)
+        self.assertEqual(Vote.objects.get().value, Vote.DISLIKE)
+        top_list = TopList.objects.get(pk=self.top_lists[0].pk)
+        self.assertEqual(top_list.snapshot["votes"], {"likes": 0, "dislikes": 1})
+
+    def test_counters_and_snapshots_are_written_together(self):
+        """Test that a flush writes the counters and snapshot votes of all
+        its lists with one UPDATE, without rebuilding the snapshots."""
+        TopList.objects.refresh_snapshots([top_list.pk for top_list in self.top_lists])
+        self.submit(0, 0, Vote.LIKE)
+        self.submit(1, 0, Vote.DISLIKE)
+        self.submit(2, 1, Vote.LIKE)
+        with CaptureQueriesContext(connection) as queries:
+            with self.captureOnCommitCallbacks(execute=True):
+                self.buffer.flush()
+        updates = [
+            query["sql"]
+            for query in queries
+            if query["sql"].startswith('UPDATE "tops_toplist"')
+        ]
+        self.assertEqual(len(updates), 1)
+        first, second = TopList.objects.order_by("pk")
+        self.assertEqual(first.snapshot["votes"], {"likes": 1, "dislikes": 1})
+        self.assertEqual(second.snapshot["votes"], {"likes": 1, "dislikes": 0})
+        self.assertEqual(first.snapshot["name"], "List 0")
+
+    def test_flush_during_a_refresh_is_not_overwritten(self):
+        """Test that a snapshot refresh reading a list before a flush and
+        writing it after does not overwrite the new vote totals."""
+        TopList.objects.refresh_snapshots([self.top_lists[0].pk])
+        self.submit(0, 0, Vote.LIKE)
+        build_snapshot = TopList.build_snapshot
+        flushed = []
+
+        def flush_then_build(top_list):
+            if not flushed:
+                flushed.append(self.buffer.flush())
+            return build_snapshot(top_list)
+
+        with mock.patch.object(TopList, "build_snapshot", flush_then_build):
+            TopList.objects.refresh_snapshots([self.top_lists[0].pk])
+        top_list = TopList.objects.get(pk=self.top_lists[0].pk)
+        self.assertEqual(top_list.likes_count, 1)
+        self.assertEqual(top_list.snapshot["votes"], {"likes": 1, "dislikes": 0})
+
+    def test_votes_cancelling_out_stamp_the_list(self):
+        """Test that a flush whose votes leave the counters unchanged still
+        marks the list for the trending scorer."""
+        self.submit(0, 0, Vote.LIKE)
+        self.buffer.flush()
+        TopList.objects.update(votes_changed_at=None)
+        self.submit(0, 0, NO_VOTE)
+        self.submit(1, 0, Vote.LIKE)
+        self.buffer.flush()
+        top_list = TopList.objects.get(pk=self.top_lists[0].pk)
+        self.assertEqual(top_list.likes_count, 1)
+        self.assertIsNotNone(top_list.votes_changed_at)
+
+    def test_buffered_likes_notify_the_owners(self):
+        """Test that a flush notifies the owners of the new likes with a
+        single query."""
+        self.submit(0, 0, Vote.LIKE)
+        self.submit(1, 1, Vote.LIKE)
+        self.submit(2, 1, Vote.DISLIKE)
+        with self.captureOnCommitCallbacks() as callbacks:
+            self.buffer.flush()
+
+        with mock.patch("apps.tops.votes.notify_user") as notify_user:
+            with self.assertNumQueries(1):
+                callbacks[-1]()
+        self.assertEqual(
+            [call.args[2]["top_list"] for call in notify_user.call_args_list],
+            [self.top_lists[0].pk, self.top_lists[1].pk],
+        )
+
+    def test_flush_applies_aggregated_deltas(self):
+        """Test that a flush creates, changes and removes votes and leaves the
+        totals and leaderboards as individual votes would."""
+        cast_vote(self.voters[0], self.top_lists[0], Vote.LIKE)
+        cast_vote(self.voters[1], self.top_lists[0], Vote.LIKE)
+
+        self.submit(0, 0, NO_VOTE)
+        self.submit(1, 0, Vote.DISLIKE)
+        self.submit(2, 0, Vote.LIKE)
+        self.submit(0, 1, Vote.LIKE)
+        self.submit(1, 1, Vote.LIKE)
+        self.buffer.flush()
+
+        first, second = TopList.objects.order_by("pk")
+        self.assertEqual((first.likes_count, first.dislikes_count), (1, 1))
+        self.assertEqual((second.likes_count, second.dislikes_count), (2, 0))
+        self.assertEqual(Vote.objects.count(), 4)
+
+        incremental = get_top_lists("day")
+        rebuild_leaderboards()
+        self.assertEqual(incremental, get_top_lists("day"))
+        self.assertEqual(incremental, [(second.pk, 2)])
+
+    def test_buffer_is_flushed_when_reaching_flush_size(self):
+        """Test that the submit reaching flush_size writes the buffer."""
+        self.buffer.flush_size = 2
+        self.submit(0, 0, Vote.LIKE)
+        self.assertEqual(Vote.objects.count(), 0)
+        self.submit(1, 0, Vote.LIKE)
+        self.assertEqual(Vote.objects.count(), 2)
+        self.assertEqual(len(self.buffer), 0)
+
+    def test_full_buffer_applies_backpressure(self):
+        """Test that a full buffer is flushed by the producer and that it
+        raises VoteBufferFull when another flush does not finish in time."""
+        self.buffer.max_size = 2
+        self.submit(0, 0, Vote.LIKE)
+        self.submit(1, 0, Vote.LIKE)
+        self.submit(2, 0, Vote.LIKE)
+        self.assertEqual(Vote.objects.count(), 2)
+        self.assertEqual(len(self.buffer), 1)
+
+        self.submit(0, 1, Vote.LIKE)
+        self.buffer.block_timeout = 0
+        self.buffer._flush_lock.acquire()
+        try:
+            with self.assertRaises(VoteBufferFull):
+                self.submit(1, 1, Vote.LIKE)
+            # Votes already buffered can still be replaced
+            self.submit(0, 1, Vote.DISLIKE)
+        finally:
+            self.buffer._flush_lock.release()
+
+    def isolate_shutdown_hooks(self):
+        # The hooks of the process close the connection of the test
+        patcher = mock.patch.object(lifecycle, "_shutdown_hooks", [])
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_buffer_is_flushed_on_shutdown(self):
+        """Test that the shutdown hooks flush the pending votes."""
+        self.isolate_shutdown_hooks()
+        register_shutdown_hook(self.buffer.close)
+        self.submit(0, 0, Vote.LIKE)
+        run_shutdown_hooks()
+        self.assertEqual(Vote.objects.count(), 1)
+
+    def test_lifespan_shutdown_runs_shutdown_hooks(self):
+        """Test that the ASGI lifespan shutdown event runs the hooks."""
+        self.isolate_shutdown_hooks()
+        calls = []
+        register_shutdown_hook(lambda: calls.append("shutdown"))
+        messages = [{"type": "lifespan.startup"}, {"type": "lifespan.shutdown"}]
+        sent = []
+
+        async def receive():
+            return messages.pop(0)
+
+        async def send(message):
+            sent.append(message["type"])
+
+        asyncio.run(LifespanMiddleware(None)({"type": "lifespan"}, receive, send))
+        self.assertEqual(
+            sent, ["lifespan.startup.complete", "lifespan.shutdown.complete"]
+        )
+        self.assertEqual(calls, ["shutdown"])
+
+    def test_lifespan_shutdown_runs_in_the_thread_of_the_connections(self):
+        """Test that the hooks run in the thread where the sync code called
+        outside the requests opened its connections, so closing them there
+        closes those."""
+        self.isolate_shutdown_hooks()
+        threads = []
+        register_shutdown_hook(lambda: threads.append(threading.get_ident()))
+        messages = [{"type": "lifespan.startup"}, {"type": "lifespan.shutdown"}]
+
+        async def receive():
+            threads.append(await sync_to_async(threading.get_ident)())
+            return messages.pop(0)
+
+        async def send(message):
+            pass
+
+        asyncio.run(LifespanMiddleware(None)({"type": "lifespan"}, receive, send))
+        self.assertEqual(len(set(threads)), 1)
+
+
+class SearchIndexTest(TestCase):
+
+    def setUp(self):
+        self.owner = CustomUser.objects.create_user(
+            username="myusername",
+            password="secure-password",
+        )
+        with self.captureOnCommitCallbacks(execute=True):
+            self.movies = Tag.objects.create(name="movies")
+            self.music = Tag.objects.create(name="music")
+            self.alien = TopList.objects.create(owner=self.owner, name="Alien films")
+            self.aliens = TopList.objects.create(
+                owner=self.owner, name="Best aliens ever"
+            )
+            self.sci_fi = TopList.objects.create(
+                owner=self.owner, name="Sci-fi like Alien"
+            )
+            self.albums = TopList.objects.create(owner=self.owner, name="Albums")
+            self.alien.tags.add(self.movies)
+            self.sci_fi.tags.add(self.movies)
+            self.albums.tags.add(self.music)
+        rebuild_search_index()
+
+    def search(self, query=None, tags=None):
+        return get_search_index().search(query, tags)
+
+    def test_name_filter_matches_like_icontains(self):
+        """Test that the name filter finds the same lists as icontains,
+        whole word matches first and newest first within each rank."""
+        for query in ["alien", "ALIENS", "ien", "al", "bums", "fi like", "zzz"]:
+            expected = set(
+                TopList.objects.filter(name__icontains=query).values_list(
+                    "pk", flat=True
+                )
+            )
+            self.assertEqual(set(self.search(query)), expected, query)
+
+        self.assertEqual(
+            self.search("alien"), [self.sci_fi.pk, self.alien.pk, self.aliens.pk]
+        )
+
+    def test_tag_filter(self):
+        """Test filtering by one or more tags, alone and with a name."""
+        self.assertEqual(self.search(tags=["Movies"]), [self.sci_fi.pk, self.alien.pk])
+        self.assertEqual(self.search("films", ["movies"]), [self.alien.pk])
+        self.assertEqual(self.search(tags=["movies", "music"]), [])
+        self.assertEqual(self.search(tags=["unknown"]), [])
+
+    def test_index_is_updated_from_signals(self):
+        """Test that writes to lists and tags are reflected once committed."""
+        with self.captureOnCommitCallbacks(execute=True):
+            self.albums.name = "Alien albums"
+            self.albums.save()
+            self.alien.delete()
+            self.aliens.tags.add(self.music)
+            self.music.name = "songs"
+            self.music.save()
+            self.sci_fi.tags.remove(self.movies)
+        self.assertEqual(
+            self.search("alien"), [self.albums.pk, self.sci_fi.pk, self.aliens.pk]
+        )
+        self.assertEqual(self.search(tags=["songs"]), [self.albums.pk, self.aliens.pk])
+        self.assertEqual(self.search(tags=["music"]), [])
+        self.assertEqual(self.search(tags=["movies"]), [])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.music.top_lists.clear()
+            self.movies.delete()
+        self.assertEqual(self.search(tags=["songs"]), [])
+
+    def test_workers_rebuild_when_the_generation_changes(self):
+        """Test that the rebuild command makes the process index reload."""
+        index = get_search_index()
+        TopList.objects.filter(pk=self.albums.pk).update(name="Alien albums")
+        self.assertIs(get_search_index(), index)
+
+        call_command("rebuild_search_index", stdout=StringIO())
+        self.assertIsNot(get_search_index(), index)
+        self.assertIn(self.albums.pk, self.search("alien"))
+
+    def refresh_in_background(self, index):
+        """Returns the index of the process after it noticed the changes of
+        the other workers and refreshed in the background."""
+        with mock.patch("apps.tops.search.threading") as threading:
+            with override_settings(TOPS_SEARCH_INDEX_REFRESH_INTERVAL=60):
+                self.assertIs(get_search_index(), index)
+            threading.Thread.assert_not_called()
+            with override_settings(TOPS_SEARCH_INDEX_REFRESH_INTERVAL=0):
+                self.assertIs(get_search_index(), index)
+        refresh = threading.Thread.call_args.kwargs
+        with mock.patch("apps.tops.search.connection"):
+            refresh["target"](*refresh["args"])
+        return get_search_index()
+
+    def test_workers_catch_up_with_the_changes_of_other_workers(self):
+        """Test that the changes recorded by other workers are reloaded in
+        the background, and that those of the process are not."""
+        index = get_search_index()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.albums.name = "Alien albums"
+            self.albums.save()
+        with mock.patch("apps.tops.search.threading") as threading:
+            with override_settings(TOPS_SEARCH_INDEX_REFRESH_INTERVAL=0):
+                self.assertIs(get_search_index(), index)
+            threading.Thread.assert_not_called()
+
+        # Another worker renames a list and tags another one
+        TopList.objects.filter(pk=self.alien.pk).update(name="Films")
+        record_search_index_change(top_list_ids=[self.alien.pk])
+        self.aliens.tags.through.objects.create(
+            toplist_id=self.aliens.pk, tag_id=self.movies.pk
+        )
+        record_search_index_change(top_list_ids=[self.aliens.pk])
+        with self.assertNumQueries(2):
+            self.assertIs(self.refresh_in_background(index), index)
+        self.assertEqual(
+            self.search("alien"), [self.albums.pk, self.sci_fi.pk, self.aliens.pk]
+        )
+        self.assertEqual(
+            self.search(tags=["movies"]),
+            [self.sci_fi.pk, self.aliens.pk, self.alien.pk],
+        )
+
+    def test_workers_rebuild_when_changes_expired(self):
+        """Test that the index is rebuilt when the cache no longer holds the
+        changes it missed."""
+        index = get_search_index()
+        TopList.objects.filter(pk=self.alien.pk).update(name="Films")
+        record_search_index_change(top_list_ids=[self.alien.pk])
+        cache.delete(change_key(cache.get(CHANGES_CACHE_KEY)))
+        rebuilt = self.refresh_in_background(index)
+        self.assertIsNot(rebuilt, index)
+        self.assertNotIn(self.alien.pk, self.search("alien"))
+
+    def test_search_view_fetches_results_in_one_query(self):
+        """Test that the search endpoint returns the ranked snapshots with a
+        single query once the index is built."""
+        with self.assertNumQueries(1):
+            response = self.client.get(
+                reverse("tops:search"), {"q": "alien", "tag": "movies"}
+            )
+        self.assertEqual(
+            [result["name"] for result in response.json()["results"]],
+            ["Sci-fi like Alien", "Alien films"],
+        )
+
+    def test_benchmark_search_command(self):
+        """Test that the benchmark runs and leaves no data behind."""
+        output = StringIO()
+        call_command("benchmark_search", sizes=[30], queries=3, stdout=output)
+        self.assertIn("30 lists", output.getvalue())
+        self.assertEqual(TopList.objects.count(), 4)
+
+
+class StaleWhileRevalidateCacheTest(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.cache = StaleWhileRevalidateCache(
+            "default", "test", ttl=60, stale_ttl=60, lock_timeout=0.2
+        )
+        self.computed = []
+        # Run the background refreshes inline to observe them
+        self.cache._spawn = lambda function: function()
+
+    def compute(self):
+        self.computed.append(len(self.computed) + 1)
+        return f"value {len(self.computed)}"
+
+    def expire(self, key):
+        value, _expires_at = cache.get(key)
+        cache.set(key, (value, 0))
+
+    def test_fresh_entries_are_served_from_cache(self):
+        """Test that a value is computed once while fresh."""
+        key = self.cache.make_key("day", "", [], 1)
+        self.assertEqual(self.cache.get_or_compute(key, self.compute), "value 1")
+        self.assertEqual(self.cache.get_or_compute(key, self.compute), "value 1")
+        self.assertEqual(self.computed, [1])
+        stats = self.cache.stats.as_dict()
+        self.assertEqual((stats["hits"], stats["misses"]), (1, 1))
+        self.assertEqual(stats["hit_ratio"], 0.5)
+        self.assertEqual(stats["recomputes"], 1)
+
+    def test_stale_entries_are_served_while_revalidating(self):
+        """Test that an expired value is returned while it is recomputed."""
+        key = self.cache.make_key("stale")
+        self.cache.get_or_compute(key, self.compute)
+        self.expire(key)
+
+        self.assertEqual(self.cache.get_or_compute(key, self.compute), "value 1")
+        self.assertEqual(self.cache.get_or_compute(key, self.compute), "value 2")
+        self.assertEqual(self.cache.stats.stale_hits, 1)
+
+    def test_only_the_lock_holder_recomputes(self):
+        """Test that an entry is not recomputed while another worker holds
+        its lock, and that waiters use its result."""
+        key = self.cache.make_key("single-flight")
+        self.cache.get_or_compute(key, self.compute)
+        self.expire(key)
+
+        cache.add(f"{key}:lock", True)
+        self.assertEqual(self.cache.get_or_compute(key, self.compute), "value 1")
+        self.assertEqual(self.computed, [1])
+
+        cache.delete(key)
+        with mock.patch.object(
+            self.cache, "_wait_for", return_value="value from holder"
+        ):
+            self.assertEqual(
+                self.cache.get_or_compute(key, self.compute), "value from holder"
+            )
+        self.assertEqual(self.computed, [1])
+
+        # The holder never finishes: compute after waiting lock_timeout
+        self.assertEqual(self.cache.get_or_compute(key, self.compute), "value 2")
+
+
+class HomeViewTest(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        home_cache.stats.reset()
+        owner = CustomUser.objects.create_user(
+            username="myusername",
+            password="secure-password",
+        )
+        with self.captureOnCommitCallbacks(execute=True):
+            self.movies = TopList.objects.create(owner=owner, name="Best movies")
+            self.books = TopList.objects.create(owner=owner, name="Best books")
+            self.books.tags.add(Tag.objects.create(name="reading"))
+            cast_vote(owner, self.movies, Vote.LIKE)
+            cast_vote(owner, self.books, Vote.LIKE)
+            voter = CustomUser.objects.create_user(
+                username="johndoe", password="secure-password"
+            )
+            cast_vote(voter, self.books, Vote.LIKE)
+        rebuild_search_index()
+        trending.score_trending()
+
+    def test_home_lists_popular_tops(self):
+        """Test that the home page ranks lists by popularity in the window."""
+        response = self.client.get(reverse("home"))
+        content = response.content.decode()
+        self.assertEqual(response.status_code, 200)
+        self.assertLess(content.index("Best books"), content.index("Best movies"))
+
+        response = self.client.get(reverse("home"), {"window": "month", "q": "movie"})
+        self.assertContains(response, "Best movies")
+        self.assertNotContains(response, "Best books")
+
+        response = self.client.get(reverse("home"), {"tag": "Reading"})
+        self.assertContains(response, "Best books")
+        self.assertNotContains(response, "Best movies")
+
+    def test_filters_rank_every_match(self):
+        """Test that filtered pages rank all the matching lists, those
+        without votes last, whatever the lists ranked above them."""
+        with self.captureOnCommitCallbacks(execute=True):
+            games = TopList.objects.create(owner=self.movies.owner, name="Best games")
+        response = self.client.get(reverse("home"), {"q": "best"})
+        content = response.content.decode()
+        self.assertLess(content.index("Best books"), content.index("Best movies"))
+        self.assertLess(content.index("Best movies"), content.index("Best games"))
+
+        matches = get_search_index().search("best")
+        for lookup_max in (10, 1):
+            with mock.patch("apps.tops.views.SCORE_LOOKUP_MAX", lookup_max):
+                with self.assertNumQueries(1):
+                    rows = rank_matches(TRENDING, matches)
+            self.assertEqual(
+                [row["top_list_id"] for row in rows],
+                [self.books.pk, self.movies.pk, games.pk],
+            )
+
+    def test_home_fragment_is_cached_per_window_filter_and_page(self):
+        """Test that repeated visits are served without querying the
+        database and that other filters get their own entry."""
+        self.client.get(reverse("home"))
+        with self.assertNumQueries(0):
+            response = self.client.get(reverse("home"))
+        self.assertContains(response, "Best movies")
+
+        cursor = home_paginator.encode_cursor(
+            TrendingScore.objects.values("top_list_id", "score").get(
+                top_list=self.books
+            ),
+            NEXT,
+        )
+        response = self.client.get(reverse("home"), {"cursor": cursor})
+        self.assertContains(response, "Best movies")
+        self.assertNotContains(response, "Best books")
+        stats = home_cache.stats.as_dict()
+        self.assertEqual((stats["hits"], stats["misses"]), (1, 2))
+
+
+class TrendingTest(TestCase):
+
+    def setUp(self):
+        self.owner = CustomUser.objects.create_user(username="owner", password="x")
+        self.voters = [
+            CustomUser.objects.create_user(username=f"voter{number}", password="x")
+            for number in range(3)
+        ]
+        self.top_lists = [
+            TopList.objects.create(owner=self.owner, name=f"List {number}")
+            for number in range(3)
+        ]
+
+    def scores(self):
+        return dict(TrendingScore.objects.values_list("top_list_id", "score"))
+
+    def test_votes_decay(self):
+        """Test that a vote counts half as much after a half life and that
+        the vectorized and pure Python scores agree."""
+        now = trending.EPOCH + 1000 * 86400
+        list_ids = [1, 1, 2, 3, 3, 4, 4]
+        timestamps = [now - 86400, now - 86400, now, now, now - 3600, now, now]
+        values = [1, 1, 1, -1, -1, 1, -1]
+        for vectorized in (True, False):
+            ids, scores = trending.hot_scores(
+                list_ids, timestamps, values, 86400, vectorized
+            )
+            self.assertEqual(ids, [1, 2, 3, 4])
+            self.assertAlmostEqual(scores[0], scores[1])
+            self.assertLess(scores[2], -scores[1])
+            self.assertEqual(scores[3], 0.0)
+            self.assertAlmostEqual(scores[1], 1000, places=6)
+
+    def test_incremental_runs(self):
+        """Test that runs after the first one only rescore the lists voted on
+        since, retracted votes included."""
+        cast_vote(self.voters[0], self.top_lists[0], Vote.LIKE)
+        cast_vote(self.voters[1], self.top_lists[1], Vote.LIKE)
+        self.assertEqual(trending.score_trending(chunk_size=2), 3)
+        scores = self.scores()
+        self.assertGreater(scores[self.top_lists[0].pk], 0)
+        self.assertEqual(scores[self.top_lists[2].pk], 0)
+
+        TopList.objects.update(votes_changed_at=timezone.now() - timedelta(hours=1))
+        retract_vote(self.voters[1], self.top_lists[1])
+        cast_vote(self.voters[2], self.top_lists[0], Vote.LIKE)
+        with mock.patch.object(trending, "np", None):
+            self.assertEqual(trending.score_trending(), 2)
+        new_scores = self.scores()
+        self.assertGreater(
+            new_scores[self.top_lists[0].pk], scores[self.top_lists[0].pk]
+        )
+        self.assertEqual(new_scores[self.top_lists[1].pk], 0)
+
+        self.assertEqual(trending.score_trending(full=True), 3)
+        self.assertEqual(self.scores(), new_scores)
+
+    def test_command(self):
+        """Test that the score_trending command reports the lists rescored."""
+        out = StringIO()
+        call_command("score_trending", "--full", stdout=out)
+        self.assertIn("Rescored 3 lists.", out.getvalue())
+
+
+class UserTopListsViewTest(TestCase):
+
+    def setUp(self):
+        self.owner = CustomUser.objects.create_user(username="owner", password="x")
+        with self.captureOnCommitCallbacks(execute=True):
+            self.top_lists = [
+                TopList.objects.create(owner=self.owner, name=f"List {number}")
+                for number in range(25)
+            ]
+        TopList.objects.create(
+            owner=CustomUser.objects.create_user(username="other", password="x"),
+            name="Other list",
+        )
+
+    def test_lists_are_paged_newest_first(self):
+        """Test that the lists of the user are listed newest first across
+        pages."""
+        url = reverse("tops:user_lists", args=["OWNER"])
+        first = self.client.get(url).json()
+        second = self.client.get(url, {"cursor": first["next"]}).json()
+        names = [snapshot["name"] for snapshot in first["results"] + second["results"]]
+        self.assertEqual(names, [f"List {number}" for number in range(24, -1, -1)])
+        self.assertIsNone(second["next"])
+        self.assertIsNotNone(second["previous"])
+
+    def test_unknown_user_and_invalid_cursor(self):
+        """Test the errors for unknown users and forged cursors."""
+        self.assertEqual(
+            self.client.get(reverse("tops:user_lists", args=["nobody"])).status_code,
+            404,
+        )
+        response = self.client.get(
+            reverse("tops:user_lists", args=["owner"]), {"cursor": "forged"}
+        )
+        self.assertEqual(response.status_code, 400)
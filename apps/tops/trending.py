@@ -0,0 +1,167 @@
+"""
+Trending scores of the lists, where each vote counts for less as it ages.
+
+A vote cast at time t weighs 2 ** ((t - EPOCH) / half_life), so it loses half
+of its weight relative to newer votes every half life. The weights grow with
+time instead of shrinking, which keeps the score of a list valid until it
+gets new votes: only the lists whose votes changed since the last run are
+rescored. The score stored is sign(S) * log2(1 + |S|) of the weighted sum S
+of the votes, computed in log space so it never overflows; a vote cast one
+half life later counts as much as twice the votes.
+"""
+
+import math
+from datetime import datetime, timedelta, timezone as dt_timezone
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import FloatField, Func, Max
+from django.utils import timezone
+
+from apps.tops.models import TopList, TrendingScore, Vote
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+EPOCH = datetime(2024, 1, 1, tzinfo=dt_timezone.utc).timestamp()
+
+
+class Epoch(Func):
+    """POSIX timestamp of a datetime, computed by the database so the rows
+    are not converted to aware datetimes one at a time."""
+
+    output_field = FloatField()
+
+    def as_postgresql(self, compiler, connection, **extra_context):
+        return self.as_sql(
+            compiler, connection, template="EXTRACT(EPOCH FROM %(expressions)s)"
+        )
+
+    def as_sqlite(self, compiler, connection, **extra_context):
+        return self.as_sql(
+            compiler,
+            connection,
+            template="(julianday(%(expressions)s) - 2440587.5) * 86400.0",
+        )
+
+    def as_mysql(self, compiler, connection, **extra_context):
+        return self.as_sql(
+            compiler, connection, template="UNIX_TIMESTAMP(%(expressions)s)"
+        )
+
+
+def _hot_scores_numpy(list_ids, timestamps, values, half_life):
+    ids = np.asarray(list_ids, dtype=np.int64)
+    ages = (np.asarray(timestamps, dtype=np.float64) - EPOCH) / half_life
+    starts = np.flatnonzero(np.concatenate(([True], ids[1:] != ids[:-1])))
+    sizes = np.diff(np.append(starts, len(ids)))
+    # Weights are taken relative to the newest vote of each list, so they
+    # stay within [0, 1] however far from the epoch the votes are
+    peaks = np.maximum.reduceat(ages, starts)
+    weighted = np.add.reduceat(
+        np.asarray(values, dtype=np.float64) * np.exp2(ages - np.repeat(peaks, sizes)),
+        starts,
+    )
+    # log2(1 + |S|) with |S| = 2 ** peak * |weighted|, which is 0 for lists
+    # whose votes cancel out
+    with np.errstate(divide="ignore"):
+        magnitudes = np.logaddexp2(0, peaks + np.log2(np.abs(weighted)))
+    return ids[starts].tolist(), (np.sign(weighted) * magnitudes).tolist()
+
+
+def _hot_scores_python(list_ids, timestamps, values, half_life):
+    ids, scores = [], []
+    start = 0
+    for end in range(1, len(list_ids) + 1):
+        if end < len(list_ids) and list_ids[end] == list_ids[start]:
+            continue
+        ages = [(timestamp - EPOCH) / half_life for timestamp in timestamps[start:end]]
+        peak = max(ages)
+        weighted = sum(
+            value * 2 ** (age - peak) for age, value in zip(ages, values[start:end])
+        )
+        score = 0.0
+        if weighted:
+            exponent = peak + math.log2(abs(weighted))
+            if exponent > 0:
+                magnitude = exponent + math.log1p(2**-exponent) / math.log(2)
+            else:
+                magnitude = math.log1p(2**exponent) / math.log(2)
+            score = math.copysign(magnitude, weighted)
+        ids.append(list_ids[start])
+        scores.append(score)
+        start = end
+    return ids, scores
+
+
+def hot_scores(list_ids, timestamps, values, half_life, vectorized=None):
+    """Returns the ids of the lists and their trending scores, for votes
+    given as parallel sequences of list ids, POSIX timestamps and values,
+    grouped by list. Uses NumPy when it is installed, unless vectorized is
+    False."""
+    if not len(list_ids):
+        return [], []
+    if vectorized is None:
+        vectorized = np is not None
+    if vectorized:
+        return _hot_scores_numpy(list_ids, timestamps, values, half_life)
+    return _hot_scores_python(list_ids, timestamps, values, half_life)
+
+
+def _chunks(items, size):
+    for start in range(0, len(items), size):
+        yield items[start : start + size]
+
+
+def get_watermark():
+    """Returns when the last run that rescored lists started, or None."""
+    return TrendingScore.objects.aggregate(watermark=Max("scored_at"))["watermark"]
+
+
+def score_trending(full=False, chunk_size=None, half_life=None):
+    """Rescores the lists whose votes changed since the watermark of the last
+    run, or every list when full is True or no run happened yet, and
+    returns the number of lists rescored. Lists are handled chunk_size at
+    a time: their votes are read in one query, scored and the scores
+    written with one bulk upsert."""
+    chunk_size = chunk_size or settings.TOPS_TRENDING_CHUNK_SIZE
+    half_life = half_life or settings.TOPS_TRENDING_HALF_LIFE
+    started = timezone.now()
+
+    watermark = None if full else get_watermark()
+    top_lists = TopList.objects.order_by("pk")
+    if watermark is not None:
+        # Votes committed after the previous run read them may carry an
+        # earlier timestamp, the overlap picks them up
+        top_lists = top_lists.filter(
+            votes_changed_at__gt=watermark
+            - timedelta(seconds=settings.TOPS_TRENDING_WATERMARK_OVERLAP)
+        )
+
+    rescored = 0
+    for chunk in _chunks(list(top_lists.values_list("pk", flat=True)), chunk_size):
+        votes = (
+            Vote.objects.filter(top_list_id__in=chunk)
+            .order_by("top_list_id")
+            .values_list("top_list_id", Epoch("created_at"), "value")
+        )
+        rows = list(votes.iterator(chunk_size=10_000))
+        list_ids, timestamps, values = zip(*rows) if rows else ((), (), ())
+
+        scores = dict.fromkeys(chunk, 0.0)
+        scores.update(zip(*hot_scores(list_ids, timestamps, values, half_life)))
+        with transaction.atomic():
+            TrendingScore.objects.bulk_create(
+                [
+                    TrendingScore(top_list_id=pk, score=score, scored_at=started)
+                    for pk, score in scores.items()
+                ],
+                batch_size=1000,
+                update_conflicts=True,
+                unique_fields=["top_list"],
+                update_fields=["score", "scored_at"],
+            )
+        rescored += len(chunk)
+    return rescored
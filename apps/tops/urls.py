@@ -0,0 +1,11 @@
+from django.urls import path
+
+from apps.tops import views
+
+app_name = "tops"
+
+urlpatterns = [
+    path("<int:pk>/", views.top_list_detail, name="detail"),
+    path("search/", views.top_list_search, name="search"),
+    path("users/<str:username>/", views.user_top_lists, name="user_lists"),
+]
@@ -0,0 +1,178 @@
+from urllib.parse import urlencode
+
+from django.conf import settings
+from django.db import connection
+from django.http import Http404, JsonResponse
+from django.shortcuts import render
+from django.template.loader import render_to_string
+from django.utils.safestring import mark_safe
+from django.views.decorators.http import require_GET
+
+from apps.core.instrumentation import query_budget
+from apps.core.pagination import CursorPaginator, InvalidCursor
+from apps.tops.caching import StaleWhileRevalidateCache
+from apps.tops.leaderboards import RANKINGS, TRENDING, ranking
+from apps.tops.models import TopList
+from apps.tops.search import get_search_index, normalize, search_top_lists
+from apps.users.models import CustomUser
+
+SEARCH_MAX_LIMIT = 100
+
+# Most matches whose scores are looked up by id when ranking the filtered
+# lists, beyond which the whole ranking of the window is read instead
+SCORE_LOOKUP_MAX = 10000
+
+user_lists_paginator = CursorPaginator(
+    ("-created_at", "-id"), page_size=20, salt="tops.user-lists"
+)
+
+home_cache = StaleWhileRevalidateCache(
+    settings.TOPS_HOME_CACHE_ALIAS,
+    "tops:home",
+    ttl=settings.TOPS_HOME_CACHE_TTL,
+    stale_ttl=settings.TOPS_HOME_CACHE_STALE_TTL,
+)
+
+
+home_paginator = CursorPaginator(
+    ("-score", "top_list_id"), settings.TOPS_HOME_PAGE_SIZE, salt="tops.home"
+)
+
+
+def rank_matches(window, ids):
+    """Returns the rows of the given lists sorted in the ordering of the
+    home page, with a single query reading their scores in the window.
+    Lists without votes in the window have a score of 0."""
+    scores = ranking(window)
+    lookup_max = connection.features.max_query_params or SCORE_LOOKUP_MAX
+    if len(ids) <= min(lookup_max, SCORE_LOOKUP_MAX):
+        scores = scores.filter(top_list_id__in=ids)
+    scores = dict(scores.values_list("top_list_id", "score"))
+    return sorted(
+        ({"top_list_id": pk, "score": scores.get(pk, 0)} for pk in ids),
+        key=lambda row: (-row["score"], row["top_list_id"]),
+    )
+
+
+def get_popular_snapshots(window, query, tags, cursor=None):
+    """Returns the snapshots of a page of the most popular lists of the
+    window that match the filters, and the CursorPage they come from."""
+    if query or tags:
+        matches = get_search_index().search(query, tags)
+        page = home_paginator.page_of_list(rank_matches(window, matches), cursor)
+    else:
+        page = home_paginator.page(
+            ranking(window).values("top_list_id", "score"), cursor
+        )
+
+    page_ids = [row["top_list_id"] for row in page]
+    snapshots = dict(
+        TopList.objects.filter(pk__in=page_ids).values_list("pk", "snapshot")
+    )
+    top_lists = [snapshots[pk] for pk in page_ids if pk in snapshots]
+    return top_lists, page
+
+
+def render_home_fragment(window, query, tags, cursor=None):
+    top_lists, page = get_popular_snapshots(window, query, tags, cursor)
+    return render_to_string(
+        "tops/_top_lists.html",
+        {
+            "top_lists": top_lists,
+            "page": page,
+            "querystring": urlencode(
+                {"window": window, "q": query, "tag": tags}, doseq=True
+            ),
+        },
+    )
+
+
+# Reloading the search index after rebuild_search_index() takes three more
+# queries
+@query_budget(5)
+@require_GET
+def home(request):
+    """Home page with the trending lists, or the most popular lists of the
+    day, week or month, filtered by name and tag and paged with cursors. The
+    list fragment is the same for every visitor, so it is cached per window,
+    filters and cursor."""
+    window = request.GET.get("window")
+    if window not in dict(RANKINGS):
+        window = TRENDING
+    query = normalize(request.GET.get("q", ""))
+    tags = sorted(
+        {tag for value in request.GET.getlist("tag") for tag in value.lower().split()}
+    )
+    cursor = request.GET.get("cursor") or None
+    if cursor is not None:
+        try:
+            home_paginator.decode_cursor(cursor)
+        except InvalidCursor:
+            cursor = None
+
+    fragment = home_cache.get_or_compute(
+        home_cache.make_key(window, query, tags, cursor),
+        lambda: render_home_fragment(window, query, tags, cursor),
+    )
+    return render(
+        request,
+        "tops/home.html",
+        {
+            "fragment": mark_safe(fragment),
+            "window": window,
+            "windows": RANKINGS,
+            "query": query,
+            "tags": tags,
+        },
+    )
+
+
+@query_budget(1)
+@require_GET
+def top_list_detail(request, pk):
+    """Returns a top list rendered from its denormalized snapshot."""
+    try:
+        snapshot = TopList.objects.get_snapshot(pk)
+    except TopList.DoesNotExist:
+        raise Http404("No top list matches the given query.")
+    return JsonResponse(snapshot)
+
+
+@query_budget(4)
+@require_GET
+def top_list_search(request):
+    """Returns the lists whose name contains the 'q' parameter and that have
+    every 'tag' parameter, answered from the in-memory search index."""
+    try:
+        limit = min(int(request.GET.get("limit", 20)), SEARCH_MAX_LIMIT)
+    except ValueError:
+        limit = 20
+    results = search_top_lists(
+        request.GET.get("q"), request.GET.getlist("tag"), max(limit, 1)
+    )
+    return JsonResponse({"results": results})
+
+
+@query_budget(2)
+@require_GET
+def user_top_lists(request, username):
+    """Returns the lists of a user, newest first, paged with the opaque
+    'cursor' parameter."""
+    try:
+        owner = CustomUser.objects.get_by_username(username)
+    except CustomUser.DoesNotExist:
+        raise Http404("No user matches the given query.")
+    try:
+        page = user_lists_paginator.page(
+            TopList.objects.filter(owner=owner).values("id", "created_at", "snapshot"),
+            request.GET.get("cursor") or None,
+        )
+    except InvalidCursor as error:
+        return JsonResponse({"error": str(error)}, status=400)
+    return JsonResponse(
+        {
+            "results": [row["snapshot"] for row in page],
+            "next": page.next_cursor,
+            "previous": page.previous_cursor,
+        }
+    )
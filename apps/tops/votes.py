@@ -0,0 +1,299 @@
+import logging
+import threading
+from collections import Counter, defaultdict
+from functools import partial
+
+from django.conf import settings
+from django.db import close_old_connections, transaction
+from django.db.models import F
+from django.utils import timezone
+
+from apps.core.notifications import notify_user
+from apps.tops.leaderboards import record_vote, record_votes
+from apps.tops.models import TopList, Vote
+from apps.tops.signals import refresh_snapshots_on_commit
+from top_five.lifecycle import register_shutdown_hook
+
+logger = logging.getLogger(__name__)
+
+# Value of a buffered vote that removes the vote of the user
+NO_VOTE = 0
+
+
+class VoteBufferFull(Exception):
+    """Raised when a vote cannot be buffered because the buffer stayed full
+    for longer than its block timeout."""
+
+
+def apply_vote_change(top_list_id, previous, value, voted_at):
+    """Updates the vote totals, the leaderboards and the snapshot of a list
+    after a user's vote on it went from previous to value, where 0 means no
+    vote."""
+    likes = (value == Vote.LIKE) - (previous == Vote.LIKE)
+    dislikes = (value == Vote.DISLIKE) - (previous == Vote.DISLIKE)
+    TopList.objects.filter(pk=top_list_id).update(
+        likes_count=F("likes_count") + likes,
+        dislikes_count=F("dislikes_count") + dislikes,
+        votes_changed_at=timezone.now(),
+    )
+    record_vote(top_list_id, value - previous, voted_at)
+    refresh_snapshots_on_commit([top_list_id])
+
+
+def notify_likes(likes):
+    """Sends a like event to the owners of the lists, for likes given as
+    (user_id, top_list_id) pairs. Owners liking their own lists are not
+    notified."""
+    owners = dict(
+        TopList.objects.filter(
+            pk__in={top_list_id for _user_id, top_list_id in likes}
+        ).values_list("pk", "owner_id")
+    )
+    for user_id, top_list_id in likes:
+        owner_id = owners.get(top_list_id)
+        if owner_id is not None and owner_id != user_id:
+            notify_user(owner_id, "like", {"top_list": top_list_id, "user": user_id})
+
+
+@transaction.atomic
+def cast_vote(user, top_list, value):
+    """Likes or dislikes a list on behalf of the user, replacing any
+    previous vote of the user on it."""
+    vote = Vote.objects.select_for_update().filter(user=user, top_list=top_list).first()
+    if vote is None:
+        vote = Vote.objects.create(user=user, top_list=top_list, value=value)
+        apply_vote_change(top_list.pk, 0, value, vote.created_at)
+    elif vote.value != value:
+        previous, vote.value = vote.value, value
+        vote.save(update_fields=["value", "updated_at"])
+        apply_vote_change(top_list.pk, previous, value, vote.created_at)
+    else:
+        return vote
+
+    if value == Vote.LIKE and top_list.owner_id != user.pk:
+        transaction.on_commit(
+            partial(
+                notify_user,
+                top_list.owner_id,
+                "like",
+                {"top_list": top_list.pk, "user": user.pk},
+            )
+        )
+    return vote
+
+
+@transaction.atomic
+def retract_vote(user, top_list):
+    """Removes the vote of the user on a list, if any."""
+    vote = Vote.objects.select_for_update().filter(user=user, top_list=top_list).first()
+    if vote is not None:
+        vote.delete()
+        apply_vote_change(top_list.pk, vote.value, 0, vote.created_at)
+
+
+@transaction.atomic
+def apply_buffered_votes(votes):
+    """Applies a batch of votes, given as a {(user_id, top_list_id): value}
+    dict where value may be NO_VOTE, with a bulk upsert and a bulk delete of
+    the votes, one bulk UPDATE of the counters and snapshots of the lists
+    and one leaderboard increment per list and day."""
+    existing = {
+        (vote.user_id, vote.top_list_id): vote
+        for vote in Vote.objects.select_for_update()
+        .filter(
+            user_id__in={user_id for user_id, _top_list_id in votes},
+            top_list_id__in={top_list_id for _user_id, top_list_id in votes},
+        )
+        .only("user_id", "top_list_id", "value", "created_at")
+    }
+    now = timezone.now()
+    upserts = []
+    deleted = []
+    counters = defaultdict(Counter)
+    scores = Counter()
+    likes = []
+    for (user_id, top_list_id), value in votes.items():
+        vote = existing.get((user_id, top_list_id))
+        previous = vote.value if vote else NO_VOTE
+        if value == previous:
+            continue
+
+        if value == NO_VOTE:
+            deleted.append(vote.pk)
+        else:
+            upserts.append(Vote(user_id=user_id, top_list_id=top_list_id, value=value))
+            if value == Vote.LIKE:
+                likes.append((user_id, top_list_id))
+
+        counters[top_list_id]["likes_count"] += (value == Vote.LIKE) - (
+            previous == Vote.LIKE
+        )
+        counters[top_list_id]["dislikes_count"] += (value == Vote.DISLIKE) - (
+            previous == Vote.DISLIKE
+        )
+        voted_at = vote.created_at if vote else now
+        scores[top_list_id, timezone.localdate(voted_at)] += value - previous
+
+    Vote.objects.bulk_create(
+        upserts,
+        batch_size=1000,
+        update_conflicts=True,
+        unique_fields=["user", "top_list"],
+        update_fields=["value", "updated_at"],
+    )
+    Vote.objects.filter(pk__in=deleted).delete()
+    top_lists = list(
+        TopList.objects.select_for_update()
+        .filter(pk__in=counters)
+        .only("likes_count", "dislikes_count", "snapshot")
+    )
+    unbuilt = []
+    for top_list in top_lists:
+        deltas = counters[top_list.pk]
+        top_list.likes_count += deltas["likes_count"]
+        top_list.dislikes_count += deltas["dislikes_count"]
+        # Stamped even when the votes cancel out, their timestamps still
+        # change the trending score
+        top_list.votes_changed_at = now
+        if top_list.snapshot:
+            # Only the votes of the snapshot change, no need to rebuild it
+            top_list.snapshot["votes"] = {
+                "likes": top_list.likes_count,
+                "dislikes": top_list.dislikes_count,
+            }
+        else:
+            unbuilt.append(top_list.pk)
+    TopList.objects.bulk_update(
+        top_lists,
+        ["likes_count", "dislikes_count", "votes_changed_at", "snapshot"],
+        batch_size=1000,
+    )
+    record_votes(scores)
+    if unbuilt:
+        refresh_snapshots_on_commit(unbuilt)
+    if likes:
+        transaction.on_commit(partial(notify_likes, likes))
+
+
+class VoteBuffer:
+    """In-process buffer that coalesces like/dislike clicks before writing
+    them. Only the last vote of a user on a list is kept, and the buffer is
+    flushed with apply_buffered_votes() once it holds flush_size votes or
+    every flush_interval seconds from a background thread.
+
+    The buffer holds at most max_size votes. When it is full the producer
+    flushes it itself, waiting up to block_timeout seconds for a flush in
+    progress, and VoteBufferFull is raised if it could not. The buffer is
+    flushed on worker shutdown through the lifecycle hooks."""
+
+    def __init__(
+        self, max_size=10000, flush_size=500, flush_interval=1.0, block_timeout=5.0
+    ):
+        self.max_size = max_size
+        self.flush_size = min(flush_size, max_size)
+        self.flush_interval = flush_interval
+        self.block_timeout = block_timeout
+        self._votes = {}
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._stopped = threading.Event()
+        self._flusher = None
+
+    def __len__(self):
+        return len(self._votes)
+
+    def submit(self, user_id, top_list_id, value):
+        """Buffers the vote of a user on a list, replacing any vote of the
+        same user on the same list that was not flushed yet."""
+        key = (user_id, top_list_id)
+        while True:
+            with self._lock:
+                if key in self._votes or len(self._votes) < self.max_size:
+                    self._votes[key] = value
+                    pending = len(self._votes)
+                    break
+
+            if not self.flush(timeout=self.block_timeout):
+                raise VoteBufferFull("The vote buffer is full, try again later.")
+
+        if pending >= self.flush_size:
+            # Someone else is already flushing when the lock is taken
+            self.flush(timeout=0)
+        self._start_flusher()
+
+    def flush(self, timeout=-1):
+        """Writes the buffered votes. Returns False when another flush held
+        the flush lock for longer than timeout seconds."""
+        if not self._flush_lock.acquire(timeout=timeout):
+            return False
+
+        try:
+            with self._lock:
+                votes, self._votes = self._votes, {}
+            if votes:
+                try:
+                    apply_buffered_votes(votes)
+                except Exception:
+                    # Keep the votes for the next flush, unless newer ones
+                    # were submitted in the meantime
+                    with self._lock:
+                        for key, value in votes.items():
+                            self._votes.setdefault(key, value)
+                    raise
+        finally:
+            self._flush_lock.release()
+        return True
+
+    def close(self):
+        """Stops the background flusher and writes the remaining votes."""
+        self._stopped.set()
+        if self._flusher is not None:
+            self._flusher.join()
+        self.flush()
+
+    def _start_flusher(self):
+        if self._flusher is not None or not self.flush_interval:
+            return
+
+        with self._lock:
+            if self._flusher is None and not self._stopped.is_set():
+                self._flusher = threading.Thread(
+                    target=self._run_flusher, name="vote-buffer-flusher", daemon=True
+                )
+                self._flusher.start()
+
+    def _run_flusher(self):
+        while not self._stopped.wait(self.flush_interval):
+            try:
+                self.flush()
+            except Exception:
+                logger.exception("Failed to flush the vote buffer.")
+            finally:
+                close_old_connections()
+
+
+_vote_buffer = None
+_vote_buffer_lock = threading.Lock()
+
+
+def get_vote_buffer():
+    """Returns the vote buffer of the process, configured from the
+    TOPS_VOTE_BUFFER_* settings and flushed on shutdown."""
+    global _vote_buffer
+    if _vote_buffer is None:
+        with _vote_buffer_lock:
+            if _vote_buffer is None:
+                _vote_buffer = VoteBuffer(
+                    max_size=settings.TOPS_VOTE_BUFFER_MAX_SIZE,
+                    flush_size=settings.TOPS_VOTE_BUFFER_FLUSH_SIZE,
+                    flush_interval=settings.TOPS_VOTE_BUFFER_FLUSH_INTERVAL,
+                    block_timeout=settings.TOPS_VOTE_BUFFER_BLOCK_TIMEOUT,
+                )
+                register_shutdown_hook(_vote_buffer.close)
+    return _vote_buffer
+
+
+def submit_vote(user, top_list, value):
+    """Buffers a like, a dislike or, with NO_VOTE, the removal of the vote
+    of the user on a list."""
+    get_vote_buffer().submit(user.pk, top_list.pk, value)
@@ -0,0 +1,157 @@
+import logging
+import threading
+import time
+
+from django.conf import settings
+from django.db import close_old_connections
+from django.db.models import F
+from django.db.models.functions import Coalesce, Greatest
+
+from apps.users.cache import invalidate_users
+from apps.users.models import CustomUser
+from top_five.lifecycle import register_shutdown_hook
+
+logger = logging.getLogger(__name__)
+
+ACTIVITY_FIELDS = ("last_login", "last_seen")
+
+
+def _latest(field, value):
+    """Expression keeping the latest of the stored timestamp and value, so a
+    late flush never moves a timestamp back."""
+    if value is None:
+        return F(field)
+    return Greatest(Coalesce(F(field), value), value)
+
+
+class ActivityTracker:
+    """In-process buffer of the login and last seen timestamps of the users,
+    truncated to the minute. Recording only updates a dict, so the request
+    path never waits on the database; the latest timestamps of each user are
+    written every flush_interval seconds from a background thread, in
+    bulk_update() batches of batch_size users, and on worker shutdown."""
+
+    def __init__(self, flush_interval=60.0, batch_size=1000):
+        self.flush_interval = flush_interval
+        self.batch_size = batch_size
+        self._activity = {}
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._stopped = threading.Event()
+        self._flusher = None
+        self.flushed = 0
+        self.flush_seconds = 0.0
+
+    def __len__(self):
+        return len(self._activity)
+
+    def record_login(self, user_id, when):
+        self._record(user_id, 0, when)
+
+    def record_seen(self, user_id, when):
+        self._record(user_id, 1, when)
+
+    def _record(self, user_id, index, when):
+        when = when.replace(second=0, microsecond=0)
+        with self._lock:
+            activity = self._activity.setdefault(user_id, [None, None])
+            if activity[index] is None or activity[index] < when:
+                activity[index] = when
+        self._start_flusher()
+
+    def flush(self):
+        """Writes the buffered timestamps and returns the number of users
+        updated."""
+        with self._flush_lock:
+            with self._lock:
+                activity, self._activity = self._activity, {}
+            if not activity:
+                return 0
+
+            started = time.perf_counter()
+            users = [
+                CustomUser(
+                    pk=user_id,
+                    **{
+                        field: _latest(field, value)
+                        for field, value in zip(ACTIVITY_FIELDS, values)
+                    },
+                )
+                for user_id, values in activity.items()
+            ]
+            try:
+                CustomUser.objects.bulk_update(
+                    users, ACTIVITY_FIELDS, batch_size=self.batch_size
+                )
+            except Exception:
+                # Keep the timestamps for the next flush, merged with the
+                # ones recorded in the meantime
+                with self._lock:
+                    for user_id, values in activity.items():
+                        current = self._activity.setdefault(user_id, [None, None])
+                        for index, value in enumerate(values):
+                            if value is not None and (
+                                current[index] is None or current[index] < value
+                            ):
+                                current[index] = value
+                raise
+
+            # The cached copies carry the old timestamps
+            invalidate_users(activity)
+            self.flushed += len(users)
+            self.flush_seconds += time.perf_counter() - started
+            return len(users)
+
+    def close(self):
+        """Stops the background flusher and writes the remaining
+        timestamps."""
+        self._stopped.set()
+        if self._flusher is not None:
+            self._flusher.join()
+        self.flush()
+
+    def stats(self):
+        return {
+            "pending": len(self._activity),
+            "flushed": self.flushed,
+            "flush_seconds": round(self.flush_seconds, 3),
+        }
+
+    def _start_flusher(self):
+        if self._flusher is not None or not self.flush_interval:
+            return
+
+        with self._lock:
+            if self._flusher is None and not self._stopped.is_set():
+                self._flusher = threading.Thread(
+                    target=self._run_flusher, name="activity-flusher", daemon=True
+                )
+                self._flusher.start()
+
+    def _run_flusher(self):
+        while not self._stopped.wait(self.flush_interval):
+            try:
+                self.flush()
+            except Exception:
+                logger.exception("Failed to flush the user activity.")
+            finally:
+                close_old_connections()
+
+
+_activity_tracker = None
+_activity_tracker_lock = threading.Lock()
+
+
+def get_activity_tracker():
+    """Returns the activity tracker of the process, configured from the
+    USERS_ACTIVITY_* settings and flushed on shutdown."""
+    global _activity_tracker
+    if _activity_tracker is None:
+        with _activity_tracker_lock:
+            if _activity_tracker is None:
+                _activity_tracker = ActivityTracker(
+                    flush_interval=settings.USERS_ACTIVITY_FLUSH_INTERVAL,
+                    batch_size=settings.USERS_ACTIVITY_BATCH_SIZE,
+                )
+                register_shutdown_hook(_activity_tracker.close)
+    return _activity_tracker
@@ -1,3 +1,166 @@
-from django.contrib import admin
+from django.conf import settings
+from django.contrib import admin, messages
+from django.contrib.admin.options import IncorrectLookupParameters
+from django.contrib.admin.views.main import ChangeList
+from django.utils.translation import gettext_lazy as _, ngettext
 
-# Register your models here.
+from apps.core.pagination import CursorPaginator, InvalidCursor, estimated_count
+from apps.users.cache import bump_permissions_version, invalidate_users
+from apps.users.models import CustomUser
+
+CURSOR_VAR = "cursor"
+
+
+class KeysetChangeList(ChangeList):
+    """Change list paged with keyset cursors instead of page numbers, so a
+    page deep in the listing costs as much as the first one, and counting
+    the results from the planner estimates instead of COUNT(*). The
+    ordering must be on indexed fields for the pages to be cheap."""
+
+    def get_queryset(self, request, exclude_parameters=None):
+        # The cursor is no lookup, and the links to other orderings, filters
+        # or searches start over from the first page
+        if CURSOR_VAR in self.filter_params:
+            self.cursor = self.params.pop(CURSOR_VAR)
+            del self.filter_params[CURSOR_VAR]
+        elif not hasattr(self, "cursor"):
+            self.cursor = None
+        return super().get_queryset(request, exclude_parameters)
+
+    def get_paginator_ordering(self):
+        ordering = []
+        for name in self.queryset.query.order_by:
+            if not isinstance(name, str):
+                # Orderings by expressions are not supported by the cursors
+                return ["-pk"]
+            descending = name.startswith("-")
+            field = name.lstrip("-")
+            if field == "pk":
+                field = self.lookup_opts.pk.name
+            ordering.append(("-" if descending else "") + field)
+        return ordering or ["-pk"]
+
+    def get_results(self, request):
+        ordering = self.get_paginator_ordering()
+        paginator = CursorPaginator(
+            ordering,
+            page_size=self.list_per_page,
+            salt=f"admin.{self.opts.label_lower}:{','.join(ordering)}",
+        )
+        try:
+            page = paginator.page(self.queryset, self.cursor)
+        except InvalidCursor as error:
+            raise IncorrectLookupParameters(error)
+
+        self.result_count = estimated_count(self.queryset)
+        self.full_result_count = None
+        self.show_full_result_count = False
+        self.show_admin_actions = True
+        self.result_list = page.items
+        self.can_show_all = False
+        self.multi_page = False
+        self.paginator = None
+        self.next_url = (
+            self.get_query_string({CURSOR_VAR: page.next_cursor})
+            if page.has_next
+            else None
+        )
+        self.previous_url = (
+            self.get_query_string({CURSOR_VAR: page.previous_cursor})
+            if page.has_previous
+            else None
+        )
+
+
+def update_in_chunks(queryset, chunk_size=None, **values):
+    """Sets values on the rows of the queryset chunk_size at a time, one
+    UPDATE per chunk, and returns the number of rows updated. Rows are
+    walked by primary key, so no statement holds its locks for long or
+    rescans the rows already updated; those already holding the values are
+    skipped."""
+    chunk_size = chunk_size or settings.USERS_ADMIN_ACTION_CHUNK_SIZE
+    model = queryset.model
+    queryset = queryset.exclude(**values).order_by("pk")
+    updated = 0
+    last_pk = None
+    while True:
+        chunk = queryset if last_pk is None else queryset.filter(pk__gt=last_pk)
+        pks = list(chunk.values_list("pk", flat=True)[:chunk_size])
+        if pks:
+            updated += model._default_manager.filter(pk__in=pks).update(**values)
+            if model is CustomUser:
+                # The cached copies and permissions carry the old values
+                invalidate_users(pks)
+                bump_permissions_version(pks)
+        if len(pks) < chunk_size:
+            return updated
+        last_pk = pks[-1]
+
+
+@admin.register(CustomUser)
+class CustomUserAdmin(admin.ModelAdmin):
+    """Admin of the users, built for tables of millions of rows: keyset
+    pages, estimated counts, username prefix searches served by its index
+    and bulk actions updating the users in chunks."""
+
+    list_display = ("username", "is_active", "is_staff", "points", "last_seen")
+    list_filter = ("is_active", "is_staff", "is_superuser")
+    search_fields = ("username",)
+    search_help_text = _("Usernames starting with the search term.")
+    sortable_by = ("username",)
+    ordering = ("-pk",)
+    list_per_page = 100
+    show_full_result_count = False
+    fields = (
+        "username",
+        "is_active",
+        "is_staff",
+        "is_superuser",
+        "groups",
+        "user_permissions",
+        "points",
+        "last_login",
+        "last_seen",
+    )
+    readonly_fields = ("points", "last_login", "last_seen")
+    filter_horizontal = ("groups", "user_permissions")
+    actions = ("activate_users", "deactivate_users")
+
+    def get_changelist(self, request, **kwargs):
+        return KeysetChangeList
+
+    def get_search_results(self, request, queryset, search_term):
+        """Matches the usernames starting with the search term, which the
+        index of the usernames serves, unlike a search for a substring."""
+        search_term = CustomUser.normalize_username(search_term.strip())
+        if search_term:
+            queryset = queryset.filter(username__startswith=search_term)
+        return queryset, False
+
+    def save_model(self, request, obj, form, change):
+        if not change:
+            # Users created here set their password through a reset
+            obj.set_unusable_password()
+        super().save_model(request, obj, form, change)
+
+    @admin.action(description=_("Activate selected users"))
+    def activate_users(self, request, queryset):
+        updated = update_in_chunks(queryset, is_active=True)
+        self.message_user(
+            request,
+            ngettext("Activated %d user.", "Activated %d users.", updated) % updated,
+            messages.SUCCESS,
+        )
+
+    @admin.action(description=_("Deactivate selected users"))
+    def deactivate_users(self, request, queryset):
+        # Administrators do not lock themselves out
+        updated = update_in_chunks(
+            queryset.exclude(pk=request.user.pk), is_active=False
+        )
+        self.message_user(
+            request,
+            ngettext("Deactivated %d user.", "Deactivated %d users.", updated)
+            % updated,
+            messages.SUCCESS,
+        )
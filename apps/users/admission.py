@@ -0,0 +1,207 @@
+import hashlib
+import ipaddress
+import threading
+import time
+from contextlib import asynccontextmanager, contextmanager
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.exceptions import ValidationError
+
+from apps.users.cache import get_users_cache
+
+
+class LoginRejected(ValidationError):
+    """Raised before any password is hashed when a login attempt is not
+    admitted. reason is "ip", "username" or "concurrency"."""
+
+    def __init__(self, reason):
+        super().__init__(
+            "Too many login attempts. Please try again later.", code="throttled"
+        )
+        self.reason = reason
+
+
+class AdmissionStats:
+    """Per-process counters of the login admission control."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.admitted = 0
+            self.rejected = {"ip": 0, "username": 0, "concurrency": 0}
+            self.check_seconds = 0.0
+
+    def increment(self, reason):
+        with self._lock:
+            self.rejected[reason] += 1
+
+    def record_check(self, seconds):
+        with self._lock:
+            self.admitted += 1
+            self.check_seconds += seconds
+
+    def as_dict(self):
+        with self._lock:
+            rejected = sum(self.rejected.values())
+            mean = self.check_seconds / self.admitted if self.admitted else 0.0
+            return {
+                "admitted": self.admitted,
+                "rejected": dict(self.rejected),
+                "check_seconds": round(self.check_seconds, 3),
+                # CPU time the rejected attempts would have spent hashing
+                "shed_seconds": round(rejected * mean, 3),
+            }
+
+
+class LoginAdmission:
+    """Admission control of the login attempts, run before the credentials
+    are checked so that rejecting one costs a few cache operations instead
+    of a password hash, even for unknown usernames.
+
+    Attempts are rate limited per client IP and per normalized username
+    with sliding window counters kept in the users cache, so the limits are
+    shared by the workers: the count of the current window is added to the
+    count of the previous one weighted by how much of it still overlaps the
+    sliding window. Within a process, at most max_concurrent credentials
+    are checked at once; an attempt waiting longer than
+    USERS_LOGIN_CHECK_WAIT seconds for a slot is rejected. Limits of 0
+    disable the corresponding check."""
+
+    def __init__(self, max_concurrent):
+        self.max_concurrent = max_concurrent
+        self.stats = AdmissionStats()
+        self._slots = threading.BoundedSemaphore(max_concurrent)
+
+    @staticmethod
+    def _key(scope, value, window):
+        digest = hashlib.blake2b(value.encode(), digest_size=12).hexdigest()
+        return f"users:login:{scope}:{digest}:{window}"
+
+    def check_rates(self, ip, username, now=None):
+        """Counts the attempt against the buckets of ip and username, either
+        of which may be None, and raises LoginRejected when one is
+        exhausted. Rejected attempts are not counted."""
+        window = settings.USERS_LOGIN_RATE_WINDOW
+        limits = [
+            ("ip", ip, settings.USERS_LOGIN_IP_LIMIT),
+            ("username", username, settings.USERS_LOGIN_USERNAME_LIMIT),
+        ]
+        limits = [
+            (scope, value, limit) for scope, value, limit in limits if value and limit
+        ]
+        if not limits:
+            return
+
+        now = time.time() if now is None else now
+        current = int(now // window)
+        overlap = 1 - (now % window) / window
+        keys = {
+            scope: (
+                self._key(scope, value, current),
+                self._key(scope, value, current - 1),
+            )
+            for scope, value, _limit in limits
+        }
+        cache = get_users_cache()
+        counts = cache.get_many([key for pair in keys.values() for key in pair])
+        for scope, _value, limit in limits:
+            current_key, previous_key = keys[scope]
+            estimate = (
+                counts.get(current_key, 0) + counts.get(previous_key, 0) * overlap
+            )
+            if estimate >= limit:
+                self.stats.increment(scope)
+                raise LoginRejected(scope)
+
+        for current_key, _previous_key in keys.values():
+            # The previous window must outlive the current one
+            cache.add(current_key, 0, timeout=window * 2)
+            try:
+                cache.incr(current_key)
+            except ValueError:
+                cache.set(current_key, 1, timeout=window * 2)
+
+    def _acquire(self, wait):
+        acquired = (
+            self._slots.acquire(timeout=wait)
+            if wait
+            else self._slots.acquire(blocking=False)
+        )
+        if not acquired:
+            self.stats.increment("concurrency")
+            raise LoginRejected("concurrency")
+
+    @contextmanager
+    def admit(self, ip, username):
+        """Context manager around a credentials check, raising LoginRejected
+        when the attempt is not admitted."""
+        self.check_rates(ip, username)
+        self._acquire(settings.USERS_LOGIN_CHECK_WAIT)
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self._slots.release()
+            self.stats.record_check(time.perf_counter() - started)
+
+    @asynccontextmanager
+    async def aadmit(self, ip, username):
+        """Async admit(). The event loop never waits for a slot, an attempt
+        finding none free is rejected at once."""
+        await sync_to_async(self.check_rates)(ip, username)
+        self._acquire(0)
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self._slots.release()
+            self.stats.record_check(time.perf_counter() - started)
+
+
+def _is_trusted_proxy(ip, proxies):
+    try:
+        address = ipaddress.ip_address(ip)
+    except ValueError:
+        return False
+    return any(address in proxy for proxy in proxies)
+
+
+def client_ip(request):
+    """Returns the IP of the client of request. When it comes through the
+    proxies of USERS_LOGIN_TRUSTED_PROXIES, this is the rightmost address
+    of X-Forwarded-For not added by one of them; the header is ignored
+    otherwise as any client can send it."""
+    if request is None:
+        return None
+    ip = request.META.get("REMOTE_ADDR")
+    proxies = [
+        ipaddress.ip_network(proxy, strict=False)
+        for proxy in settings.USERS_LOGIN_TRUSTED_PROXIES
+    ]
+    forwarded = request.META.get("HTTP_X_FORWARDED_FOR", "").split(",")
+    for address in reversed(forwarded):
+        if not _is_trusted_proxy(ip, proxies):
+            break
+        ip = address.strip() or ip
+    return ip
+
+
+_login_admission = None
+_login_admission_lock = threading.Lock()
+
+
+def get_login_admission():
+    """Returns the login admission control of the process, configured from
+    the USERS_LOGIN_* settings."""
+    global _login_admission
+    if _login_admission is None:
+        with _login_admission_lock:
+            if _login_admission is None:
+                _login_admission = LoginAdmission(
+                    max_concurrent=settings.USERS_LOGIN_MAX_CONCURRENT_CHECKS
+                )
+    return _login_admission
@@ -6,3 +6,21 @@ class UsersConfig(AppConfig):
     default_auto_field = "django.db.models.BigAutoField"
     name = "apps.users"
     verbose_name = _("Users")
+
+    def ready(self):
+        from apps.core.instrumentation import register_metrics
+        from apps.users import signals  # noqa: F401
+        from apps.users.activity import get_activity_tracker
+        from apps.users.admission import get_login_admission
+        from apps.users.availability import get_username_filter
+        from apps.users.cache import permissions_cache_stats, user_cache_stats
+        from apps.users.points import get_points_ranking
+
+        register_metrics("user_cache", user_cache_stats.as_dict)
+        register_metrics("permissions_cache", permissions_cache_stats.as_dict)
+        register_metrics("activity", lambda: get_activity_tracker().stats())
+        register_metrics("username_filter", lambda: get_username_filter().report())
+        register_metrics(
+            "login_admission", lambda: get_login_admission().stats.as_dict()
+        )
+        register_metrics("points_ranking", lambda: get_points_ranking().report())
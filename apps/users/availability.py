@@ -0,0 +1,227 @@
+import hashlib
+import logging
+import math
+import threading
+import time
+
+from django.conf import settings
+from django.db import connection
+
+from apps.users.cache import get_users_cache
+from apps.users.models import CustomUser
+
+logger = logging.getLogger(__name__)
+
+# Capacity headroom of a rebuilt filter, so it absorbs new users until the
+# next periodic rebuild without losing its false positive rate
+CAPACITY_GROWTH = 2
+
+
+class BloomFilter:
+    """Set of strings answering "definitely absent" or "maybe present" in
+    constant memory, sized for capacity items at the given false positive
+    rate."""
+
+    def __init__(self, capacity, error_rate):
+        self.capacity = max(capacity, 1)
+        self.error_rate = error_rate
+        self.size = max(
+            8, math.ceil(-self.capacity * math.log(error_rate) / math.log(2) ** 2)
+        )
+        self.hash_count = max(1, round(self.size / self.capacity * math.log(2)))
+        self.bits = bytearray((self.size + 7) // 8)
+        self.count = 0
+
+    def _positions(self, item):
+        # Double hashing: two 64-bit halves of one digest stand in for
+        # hash_count independent hash functions
+        digest = hashlib.blake2b(item.encode(), digest_size=16).digest()
+        first = int.from_bytes(digest[:8], "little")
+        second = int.from_bytes(digest[8:], "little") | 1
+        return (
+            (first + index * second) % self.size for index in range(self.hash_count)
+        )
+
+    def add(self, item):
+        for position in self._positions(item):
+            self.bits[position >> 3] |= 1 << (position & 7)
+        self.count += 1
+
+    def __contains__(self, item):
+        return all(
+            self.bits[position >> 3] & (1 << (position & 7))
+            for position in self._positions(item)
+        )
+
+
+class FilterStats:
+    """Per-process counters of the username availability checks."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.lookups = 0
+            self.avoided = 0
+            self.false_positives = 0
+
+    def increment(self, name):
+        with self._lock:
+            setattr(self, name, getattr(self, name) + 1)
+
+    def as_dict(self):
+        with self._lock:
+            return {
+                "lookups": self.lookups,
+                "db_avoided": self.avoided,
+                "db_avoidance_rate": (
+                    self.avoided / self.lookups if self.lookups else 0.0
+                ),
+                "false_positives": self.false_positives,
+            }
+
+
+def new_username_key(username):
+    return f"users:new-username:{username}"
+
+
+class UsernameFilter:
+    """Bloom filter of the normalized usernames, rebuilt from the database
+    every USERS_USERNAME_FILTER_REBUILD_INTERVAL seconds and as soon as it
+    holds more usernames than it was sized for.
+
+    The filter only answers "definitely free"; possible matches are checked
+    against the database, so usernames freed by deleted users are reported
+    available. Usernames created since the last rebuild are missing from the
+    filters of the other workers, so each creation also leaves a marker in
+    the users cache that outlives the next rebuilds, and a username absent
+    from the filter is only reported free when it has no marker.
+    Registration still relies on the unique constraint."""
+
+    def __init__(self, error_rate=0.01, rebuild_interval=3600):
+        self.error_rate = error_rate
+        self.rebuild_interval = rebuild_interval
+        self.stats = FilterStats()
+        self._filter = None
+        self._built_at = 0.0
+        self._added_while_building = None
+        self._lock = threading.Lock()
+
+    def build(self):
+        # Usernames added while the database is read may be missing from it,
+        # they are replayed on the new filter
+        self._added_while_building = []
+        try:
+            usernames = CustomUser.objects.values_list("username", flat=True)
+            bloom = BloomFilter(
+                max(usernames.count() * CAPACITY_GROWTH, 1000), self.error_rate
+            )
+            for username in usernames.iterator(chunk_size=10000):
+                bloom.add(username)
+        finally:
+            added, self._added_while_building = self._added_while_building, None
+        for username in added:
+            bloom.add(username)
+        self._filter = bloom
+        self._built_at = time.monotonic()
+        return bloom
+
+    def get_filter(self):
+        """Returns the filter, building it on first use. A stale filter
+        keeps answering while it is rebuilt in a background thread."""
+        bloom = self._filter
+        if bloom is None:
+            with self._lock:
+                if self._filter is None:
+                    self.build()
+                return self._filter
+
+        if self._needs_rebuild(bloom) and self._lock.acquire(blocking=False):
+            threading.Thread(
+                target=self._rebuild, name="username-filter-rebuild", daemon=True
+            ).start()
+        return bloom
+
+    def _rebuild(self):
+        try:
+            self.build()
+        except Exception:
+            logger.exception("Failed to rebuild the username filter.")
+        finally:
+            self._built_at = time.monotonic()
+            self._lock.release()
+            connection.close()
+
+    def _needs_rebuild(self, bloom):
+        return (
+            bloom.count > bloom.capacity
+            or time.monotonic() - self._built_at >= self.rebuild_interval
+        )
+
+    def add(self, username):
+        self.add_many([username])
+
+    def add_many(self, usernames):
+        """Adds new usernames to the filter of this process, once it is
+        built, and marks them as taken for the other workers."""
+        get_users_cache().set_many(
+            {new_username_key(username): True for username in usernames},
+            timeout=self.rebuild_interval * 2,
+        )
+        added = self._added_while_building
+        if added is not None:
+            added.extend(usernames)
+        bloom = self._filter
+        if bloom is not None:
+            for username in usernames:
+                bloom.add(username)
+
+    def is_taken(self, username):
+        """Whether the normalized username is taken. The database is only
+        queried when the filter reports a possible match or the username was
+        created since the last rebuild."""
+        self.stats.increment("lookups")
+        if username not in self.get_filter():
+            if not get_users_cache().get(new_username_key(username)):
+                self.stats.increment("avoided")
+                return False
+
+        taken = CustomUser.objects.filter(username=username).exists()
+        if not taken:
+            self.stats.increment("false_positives")
+        return taken
+
+    def report(self):
+        bloom = self._filter
+        report = self.stats.as_dict()
+        if bloom is not None:
+            report.update(
+                {
+                    "usernames": bloom.count,
+                    "capacity": bloom.capacity,
+                    "size_bytes": len(bloom.bits),
+                    "hash_count": bloom.hash_count,
+                    "error_rate": bloom.error_rate,
+                }
+            )
+        return report
+
+
+_username_filter = None
+_username_filter_lock = threading.Lock()
+
+
+def get_username_filter():
+    """Returns the username filter of the process, configured from the
+    USERS_USERNAME_FILTER_* settings."""
+    global _username_filter
+    if _username_filter is None:
+        with _username_filter_lock:
+            if _username_filter is None:
+                _username_filter = UsernameFilter(
+                    error_rate=settings.USERS_USERNAME_FILTER_ERROR_RATE,
+                    rebuild_interval=settings.USERS_USERNAME_FILTER_REBUILD_INTERVAL,
+                )
+    return _username_filter
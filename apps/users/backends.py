@@ -0,0 +1,56 @@
+from django.contrib.auth import get_user_model
+from django.contrib.auth.backends import ModelBackend
+
+from apps.users.cache import (
+    cache_permissions,
+    cache_user,
+    get_cached_permissions,
+    get_cached_user,
+    permissions_cache_key,
+)
+
+UserModel = get_user_model()
+
+
+class CachedModelBackend(ModelBackend):
+    """ModelBackend that resolves the user of each authenticated request
+    from the users cache, saving the SELECT by primary key that
+    AuthenticationMiddleware would otherwise run on every hit. Entries are
+    invalidated by the CustomUser post_save and post_delete signals.
+
+    Permissions are compiled into a snapshot of frozensets stored in the
+    same cache under a per-user version, which the m2m_changed signals of
+    users, groups and permissions bump, so a warm snapshot costs no
+    queries."""
+
+    def get_user(self, user_id):
+        user = get_cached_user(UserModel, user_id)
+        if user is None:
+            user = super().get_user(user_id)
+            if user is None:
+                return None
+            cache_user(user)
+        return user if self.user_can_authenticate(user) else None
+
+    def get_user_permissions(self, user_obj, obj=None):
+        if not user_obj.is_active or user_obj.is_anonymous or obj is not None:
+            return set()
+        return self._get_permissions_snapshot(user_obj)[0]
+
+    def get_group_permissions(self, user_obj, obj=None):
+        if not user_obj.is_active or user_obj.is_anonymous or obj is not None:
+            return set()
+        return self._get_permissions_snapshot(user_obj)[1]
+
+    def _get_permissions_snapshot(self, user_obj):
+        if not hasattr(user_obj, "_perm_snapshot"):
+            key = permissions_cache_key(user_obj.pk)
+            snapshot = get_cached_permissions(key)
+            if snapshot is None:
+                snapshot = (
+                    frozenset(self._get_permissions(user_obj, None, "user")),
+                    frozenset(self._get_permissions(user_obj, None, "group")),
+                )
+                cache_permissions(key, snapshot)
+            user_obj._perm_snapshot = snapshot
+        return user_obj._perm_snapshot
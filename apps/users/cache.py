@@ -0,0 +1,138 @@
+import threading
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import router
+
+
+class CacheStats:
+    """Thread safe hit/miss counters of a cache, kept per process."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def hit(self):
+        with self._lock:
+            self.hits += 1
+
+    def miss(self):
+        with self._lock:
+            self.misses += 1
+
+    def reset(self):
+        with self._lock:
+            self.hits = 0
+            self.misses = 0
+
+    def as_dict(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_ratio": self.hits / lookups if lookups else 0.0,
+            }
+
+
+user_cache_stats = CacheStats()
+
+permissions_cache_stats = CacheStats()
+
+GROUPS_PERMISSIONS_VERSION_KEY = "users:perms-version:groups"
+
+
+def get_users_cache():
+    return caches[settings.USERS_CACHE_ALIAS]
+
+
+def user_cache_key(user_id):
+    return f"users:user:{user_id}"
+
+
+def get_cached_user(user_model, user_id):
+    """Returns the user with the given primary key rebuilt from the cache,
+    or None on a cache miss."""
+    values = get_users_cache().get(user_cache_key(user_id))
+    if values is None:
+        user_cache_stats.miss()
+        return None
+
+    user_cache_stats.hit()
+    field_names = [field.attname for field in user_model._meta.concrete_fields]
+    return user_model.from_db(
+        router.db_for_read(user_model),
+        field_names,
+        [values[name] for name in field_names],
+    )
+
+
+def cache_user(user):
+    """Stores the concrete field values of the user, which is enough to
+    rebuild it and verify the session hash without hitting the database."""
+    values = {
+        field.attname: getattr(user, field.attname)
+        for field in user._meta.concrete_fields
+    }
+    get_users_cache().set(user_cache_key(user.pk), values, settings.USERS_CACHE_TIMEOUT)
+
+
+def invalidate_user(user_id):
+    get_users_cache().delete(user_cache_key(user_id))
+
+
+def invalidate_users(user_ids):
+    get_users_cache().delete_many([user_cache_key(user_id) for user_id in user_ids])
+
+
+def permissions_version_key(user_id):
+    return f"users:perms-version:{user_id}"
+
+
+def permissions_cache_key(user_id):
+    """Returns the cache key of the permission snapshot of a user. It embeds
+    the version of the user and the global version of the groups, so bumping
+    either makes the old snapshot unreachable. A missing version is created
+    with a fresh timestamp instead of a counter, so an evicted version never
+    points back to an old snapshot."""
+    cache = get_users_cache()
+    version_keys = [permissions_version_key(user_id), GROUPS_PERMISSIONS_VERSION_KEY]
+    versions = cache.get_many(version_keys)
+    for key in version_keys:
+        if key not in versions:
+            cache.add(key, time.time_ns(), None)
+            versions[key] = cache.get(key)
+    return "users:perms:{}:{}:{}".format(
+        user_id, *(versions[key] for key in version_keys)
+    )
+
+
+def get_cached_permissions(key):
+    """Returns the (user permissions, group permissions) pair of frozensets
+    stored under the given key, or None on a cache miss."""
+    snapshot = get_users_cache().get(key)
+    if snapshot is None:
+        permissions_cache_stats.miss()
+    else:
+        permissions_cache_stats.hit()
+    return snapshot
+
+
+def cache_permissions(key, snapshot):
+    get_users_cache().set(key, snapshot, settings.USERS_CACHE_TIMEOUT)
+
+
+def bump_permissions_version(user_ids):
+    """Invalidates the permission snapshots of the given users."""
+    version = time.time_ns()
+    get_users_cache().set_many(
+        {permissions_version_key(user_id): version for user_id in user_ids}, None
+    )
+
+
+def bump_groups_permissions_version():
+    """Invalidates the permission snapshots of every user, used when the
+    permissions of a group change."""
+    get_users_cache().set(GROUPS_PERMISSIONS_VERSION_KEY, time.time_ns(), None)
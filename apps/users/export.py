@@ -0,0 +1,102 @@
+import csv
+import json
+from itertools import islice
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+
+from apps.users.models import CustomUser
+
+EXPORT_FIELDS = ("id", "username", "is_active", "is_staff", "last_login")
+
+EXPORT_FORMATS = ("csv", "jsonl")
+
+
+class _Line:
+    """File-like object whose write() returns the line written, so the csv
+    module formats single rows without buffering them."""
+
+    def write(self, value):
+        return value
+
+
+def export_rows(after_id=None, chunk_size=None):
+    """Yields the exported fields of the users ordered by id, starting after
+    after_id to resume an interrupted export. The rows are read with a
+    server-side cursor where the database supports it, chunk_size at a
+    time, so memory stays flat whatever the number of users."""
+    users = CustomUser.objects.order_by("pk")
+    if after_id is not None:
+        users = users.filter(pk__gt=after_id)
+    return users.values_list(*EXPORT_FIELDS).iterator(
+        chunk_size=chunk_size or settings.USERS_EXPORT_CHUNK_SIZE
+    )
+
+
+def _serialize(value):
+    return value.isoformat() if hasattr(value, "isoformat") else value
+
+
+def export_lines(export_format, after_id=None, chunk_size=None, header=True):
+    """Yields the export as lines of CSV, with a header row unless header is
+    False, or of JSON."""
+    rows = export_rows(after_id, chunk_size)
+    if export_format == "csv":
+        writer = csv.writer(_Line())
+        if header:
+            yield writer.writerow(EXPORT_FIELDS)
+        for row in rows:
+            yield writer.writerow(
+                ["" if value is None else _serialize(value) for value in row]
+            )
+    else:
+        for row in rows:
+            record = dict(zip(EXPORT_FIELDS, map(_serialize, row)))
+            yield json.dumps(record, separators=(",", ":")) + "\n"
+
+
+def iter_chunks(lines, size=1000):
+    """Groups lines into strings of size lines, to write or send fewer and
+    larger chunks."""
+    lines = iter(lines)
+    while chunk := "".join(islice(lines, size)):
+        yield chunk
+
+
+async def aiter_chunks(lines, size=1000):
+    """Async iter_chunks() for ASGI responses. Each chunk is read in the
+    thread that runs the sync code of the request, where the database
+    cursor lives."""
+    lines = iter(lines)
+    take = sync_to_async(lambda: "".join(islice(lines, size)))
+    while chunk := await take():
+        yield chunk
+
+
+def prepare_resume(path, export_format):
+    """Returns the id of the last user written to a previous export file,
+    or None when it holds no user yet. A line cut short by an interrupted
+    export is truncated first, so the resumed export appends whole lines.
+    Only the end of the file is read."""
+    with open(path, "r+b") as file:
+        end = file.seek(0, 2)
+        position = end
+        buffer = b""
+        while position > 0 and buffer.count(b"\n") < 2:
+            step = min(4096, position)
+            position -= step
+            file.seek(position)
+            buffer = file.read(step) + buffer
+
+        if buffer and not buffer.endswith(b"\n"):
+            partial = len(buffer) - buffer.rfind(b"\n") - 1
+            file.truncate(end - partial)
+            buffer = buffer[:-partial]
+
+    lines = buffer.decode("utf-8").splitlines()
+    if not lines:
+        return None
+    if export_format == "csv":
+        value = next(csv.reader([lines[-1]]))[0]
+        return int(value) if value.isdigit() else None
+    return json.loads(lines[-1])["id"]
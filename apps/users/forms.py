@@ -1,5 +1,53 @@
 from django.contrib.auth.forms import AuthenticationForm
+from django.core.exceptions import ValidationError
+
+from apps.users.admission import client_ip, get_login_admission
+from apps.users.models import CustomUser
 
 
 class CustomAuthenticationForm(AuthenticationForm):
-    pass
\ No newline at end of file
+    # Set by ais_valid() so clean() leaves the credentials check to it
+    defer_authentication = False
+
+    def clean_username(self):
+        """Normalizes the username once at the form boundary so the
+        authentication backend looks it up in its stored lowercase form."""
+        return CustomUser.normalize_username(self.cleaned_data["username"])
+
+    def clean(self):
+        if self.defer_authentication:
+            return self.cleaned_data
+        username = self.cleaned_data.get("username")
+        if username is None or not self.cleaned_data.get("password"):
+            return super().clean()
+        # Checked before the password is hashed, so a rejection stays cheap
+        with get_login_admission().admit(client_ip(self.request), username):
+            return super().clean()
+
+    async def ais_valid(self):
+        """Async is_valid() for ASGI views. The fields are cleaned as usual
+        and the credentials are checked with CustomUserManager.aauthenticate,
+        which runs the authentication backends off the event loop."""
+        self.defer_authentication = True
+        if not self.is_valid():
+            return False
+
+        username = self.cleaned_data["username"]
+        try:
+            async with get_login_admission().aadmit(client_ip(self.request), username):
+                self.user_cache = await CustomUser.objects.aauthenticate(
+                    username, self.cleaned_data["password"], request=self.request
+                )
+        except ValidationError as error:
+            self.add_error(None, error)
+            return False
+        if self.user_cache is None:
+            self.add_error(None, self.get_invalid_login_error())
+            return False
+
+        try:
+            self.confirm_login_allowed(self.user_cache)
+        except ValidationError as error:
+            self.add_error(None, error)
+            return False
+        return True
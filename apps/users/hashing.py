@@ -0,0 +1,64 @@
+import asyncio
+import threading
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.contrib.auth.hashers import make_password
+
+_hashing_executor = None
+_hashing_executor_lock = threading.Lock()
+
+
+def _setup_django():
+    """Make sure Django is configured inside a freshly spawned worker."""
+    import django
+    from django.apps import apps
+
+    if not apps.ready:
+        django.setup()
+
+
+@contextmanager
+def password_hashing_pool(workers):
+    """Yields a process pool to hash passwords with, or None when a single
+    worker is requested and the hashing should stay in-process."""
+    if workers <= 1:
+        yield None
+        return
+
+    with ProcessPoolExecutor(max_workers=workers, initializer=_setup_django) as pool:
+        yield pool
+
+
+def hash_passwords(passwords, pool=None):
+    """Hashes the given raw passwords and returns the encoded values in
+    the same order. PBKDF2 is CPU bound, so when a pool is given the work
+    is spread across its processes."""
+    passwords = list(passwords)
+    if pool is None or len(passwords) <= 1:
+        return [make_password(password) for password in passwords]
+
+    chunksize = max(1, len(passwords) // 32)
+    return list(pool.map(make_password, passwords, chunksize=chunksize))
+
+
+def get_hashing_executor():
+    """Returns the thread pool shared by the async hashing helpers, sized
+    by the USERS_PASSWORD_HASHING_THREADS setting. hashlib releases the GIL
+    while running PBKDF2, so the threads really hash in parallel."""
+    global _hashing_executor
+    if _hashing_executor is None:
+        with _hashing_executor_lock:
+            if _hashing_executor is None:
+                _hashing_executor = ThreadPoolExecutor(
+                    max_workers=settings.USERS_PASSWORD_HASHING_THREADS,
+                    thread_name_prefix="password-hashing",
+                )
+    return _hashing_executor
+
+
+async def amake_password(password):
+    """Async make_password() that hashes off the event loop."""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(get_hashing_executor(), make_password, password)
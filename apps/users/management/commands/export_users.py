@@ -0,0 +1,57 @@
+import os
+import sys
+
+from django.core.management.base import BaseCommand, CommandError
+
+from apps.users.export import EXPORT_FORMATS, export_lines, iter_chunks, prepare_resume
+
+
+class Command(BaseCommand):
+    help = (
+        "Exports the users as CSV or JSONL, streamed with constant memory. "
+        "An interrupted export can be resumed with --resume."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--format", choices=EXPORT_FORMATS, default="csv", help="Output format."
+        )
+        parser.add_argument(
+            "--output", help="File to write the export to, stdout by default."
+        )
+        parser.add_argument(
+            "--after-id", type=int, help="Only export the users with a greater id."
+        )
+        parser.add_argument(
+            "--resume",
+            action="store_true",
+            help="Append to --output the users after the last one it holds.",
+        )
+        parser.add_argument("--chunk-size", type=int, help="Users fetched at once.")
+
+    def handle(self, *args, **options):
+        path = options["output"]
+        after_id = options["after_id"]
+        header = after_id is None
+        mode = "w"
+        if options["resume"]:
+            if not path:
+                raise CommandError("--resume needs --output.")
+            if os.path.exists(path) and os.path.getsize(path):
+                after_id = prepare_resume(path, options["format"])
+                header = after_id is None and not os.path.getsize(path)
+                mode = "a"
+
+        lines = export_lines(
+            options["format"], after_id, options["chunk_size"], header=header
+        )
+        file = open(path, mode, newline="", encoding="utf-8") if path else sys.stdout
+        try:
+            for chunk in iter_chunks(lines):
+                file.write(chunk)
+        finally:
+            if path:
+                file.close()
+
+        if path:
+            self.stdout.write(self.style.SUCCESS(f"Users exported to {path}."))
@@ -0,0 +1,86 @@
+import csv
+import json
+from pathlib import Path
+
+from django.core.management.base import BaseCommand, CommandError
+
+from apps.users.models import CustomUser
+
+BOOLEAN_FIELDS = ("is_active", "is_staff", "is_superuser")
+
+
+class Command(BaseCommand):
+    help = (
+        "Creates users in bulk from a CSV or JSONL file with at least the "
+        "'username' and 'password' columns."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("path", help="CSV or JSONL file with the users.")
+        parser.add_argument(
+            "--format",
+            choices=["csv", "jsonl"],
+            help="Input format. Guessed from the file extension by default.",
+        )
+        parser.add_argument("--batch-size", type=int, help="Users per INSERT.")
+        parser.add_argument(
+            "--workers", type=int, help="Processes used to hash passwords."
+        )
+        parser.add_argument(
+            "--errors", help="Write the rejected rows as CSV to this file."
+        )
+
+    def handle(self, *args, **options):
+        path = Path(options["path"])
+        if not path.is_file():
+            raise CommandError(f"File '{path}' does not exist.")
+
+        input_format = options["format"] or path.suffix.lstrip(".").lower()
+        if input_format == "json":
+            input_format = "jsonl"
+        if input_format not in ("csv", "jsonl"):
+            raise CommandError("Unable to guess the format, use --format.")
+
+        with path.open(newline="", encoding="utf-8") as file:
+            rows = (
+                self.read_csv(file) if input_format == "csv" else self.read_jsonl(file)
+            )
+            result = CustomUser.objects.bulk_create_users(
+                rows,
+                batch_size=options["batch_size"],
+                workers=options["workers"],
+            )
+
+        if options["errors"]:
+            with open(options["errors"], "w", newline="", encoding="utf-8") as file:
+                writer = csv.writer(file)
+                writer.writerow(["row", "username", "message"])
+                writer.writerows(result.errors)
+        else:
+            for error in result.errors:
+                self.stderr.write(
+                    f"Row {error.row} ({error.username}): {error.message}"
+                )
+
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Created {len(result.created)} users, rejected {len(result.errors)} rows."
+            )
+        )
+
+    def read_csv(self, file):
+        for row in csv.DictReader(file):
+            row = {key: value for key, value in row.items() if value != ""}
+            for field in BOOLEAN_FIELDS:
+                if field in row:
+                    row[field] = row[field].strip().lower() in ("1", "true", "yes")
+            yield row
+
+    def read_jsonl(self, file):
+        for line_number, line in enumerate(file, start=1):
+            if not line.strip():
+                continue
+            try:
+                yield json.loads(line)
+            except json.JSONDecodeError as error:
+                raise CommandError(f"Invalid JSON on line {line_number}: {error}")
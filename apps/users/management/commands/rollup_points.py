@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand
+
+from apps.users.points import rollup_points
+
+
+class Command(BaseCommand):
+    help = (
+        "Adds the points ledger entries recorded since the previous run to "
+        "the totals of the users. Meant to run every few minutes."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, help="Users updated per query.")
+
+    def handle(self, *args, **options):
+        updated = rollup_points(batch_size=options["batch_size"])
+        self.stdout.write(self.style.SUCCESS(f"Updated the points of {updated} users."))
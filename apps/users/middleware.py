@@ -0,0 +1,19 @@
+from django.utils import timezone
+
+from apps.users.activity import get_activity_tracker
+
+
+class ActivityMiddleware:
+    """Records when the authenticated users were last seen. The timestamp
+    is buffered by the activity tracker, so it costs no query on the request
+    path."""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        response = self.get_response(request)
+        user = getattr(request, "user", None)
+        if user is not None and user.is_authenticated:
+            get_activity_tracker().record_seen(user.pk, timezone.now())
+        return response
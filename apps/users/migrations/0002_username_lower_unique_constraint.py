@@ -0,0 +1,40 @@
+# Generated by Django 5.0.6 on 2026-10-17 18:45
+
+import django.core.validators
+import django.db.models.functions.text
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("auth", "0012_alter_user_first_name_max_length"),
+        ("users", "0001_initial"),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name="customuser",
+            name="username",
+            field=models.CharField(
+                error_messages={"unique": "A user with that username already exists."},
+                help_text="Required. 50 characters or fewer. Lowercase letters and digits only.",
+                max_length=50,
+                unique=True,
+                validators=[
+                    django.core.validators.RegexValidator(
+                        "^[0-9a-zA-Z]*$", "Only alphanumeric characters are allowed."
+                    )
+                ],
+                verbose_name="username",
+            ),
+        ),
+        migrations.AddConstraint(
+            model_name="customuser",
+            constraint=models.UniqueConstraint(
+                django.db.models.functions.text.Lower("username"),
+                name="users_customuser_username_lower_uniq",
+                violation_error_message="A user with that username already exists.",
+            ),
+        ),
+    ]
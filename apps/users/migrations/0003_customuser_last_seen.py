@@ -0,0 +1,18 @@
+# Generated by Django 5.0.6 on 2026-10-17 19:13
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("users", "0002_username_lower_unique_constraint"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="customuser",
+            name="last_seen",
+            field=models.DateTimeField(blank=True, null=True, verbose_name="last seen"),
+        ),
+    ]
@@ -0,0 +1,82 @@
+# Generated by Django 5.0.6 on 2026-10-17 20:02
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("users", "0003_customuser_last_seen"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="PointsRollup",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("last_entry_id", models.BigIntegerField(verbose_name="last entry id")),
+                ("entries", models.PositiveIntegerField(verbose_name="entries")),
+                ("users", models.PositiveIntegerField(verbose_name="users")),
+                (
+                    "created_at",
+                    models.DateTimeField(auto_now_add=True, verbose_name="created at"),
+                ),
+            ],
+            options={
+                "verbose_name": "points rollup",
+                "verbose_name_plural": "points rollups",
+            },
+        ),
+        migrations.AddField(
+            model_name="customuser",
+            name="points",
+            field=models.IntegerField(
+                default=0,
+                help_text="Total of the points ledger, as of the last rollup.",
+                verbose_name="points",
+            ),
+        ),
+        migrations.CreateModel(
+            name="PointsEntry",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("amount", models.IntegerField(verbose_name="amount")),
+                ("reason", models.CharField(max_length=50, verbose_name="reason")),
+                (
+                    "created_at",
+                    models.DateTimeField(auto_now_add=True, verbose_name="created at"),
+                ),
+                (
+                    "user",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="points_entries",
+                        to=settings.AUTH_USER_MODEL,
+                        verbose_name="user",
+                    ),
+                ),
+            ],
+            options={
+                "verbose_name": "points entry",
+                "verbose_name_plural": "points entries",
+            },
+        ),
+    ]
@@ -0,0 +1,22 @@
+# Generated by Django 5.0.6 on 2026-10-17 20:09
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("users", "0004_points_ledger"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="customuser",
+            name="is_active",
+            field=models.BooleanField(
+                default=True,
+                help_text="Designates whether this user should be treated as active. Unselect this instead of deleting accounts.",
+                verbose_name="active",
+            ),
+        ),
+    ]
@@ -0,0 +1,22 @@
+# Generated by Django 5.0.6 on 2026-10-17 23:40
+
+from django.db import migrations
+
+
+def create_first_rollup(apps, schema_editor):
+    # Concurrent rollups queue on the lock of the first row, which must
+    # exist before the first of them runs
+    PointsRollup = apps.get_model("users", "PointsRollup")
+    if not PointsRollup.objects.exists():
+        PointsRollup.objects.create(last_entry_id=0, entries=0, users=0)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("users", "0005_customuser_is_active"),
+    ]
+
+    operations = [
+        migrations.RunPython(create_first_rollup, migrations.RunPython.noop),
+    ]
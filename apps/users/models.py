@@ -1,14 +1,61 @@
+from collections import namedtuple
+
+from django.conf import settings
+from django.contrib import auth
 from django.contrib.auth.models import (
     AbstractBaseUser,
     BaseUserManager,
     PermissionsMixin,
 )
+from django.core.exceptions import ValidationError
 from django.core.validators import RegexValidator
-from django.db import models
+from django.db import IntegrityError, models, transaction
+from django.db.models.functions import Lower
+from django.dispatch import Signal
 from django.utils.translation import gettext_lazy as _
 
+from apps.users.hashing import amake_password, hash_passwords, password_hashing_pool
+
+RowError = namedtuple("RowError", ["row", "username", "message"])
+
+
+# Sent by CustomUserManager.bulk_create_users with the users it created,
+# which bulk_create() saves without post_save signals
+users_bulk_created = Signal()
+
+
+class BulkCreateResult:
+    """Outcome of a bulk user creation: the users that were inserted and
+    one RowError for every input row that was rejected."""
+
+    def __init__(self):
+        self.created = []
+        self.errors = []
+
+    def add_error(self, row, username, message):
+        self.errors.append(RowError(row, username, str(message)))
+
 
 class CustomUserManager(BaseUserManager):
+    def get_by_natural_key(self, username):
+        """Returns the user with the given username ignoring its case."""
+        return self.get_by_username(username)
+
+    def get_by_username(self, username):
+        """Returns the user whose username matches the given one ignoring
+        its case. The input is normalized once here and matched against
+        Lower(username), which is backed by a unique functional index, so
+        the lookup stays a single indexed query."""
+        return self.alias(username_lower=Lower("username")).get(
+            username_lower=self.model.normalize_username(username)
+        )
+
+    async def aget_by_username(self, username):
+        """See get_by_username()."""
+        return await self.alias(username_lower=Lower("username")).aget(
+            username_lower=self.model.normalize_username(username)
+        )
+
     def create_user(self, username, password, **other_fields):
         """Creates and saves an user with the given
         username and password."""
@@ -31,6 +78,143 @@ class CustomUserManager(BaseUserManager):
         other_fields.setdefault("is_superuser", True)
         return self.create_user(username, password, **other_fields)
 
+    async def acreate_user(self, username, password, **other_fields):
+        """Async create_user() that hashes the password on the hashing
+        executor instead of blocking the event loop."""
+        if not username:
+            raise ValueError(_("The field 'username' must be specified."))
+
+        if not password:
+            raise ValueError(_("The field 'password' must be specified."))
+
+        user = self.model(username=username, **other_fields)
+
+        user.password = await amake_password(password)
+        user._password = password
+        await user.asave(using=self._db)
+        return user
+
+    async def acreate_superuser(self, username, password, **other_fields):
+        """See create_superuser()."""
+        other_fields.setdefault("is_staff", True)
+        other_fields.setdefault("is_superuser", True)
+        return await self.acreate_user(username, password, **other_fields)
+
+    async def aauthenticate(self, username, password, request=None):
+        """Returns the user matching the given credentials or None, like
+        django.contrib.auth.authenticate(): the AUTHENTICATION_BACKENDS are
+        tried in turn and user_login_failed is sent when none accepts them.
+        The password is checked in the thread running the sync code of the
+        request, so the event loop keeps serving other requests."""
+        return await auth.aauthenticate(request, username=username, password=password)
+
+    def bulk_create_users(self, rows, batch_size=None, workers=None):
+        """Creates users from an iterable of dicts holding a 'username', a
+        'password' and any other model fields. Usernames are lowercased and
+        validated like CustomUser.save does, passwords are hashed across a
+        process pool and the users are inserted in bulk_create batches.
+        Rejected rows are reported in the returned BulkCreateResult instead
+        of aborting the whole job."""
+        batch_size = batch_size or settings.USERS_BULK_CREATE_BATCH_SIZE
+        workers = workers or settings.USERS_BULK_CREATE_WORKERS
+        username_field = self.model._meta.get_field("username")
+        result = BulkCreateResult()
+
+        with password_hashing_pool(workers) as pool:
+            batch = {}
+            for row_number, row in enumerate(rows, start=1):
+                fields = dict(row)
+                username = fields.pop("username", None)
+                password = fields.pop("password", None)
+
+                if not username:
+                    result.add_error(
+                        row_number,
+                        username,
+                        _("The field 'username' must be specified."),
+                    )
+                    continue
+
+                if not password:
+                    result.add_error(
+                        row_number,
+                        username,
+                        _("The field 'password' must be specified."),
+                    )
+                    continue
+
+                username = self.model.normalize_username(username)
+                try:
+                    username_field.run_validators(username)
+                    user = self.model(username=username, **fields)
+                except ValidationError as error:
+                    result.add_error(row_number, username, " ".join(error.messages))
+                    continue
+                except TypeError as error:
+                    result.add_error(row_number, username, error)
+                    continue
+
+                if username in batch:
+                    result.add_error(
+                        row_number, username, username_field.error_messages["unique"]
+                    )
+                    continue
+
+                batch[username] = (row_number, user, password)
+                if len(batch) >= batch_size:
+                    self._bulk_create_batch(batch, pool, result)
+                    batch = {}
+
+            if batch:
+                self._bulk_create_batch(batch, pool, result)
+
+        result.errors.sort(key=lambda error: error.row)
+        if result.created:
+            users_bulk_created.send(sender=self.model, users=result.created)
+        return result
+
+    def _bulk_create_batch(self, batch, pool, result):
+        """Hashes and inserts one batch of validated users, reporting the
+        usernames that already exist in the database."""
+        duplicate_message = self.model._meta.get_field("username").error_messages[
+            "unique"
+        ]
+        existing = set(
+            self.filter(username__in=batch.keys()).values_list("username", flat=True)
+        )
+        entries = []
+        for username, (row_number, user, password) in batch.items():
+            if username in existing:
+                result.add_error(row_number, username, duplicate_message)
+            else:
+                entries.append((row_number, user, password))
+
+        hashed_passwords = hash_passwords(
+            [password for _row, _user, password in entries], pool
+        )
+        for (_row, user, _password), hashed_password in zip(entries, hashed_passwords):
+            user.password = hashed_password
+
+        users = [user for _row, user, _password in entries]
+        try:
+            with transaction.atomic(using=self.db):
+                result.created.extend(self.bulk_create(users))
+            return
+        except IntegrityError:
+            pass
+
+        # Someone else inserted one of the usernames after the existence
+        # check, so fall back to row by row inserts for this batch only.
+        for row_number, user, _password in entries:
+            user.pk = None
+            try:
+                with transaction.atomic(using=self.db):
+                    user.save(using=self.db)
+            except IntegrityError:
+                result.add_error(row_number, user.username, duplicate_message)
+            else:
+                result.created.append(user)
+
 
 class CustomUser(AbstractBaseUser, PermissionsMixin):
 
@@ -57,11 +241,86 @@ class CustomUser(AbstractBaseUser, PermissionsMixin):
         help_text=_("Designates whether the user can log into this admin site."),
     )
 
+    is_active = models.BooleanField(
+        _("active"),
+        default=True,
+        help_text=_(
+            "Designates whether this user should be treated as active. "
+            "Unselect this instead of deleting accounts."
+        ),
+    )
+
+    last_seen = models.DateTimeField(_("last seen"), blank=True, null=True)
+
+    points = models.IntegerField(
+        _("points"),
+        default=0,
+        help_text=_("Total of the points ledger, as of the last rollup."),
+    )
+
     objects = CustomUserManager()
 
     USERNAME_FIELD = "username"
 
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                Lower("username"),
+                name="users_customuser_username_lower_uniq",
+                violation_error_message=_("A user with that username already exists."),
+            ),
+        ]
+
+    @classmethod
+    def normalize_username(cls, username):
+        """Applies the base Unicode normalization and lowercases the
+        username, as usernames are case insensitive."""
+        username = super().normalize_username(username)
+        return username.lower() if isinstance(username, str) else username
+
     def save(self, *args, **kwargs):
         # Parse the username to lowercase before saving the record
-        self.username = self.username.lower()
+        self.username = self.normalize_username(self.username)
         super().save(*args, **kwargs)
+
+
+class PointsEntry(models.Model):
+    """Entry of the append-only points ledger: points awarded to, or taken
+    from when negative, a user. The totals are summed into
+    CustomUser.points by periodic rollups."""
+
+    user = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.CASCADE,
+        related_name="points_entries",
+        verbose_name=_("user"),
+    )
+    amount = models.IntegerField(_("amount"))
+    reason = models.CharField(_("reason"), max_length=50)
+    created_at = models.DateTimeField(_("created at"), auto_now_add=True)
+
+    class Meta:
+        verbose_name = _("points entry")
+        verbose_name_plural = _("points entries")
+
+    def save(self, *args, **kwargs):
+        if not self._state.adding:
+            raise ValueError("Points entries cannot be changed once recorded.")
+        super().save(*args, **kwargs)
+
+    def delete(self, *args, **kwargs):
+        raise ValueError("Points entries cannot be deleted.")
+
+
+class PointsRollup(models.Model):
+    """Run of the points rollup, which summed the ledger entries up to
+    last_entry_id into the totals of the users."""
+
+    last_entry_id = models.BigIntegerField(_("last entry id"))
+    entries = models.PositiveIntegerField(_("entries"))
+    users = models.PositiveIntegerField(_("users"))
+    created_at = models.DateTimeField(_("created at"), auto_now_add=True)
+
+    class Meta:
+        verbose_name = _("points rollup")
+        verbose_name_plural = _("points rollups")
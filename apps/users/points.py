@@ -0,0 +1,304 @@
+"""
+Points of the users, kept in an append-only ledger.
+
+Points are awarded by recording PointsEntry rows, never by updating a total.
+rollup_points() periodically sums the new entries into CustomUser.points in
+one batch, and every process ranks the users with a PointsRanking built from
+the ledger and kept up to date with the entries recorded since. Only the
+entries older than USERS_POINTS_SETTLE_DELAY seconds are read, so an entry
+whose transaction commits after a later one, and gets a lower id, is not
+skipped by the watermarks.
+"""
+
+import heapq
+import logging
+import threading
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import F, Max, Sum
+from django.utils import timezone
+
+from apps.users.cache import invalidate_users
+from apps.users.models import CustomUser, PointsEntry, PointsRollup
+
+logger = logging.getLogger(__name__)
+
+# Highest bucket of the ranking: the scores above share it, so one huge award
+# cannot make the tree allocate a bucket per point up to it
+MAX_BUCKET = 2**20
+
+
+def award(user, amount, reason):
+    """Records amount points, which may be negative, for the user."""
+    return PointsEntry.objects.create(user=user, amount=amount, reason=reason)
+
+
+def settled_entries():
+    cutoff = timezone.now() - timedelta(seconds=settings.USERS_POINTS_SETTLE_DELAY)
+    return PointsEntry.objects.filter(created_at__lt=cutoff)
+
+
+def ledger_totals(after_id=0):
+    """Returns the last id of the settled entries recorded after after_id,
+    or None when there is none, and the points they add up to per user."""
+    last_id = settled_entries().filter(pk__gt=after_id).aggregate(last=Max("pk"))
+    last_id = last_id["last"]
+    if last_id is None:
+        return None, {}
+    totals = (
+        PointsEntry.objects.filter(pk__gt=after_id, pk__lte=last_id)
+        .values_list("user_id")
+        .annotate(total=Sum("amount"))
+        .order_by()
+    )
+    return last_id, {user_id: total for user_id, total in totals if total}
+
+
+def rollup_points(batch_size=None):
+    """Adds the entries recorded since the last rollup to the totals of the
+    users and returns the number of users updated. Concurrent rollups wait
+    for each other on the first rollup row, which a migration creates, and
+    only then read how far the last one went."""
+    batch_size = batch_size or settings.USERS_POINTS_ROLLUP_BATCH_SIZE
+    with transaction.atomic():
+        # Locking the last row instead would let a rollup that waited for
+        # it read the watermark the one it waited for just moved past
+        list(PointsRollup.objects.select_for_update().order_by("pk")[:1])
+        last = PointsRollup.objects.order_by("-pk").first()
+        after_id = last.last_entry_id if last is not None else 0
+        last_id, totals = ledger_totals(after_id)
+        if last_id is None:
+            return 0
+
+        CustomUser.objects.bulk_update(
+            [
+                CustomUser(pk=user_id, points=F("points") + total)
+                for user_id, total in totals.items()
+            ],
+            ["points"],
+            batch_size=batch_size,
+        )
+        PointsRollup.objects.create(
+            last_entry_id=last_id,
+            entries=PointsEntry.objects.filter(
+                pk__gt=after_id, pk__lte=last_id
+            ).count(),
+            users=len(totals),
+        )
+        # The cached copies carry the old totals
+        transaction.on_commit(lambda: invalidate_users(totals))
+    return len(totals)
+
+
+class FenwickTree:
+    """Counts indexed from 1 to size, answering prefix sums and searches by
+    cumulative count in O(log size)."""
+
+    def __init__(self, size):
+        self.size = size
+        self.tree = [0] * (size + 1)
+
+    def add(self, index, delta):
+        while index <= self.size:
+            self.tree[index] += delta
+            index += index & -index
+
+    def prefix_sum(self, index):
+        """Sum of the counts from 1 to index."""
+        total = 0
+        index = min(index, self.size)
+        while index > 0:
+            total += self.tree[index]
+            index -= index & -index
+        return total
+
+    def search(self, count):
+        """Smallest index whose prefix sum reaches count, for 1 <= count <=
+        the total of the counts."""
+        index = 0
+        step = 1 << self.size.bit_length()
+        while step:
+            following = index + step
+            if following <= self.size and self.tree[following] < count:
+                index = following
+                count -= self.tree[following]
+            step >>= 1
+        return index + 1
+
+
+class PointsRanking:
+    """Order statistics of the users with positive points, answering the
+    rank of a score and the top users in O(log max_bucket).
+
+    A Fenwick tree counts the users of each score, one bucket per point,
+    and the users of each bucket are kept in a set to list them. The tree
+    doubles in size when a score outgrows it, up to max_bucket buckets: the
+    scores above share the last bucket, whose users are told apart by their
+    scores, which only costs a scan of the few users that far ahead. The
+    ranking is built from the ledger on first use, then applies the entries
+    recorded since its last refresh once it is older than refresh_interval
+    seconds, in a background thread while it keeps answering."""
+
+    def __init__(self, refresh_interval=30, max_bucket=MAX_BUCKET):
+        self.refresh_interval = refresh_interval
+        self.max_bucket = max_bucket
+        self.last_entry_id = None
+        self.ranked = 0
+        self.refreshes = 0
+        self._scores = {}
+        self._members = {}
+        self._tree = FenwickTree(1024)
+        self._refreshed_at = 0.0
+        self._lock = threading.Lock()
+        self._refresh_lock = threading.Lock()
+
+    def build(self):
+        """Rebuilds the ranking from the whole ledger."""
+        last_id, totals = ledger_totals()
+        with self._lock:
+            self._scores = {}
+            self._members = {}
+            self._tree = FenwickTree(1024)
+            self.ranked = 0
+            self._apply(totals)
+            self.last_entry_id = last_id or 0
+            self._refreshed_at = time.monotonic()
+
+    def refresh(self):
+        """Applies the settled entries recorded since the last refresh and
+        returns the number of users whose points changed."""
+        last_id, totals = ledger_totals(self.last_entry_id)
+        with self._lock:
+            if last_id is not None and last_id > self.last_entry_id:
+                self._apply(totals)
+                self.last_entry_id = last_id
+            self._refreshed_at = time.monotonic()
+            self.refreshes += 1
+        return len(totals)
+
+    def _apply(self, totals):
+        for user_id, delta in totals.items():
+            self._move(user_id, self._scores.get(user_id, 0) + delta)
+
+    def _bucket(self, points):
+        return min(points, self.max_bucket)
+
+    def _move(self, user_id, points):
+        previous = self._scores.pop(user_id, 0)
+        if previous > 0:
+            bucket = self._bucket(previous)
+            members = self._members[bucket]
+            members.discard(user_id)
+            if not members:
+                del self._members[bucket]
+            self._tree.add(bucket, -1)
+            self.ranked -= 1
+        if points > 0:
+            bucket = self._bucket(points)
+            if bucket > self._tree.size:
+                self._grow(bucket)
+            self._scores[user_id] = points
+            self._members.setdefault(bucket, set()).add(user_id)
+            self._tree.add(bucket, 1)
+            self.ranked += 1
+        elif points:
+            self._scores[user_id] = points
+
+    def _grow(self, bucket):
+        size = self._tree.size
+        while size < bucket:
+            size *= 2
+        self._tree = FenwickTree(min(size, self.max_bucket))
+        for index, members in self._members.items():
+            self._tree.add(index, len(members))
+
+    def ensure_ready(self):
+        """Builds the ranking on first use, or starts a background refresh
+        when it is stale."""
+        if self.last_entry_id is None:
+            with self._refresh_lock:
+                if self.last_entry_id is None:
+                    self.build()
+            return
+        stale = time.monotonic() - self._refreshed_at >= self.refresh_interval
+        if stale and self._refresh_lock.acquire(blocking=False):
+            threading.Thread(
+                target=self._background_refresh,
+                name="points-ranking-refresh",
+                daemon=True,
+            ).start()
+
+    def _background_refresh(self):
+        try:
+            self.refresh()
+        except Exception:
+            logger.exception("Failed to refresh the points ranking.")
+        finally:
+            self._refreshed_at = time.monotonic()
+            self._refresh_lock.release()
+            connection.close()
+
+    def points(self, user_id):
+        with self._lock:
+            return self._scores.get(user_id, 0)
+
+    def rank(self, points):
+        """Returns 1 plus the number of users with more points, which ranks
+        the users with no points or less after all the others."""
+        with self._lock:
+            bucket = self._bucket(max(points, 0))
+            ahead = self.ranked - self._tree.prefix_sum(bucket)
+            if bucket == self.max_bucket:
+                ahead += sum(
+                    self._scores[user_id] > points
+                    for user_id in self._members.get(bucket, ())
+                )
+            return 1 + ahead
+
+    def top(self, count):
+        """Returns up to count (user id, points) pairs, by decreasing points
+        then increasing user id."""
+        with self._lock:
+            results = []
+            taken = 0
+            while len(results) < count and taken < self.ranked:
+                # Bucket of the (taken + 1)th best user, counted from the bottom
+                bucket = self._tree.search(self.ranked - taken)
+                members = self._members[bucket]
+                best = heapq.nsmallest(
+                    count - len(results),
+                    members,
+                    key=lambda user_id: (-self._scores[user_id], user_id),
+                )
+                results.extend((user_id, self._scores[user_id]) for user_id in best)
+                taken += len(members)
+            return results
+
+    def report(self):
+        with self._lock:
+            return {
+                "ranked_users": self.ranked,
+                "buckets": self._tree.size,
+                "last_entry_id": self.last_entry_id,
+                "refreshes": self.refreshes,
+            }
+
+
+_points_ranking = None
+_points_ranking_lock = threading.Lock()
+
+
+def get_points_ranking():
+    """Returns the points ranking of the process, configured from the
+    USERS_POINTS_* settings."""
+    global _points_ranking
+    if _points_ranking is None:
+        with _points_ranking_lock:
+            if _points_ranking is None:
+                _points_ranking = PointsRanking(
+                    refresh_interval=settings.USERS_POINTS_REFRESH_INTERVAL
+                )
+    return _points_ranking
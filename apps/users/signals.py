@@ -0,0 +1,82 @@
+from django.contrib.auth.models import Group, Permission
+from django.contrib.auth.signals import user_logged_in
+from django.db import transaction
+from django.db.models.signals import m2m_changed, post_delete, post_save
+from django.dispatch import receiver
+from django.utils import timezone
+
+from apps.users.activity import get_activity_tracker
+from apps.users.availability import get_username_filter
+from apps.users.cache import (
+    bump_groups_permissions_version,
+    bump_permissions_version,
+    invalidate_user,
+)
+from apps.users.models import CustomUser, users_bulk_created
+
+
+@receiver(post_save, sender=CustomUser)
+@receiver(post_delete, sender=CustomUser)
+def invalidate_cached_user(sender, instance, created=False, **kwargs):
+    """Drops the cached copy of a user whenever it is saved, which includes
+    password changes, or deleted. A saved user may also have lost its
+    is_active or is_superuser flag, which the permission snapshots depend
+    on."""
+    invalidate_user(instance.pk)
+    if kwargs["signal"] is post_save and not created:
+        bump_permissions_version([instance.pk])
+
+
+@receiver(m2m_changed, sender=CustomUser.user_permissions.through)
+@receiver(m2m_changed, sender=CustomUser.groups.through)
+def invalidate_user_permissions(sender, instance, action, reverse, pk_set, **kwargs):
+    """Invalidates the permission snapshots of the users whose direct
+    permissions or groups changed, from either side of the relation."""
+    if not action.startswith("post_"):
+        return
+
+    if not reverse:
+        bump_permissions_version([instance.pk])
+    elif action == "post_clear":
+        # pk_set is None when the relation is cleared from the other side
+        bump_groups_permissions_version()
+    else:
+        bump_permissions_version(pk_set)
+
+
+@receiver(m2m_changed, sender=Group.permissions.through)
+@receiver(post_save, sender=Permission)
+@receiver(post_delete, sender=Permission)
+@receiver(post_delete, sender=Group)
+def invalidate_groups_permissions(sender, **kwargs):
+    """Invalidates every permission snapshot when the permissions granted
+    through groups change."""
+    if kwargs.get("action", "post_").startswith("post_"):
+        bump_groups_permissions_version()
+
+
+@receiver(post_save, sender=CustomUser)
+def add_username_to_filter(sender, instance, created, **kwargs):
+    """Makes the usernames of new users unavailable right away, in every
+    worker. Deleted usernames stay in the filter until it is rebuilt, which
+    only costs a database check."""
+    if created:
+        username = instance.username
+        transaction.on_commit(lambda: get_username_filter().add(username))
+
+
+@receiver(users_bulk_created)
+def add_usernames_to_filter(sender, users, **kwargs):
+    usernames = [user.username for user in users]
+    transaction.on_commit(lambda: get_username_filter().add_many(usernames))
+
+
+# The login timestamp is buffered by the activity tracker instead of being
+# written by an UPDATE during the login request
+user_logged_in.disconnect(dispatch_uid="update_last_login")
+
+
+@receiver(user_logged_in, dispatch_uid="record_last_login")
+def record_last_login(sender, user, **kwargs):
+    user.last_login = timezone.now().replace(second=0, microsecond=0)
+    get_activity_tracker().record_login(user.pk, user.last_login)
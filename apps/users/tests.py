@@ -1,10 +1,36 @@
+import asyncio
+import json
+import random
+import tempfile
+import threading
+import time
+from datetime import datetime, timezone
+from io import StringIO
+from pathlib import Path
+from unittest import mock
+
 from django.contrib.auth import get_user_model
+from django.contrib.auth.signals import user_login_failed
+from django.contrib.auth.models import Group, Permission
+from django.core.cache import cache
+from django.core.management import call_command
 from django.core.exceptions import ValidationError
-from django.db import IntegrityError
+from django.db import IntegrityError, connection
 from django.db.utils import DataError
-from django.test import TestCase
+from django.test import RequestFactory, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
 
-from apps.users.models import CustomUser
+from apps.core.pagination import estimated_count
+from apps.users import admission
+from apps.users.admin import update_in_chunks
+from apps.users.activity import ActivityTracker
+from apps.users.availability import BloomFilter, UsernameFilter, get_username_filter
+from apps.users.backends import CachedModelBackend
+from apps.users.export import export_lines, prepare_resume
+from apps.users.cache import permissions_cache_stats, user_cache_stats
+from apps.users.models import CustomUser, PointsEntry, PointsRollup
+from apps.users.points import FenwickTree, PointsRanking, award, rollup_points
 from apps.users.forms import CustomAuthenticationForm
 
 
@@ -202,7 +228,7 @@ class CustomAuthenticationFormTest(TestCase):
         """Test form is valid when the user types valid credentials."""
         form = self.get_form("myusername", "secure-password")
         self.assertTrue(form.is_valid())
-        self.assertFalse(form.errors) # Check if the set of errors is empty
+        self.assertFalse(form.errors)  # Check if the set of errors is empty
 
     def test_authentication_form_fails_with_invalid_credentials(self):
         """Test form is not valid when the credentials are not valid."""
@@ -236,4 +262,1077 @@ class CustomAuthenticationFormTest(TestCase):
         """Test form is not valid when the field 'password' is null."""
         form = self.get_form("myusername", None)
         self.assertFalse(form.is_valid())
-        self.validate_missing_required_field_in_form("password", form)
\ No newline at end of file
+        self.validate_missing_required_field_in_form("password", form)
+
+
+class CustomUserBulkCreateTest(TestCase):
+
+    def setUp(self):
+        self.test_user = CustomUser.objects.create_user(
+            username="myusername",
+            password="secure-password",
+        )
+
+    def test_bulk_create_users_with_valid_rows(self):
+        """Test that every valid row is created with a lowercased username,
+        a usable hashed password and the extra fields given."""
+        result = CustomUser.objects.bulk_create_users(
+            [
+                {"username": "JohnDoe", "password": "secure-password"},
+                {"username": "janedoe", "password": "other-password", "is_staff": True},
+            ],
+            workers=1,
+        )
+        self.assertEqual(len(result.created), 2)
+        self.assertEqual(result.errors, [])
+
+        john = CustomUser.objects.get(username="johndoe")
+        jane = CustomUser.objects.get(username="janedoe")
+        self.assertTrue(john.check_password("secure-password"))
+        self.assertFalse(john.is_staff)
+        self.assertTrue(jane.check_password("other-password"))
+        self.assertTrue(jane.is_staff)
+
+    def test_bulk_create_users_reports_invalid_rows(self):
+        """Test that duplicated, missing and non alphanumeric usernames are
+        reported per row without stopping the creation of the valid ones."""
+        result = CustomUser.objects.bulk_create_users(
+            [
+                {"username": "MyUsername", "password": "secure-password"},
+                {"username": "johndoe", "password": "secure-password"},
+                {"username": "JOHNDOE", "password": "secure-password"},
+                {"username": "", "password": "secure-password"},
+                {"username": "janedoe", "password": ""},
+                {"username": "my username", "password": "secure-password"},
+                {"username": "u" * 51, "password": "secure-password"},
+            ],
+            batch_size=2,
+            workers=1,
+        )
+        self.assertEqual([user.username for user in result.created], ["johndoe"])
+        self.assertEqual([error.row for error in result.errors], [1, 3, 4, 5, 6, 7])
+        self.assertEqual(
+            result.errors[0].message, "A user with that username already exists."
+        )
+        self.assertEqual(
+            result.errors[2].message, "The field 'username' must be specified."
+        )
+        self.assertEqual(
+            result.errors[3].message, "The field 'password' must be specified."
+        )
+        self.assertEqual(
+            result.errors[4].message, "Only alphanumeric characters are allowed."
+        )
+        self.assertEqual(CustomUser.objects.count(), 2)
+
+    def test_bulk_create_users_hashes_in_process_pool(self):
+        """Test that passwords hashed by the worker processes are valid."""
+        result = CustomUser.objects.bulk_create_users(
+            [
+                {"username": f"user{number}", "password": f"password-{number}"}
+                for number in range(3)
+            ],
+            workers=2,
+        )
+        self.assertEqual(len(result.created), 3)
+        for number in range(3):
+            user = CustomUser.objects.get(username=f"user{number}")
+            self.assertTrue(user.check_password(f"password-{number}"))
+
+    def test_import_users_command(self):
+        """Test that the import_users command reads CSV and JSONL files and
+        writes the rejected rows to the errors report."""
+        with tempfile.TemporaryDirectory() as directory:
+            csv_path = Path(directory) / "users.csv"
+            csv_path.write_text(
+                "username,password,is_staff\n"
+                "JohnDoe,secure-password,true\n"
+                "myusername,secure-password,false\n"
+            )
+            jsonl_path = Path(directory) / "users.jsonl"
+            jsonl_path.write_text(
+                '{"username": "janedoe", "password": "secure-password"}\n'
+            )
+            errors_path = Path(directory) / "errors.csv"
+
+            call_command(
+                "import_users",
+                str(csv_path),
+                workers=1,
+                errors=str(errors_path),
+                stdout=StringIO(),
+            )
+            call_command("import_users", str(jsonl_path), workers=1, stdout=StringIO())
+
+            self.assertIn("2,myusername,", errors_path.read_text())
+
+        self.assertTrue(CustomUser.objects.get(username="johndoe").is_staff)
+        self.assertTrue(CustomUser.objects.filter(username="janedoe").exists())
+
+
+class CaseInsensitiveUsernameTest(TestCase):
+
+    def setUp(self):
+        self.test_user = CustomUser.objects.create_user(
+            username="myusername",
+            password="secure-password",
+        )
+
+    def test_get_by_natural_key_ignores_case(self):
+        """Test that the user is found with a single query whatever the case
+        of the given username."""
+        with self.assertNumQueries(1):
+            user = CustomUser.objects.get_by_natural_key("MyUserName")
+        self.assertEqual(user, self.test_user)
+
+    def test_get_by_username_with_unknown_username(self):
+        """Test that looking up an unknown username raises DoesNotExist."""
+        with self.assertRaises(CustomUser.DoesNotExist):
+            CustomUser.objects.get_by_username("johndoe")
+
+    def test_authentication_form_accepts_mixed_case_username(self):
+        """Test that users can log in typing their username in any case."""
+        form = CustomAuthenticationForm(
+            data={"username": "MYUSERNAME", "password": "secure-password"}
+        )
+        self.assertTrue(form.is_valid())
+        self.assertEqual(form.get_user(), self.test_user)
+        self.assertEqual(form.cleaned_data["username"], "myusername")
+
+    def test_database_rejects_usernames_differing_only_in_case(self):
+        """Test that the Lower(username) constraint rejects rows that bypass
+        CustomUser.save and would otherwise duplicate a username."""
+        with self.assertRaises(IntegrityError):
+            CustomUser.objects.bulk_create([CustomUser(username="MyUsername")])
+
+
+class AsyncAccountAPITest(TestCase):
+
+    def setUp(self):
+        self.test_user = CustomUser.objects.create_user(
+            username="myusername",
+            password="secure-password",
+        )
+
+    async def test_acreate_user_with_valid_credentials(self):
+        """Test that acreate_user stores a lowercased username and a usable
+        hashed password."""
+        user = await CustomUser.objects.acreate_user(
+            username="JohnDoe", password="secure-password"
+        )
+        saved_user = await CustomUser.objects.aget(pk=user.pk)
+        self.assertEqual(saved_user.username, "johndoe")
+        self.assertTrue(await saved_user.acheck_password("secure-password"))
+        self.assertFalse(saved_user.is_staff)
+
+    async def test_acreate_superuser_with_valid_credentials(self):
+        """Test that acreate_superuser sets the staff and superuser flags."""
+        superuser = await CustomUser.objects.acreate_superuser(
+            username="mysuperusername", password="secure-superpassword"
+        )
+        self.assertTrue(superuser.is_staff)
+        self.assertTrue(superuser.is_superuser)
+
+    async def test_acreate_user_without_credentials_raises_error(self):
+        """Test that acreate_user validates its arguments like create_user."""
+        with self.assertRaisesMessage(
+            ValueError, "The field 'username' must be specified."
+        ):
+            await CustomUser.objects.acreate_user(username="", password="password")
+
+        with self.assertRaisesMessage(
+            ValueError, "The field 'password' must be specified."
+        ):
+            await CustomUser.objects.acreate_user(username="johndoe", password="")
+
+    async def test_aauthenticate(self):
+        """Test that aauthenticate returns the user only for valid
+        credentials."""
+        user = await CustomUser.objects.aauthenticate("MyUsername", "secure-password")
+        self.assertEqual(user, self.test_user)
+
+        self.assertIsNone(
+            await CustomUser.objects.aauthenticate("myusername", "wrong-password")
+        )
+        self.assertIsNone(
+            await CustomUser.objects.aauthenticate("johndoe", "secure-password")
+        )
+
+    async def test_aauthenticate_runs_the_authentication_backends(self):
+        """Test that aauthenticate goes through the configured backends and
+        sends user_login_failed like the sync path."""
+        failures = []
+
+        def receiver(sender, credentials, request, **kwargs):
+            failures.append((credentials["username"], request))
+
+        user_login_failed.connect(receiver)
+        self.addCleanup(user_login_failed.disconnect, receiver)
+        request = RequestFactory().post("/")
+        self.assertIsNone(
+            await CustomUser.objects.aauthenticate(
+                "myusername", "wrong-password", request=request
+            )
+        )
+        self.assertEqual(failures, [("myusername", request)])
+
+        with mock.patch.object(
+            CachedModelBackend, "authenticate", return_value=self.test_user
+        ) as authenticate:
+            user = await CustomUser.objects.aauthenticate("johndoe", "wrong-password")
+        self.assertEqual(user, self.test_user)
+        authenticate.assert_called_once()
+
+    async def test_authentication_form_ais_valid(self):
+        """Test the async validation of the authentication form."""
+        form = CustomAuthenticationForm(
+            data={"username": "MyUsername", "password": "secure-password"}
+        )
+        self.assertTrue(await form.ais_valid())
+        self.assertEqual(form.get_user(), self.test_user)
+
+        form = CustomAuthenticationForm(
+            data={"username": "myusername", "password": "wrong-password"}
+        )
+        self.assertFalse(await form.ais_valid())
+        self.assertIn("__all__", form.errors)
+
+        form = CustomAuthenticationForm(data={"username": "", "password": "password"})
+        self.assertFalse(await form.ais_valid())
+        self.assertIn("username", form.errors)
+
+    async def test_event_loop_stays_responsive_during_login_burst(self):
+        """Load test: while a burst of logins is being checked, an unrelated
+        task ticking every few milliseconds must keep its p99 scheduling
+        delay far below the cost of a single password hash."""
+        tick = 0.005
+        delays = []
+        burst_done = asyncio.Event()
+
+        async def unrelated_requests():
+            while not burst_done.is_set():
+                started = time.perf_counter()
+                await asyncio.sleep(tick)
+                delays.append(time.perf_counter() - started - tick)
+
+        async def login_burst():
+            await asyncio.gather(
+                *(
+                    CustomUser.objects.aauthenticate("myusername", "secure-password")
+                    for _ in range(8)
+                )
+            )
+            burst_done.set()
+
+        started = time.perf_counter()
+        await asyncio.gather(unrelated_requests(), login_burst())
+        burst_duration = time.perf_counter() - started
+
+        delays.sort()
+        p99 = delays[int(len(delays) * 0.99) - 1]
+        self.assertGreater(len(delays), 10)
+        self.assertLess(p99, min(0.05, burst_duration / 8))
+
+
+class CachedModelBackendTest(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        user_cache_stats.reset()
+        self.backend = CachedModelBackend()
+        self.test_user = CustomUser.objects.create_user(
+            username="myusername",
+            password="secure-password",
+        )
+
+    def test_get_user_is_served_from_cache(self):
+        """Test that only the first resolution of a user hits the database
+        and that the hit/miss counters reflect it."""
+        with self.assertNumQueries(1):
+            self.assertEqual(self.backend.get_user(self.test_user.pk), self.test_user)
+
+        with self.assertNumQueries(0):
+            user = self.backend.get_user(self.test_user.pk)
+        self.assertEqual(user, self.test_user)
+        self.assertEqual(user.username, "myusername")
+        self.assertFalse(user.is_staff)
+        self.assertFalse(user.is_superuser)
+        self.assertEqual(
+            user.get_session_auth_hash(), self.test_user.get_session_auth_hash()
+        )
+        self.assertEqual(
+            user_cache_stats.as_dict(), {"hits": 1, "misses": 1, "hit_ratio": 0.5}
+        )
+
+    def test_cached_user_is_invalidated_on_save(self):
+        """Test that changing the password or any other field drops the
+        cached copy of the user."""
+        self.backend.get_user(self.test_user.pk)
+
+        self.test_user.set_password("new-secure-password")
+        self.test_user.save()
+        with self.assertNumQueries(1):
+            user = self.backend.get_user(self.test_user.pk)
+        self.assertTrue(user.check_password("new-secure-password"))
+
+        self.test_user.is_staff = True
+        self.test_user.save()
+        self.assertTrue(self.backend.get_user(self.test_user.pk).is_staff)
+
+    def test_cached_user_is_invalidated_on_delete(self):
+        """Test that deleted users are no longer resolved."""
+        user_id = self.test_user.pk
+        self.backend.get_user(user_id)
+        self.test_user.delete()
+        self.assertIsNone(self.backend.get_user(user_id))
+
+    def test_session_authenticated_requests_use_cache(self):
+        """Test that the user of a logged in client is resolved without
+        querying the user table once cached."""
+        self.client.force_login(self.test_user)
+        self.client.get("/admin/")
+        self.client.get("/admin/")
+        self.assertGreaterEqual(user_cache_stats.hits, 1)
+
+
+class PermissionsSnapshotTest(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        permissions_cache_stats.reset()
+        self.test_user = CustomUser.objects.create_user(
+            username="myusername",
+            password="secure-password",
+        )
+        self.add_user = Permission.objects.get(codename="add_customuser")
+        self.change_user = Permission.objects.get(codename="change_customuser")
+        self.group = Group.objects.create(name="moderators")
+        self.group.permissions.add(self.change_user)
+
+    def get_user(self):
+        """Returns a fresh copy of the test user, as a new request would."""
+        return CustomUser.objects.get(pk=self.test_user.pk)
+
+    def test_warm_snapshot_costs_no_queries(self):
+        """Test that once compiled, the permissions of a user are answered
+        from the cache without querying the database."""
+        self.test_user.user_permissions.add(self.add_user)
+        self.test_user.groups.add(self.group)
+        self.get_user().get_all_permissions()
+
+        user = self.get_user()
+        with self.assertNumQueries(0):
+            self.assertTrue(user.has_perm("users.add_customuser"))
+            self.assertTrue(user.has_perm("users.change_customuser"))
+            self.assertFalse(user.has_perm("users.delete_customuser"))
+            self.assertEqual(
+                user.get_all_permissions(),
+                {"users.add_customuser", "users.change_customuser"},
+            )
+        self.assertEqual(permissions_cache_stats.hits, 1)
+
+    def test_user_permission_changes_take_effect_at_once(self):
+        """Test that adding or removing direct permissions and groups
+        invalidates the snapshot of the user."""
+        self.assertFalse(self.get_user().has_perm("users.add_customuser"))
+
+        self.test_user.user_permissions.add(self.add_user)
+        self.assertTrue(self.get_user().has_perm("users.add_customuser"))
+
+        self.add_user.user_set.remove(self.test_user)
+        self.assertFalse(self.get_user().has_perm("users.add_customuser"))
+
+        self.group.user_set.add(self.test_user)
+        self.assertTrue(self.get_user().has_perm("users.change_customuser"))
+
+        self.test_user.groups.clear()
+        self.assertFalse(self.get_user().has_perm("users.change_customuser"))
+
+    def test_group_permission_changes_take_effect_at_once(self):
+        """Test that changing the permissions of a group invalidates the
+        snapshots of its members."""
+        self.test_user.groups.add(self.group)
+        self.assertFalse(self.get_user().has_perm("users.add_customuser"))
+
+        self.group.permissions.add(self.add_user)
+        self.assertTrue(self.get_user().has_perm("users.add_customuser"))
+
+        self.group.delete()
+        self.assertFalse(self.get_user().has_perm("users.add_customuser"))
+
+    def test_demoted_superusers_lose_their_permissions(self):
+        """Test that the snapshot of a superuser is dropped when the user
+        is demoted, or deactivated in bulk."""
+        self.test_user.is_superuser = True
+        self.test_user.save()
+        self.assertTrue(self.get_user().has_perm("users.add_customuser"))
+        self.assertIn("users.add_customuser", self.get_user().get_all_permissions())
+
+        self.test_user.is_superuser = False
+        self.test_user.save()
+        self.assertFalse(self.get_user().has_perm("users.add_customuser"))
+
+        self.test_user.user_permissions.add(self.add_user)
+        self.assertTrue(self.get_user().has_perm("users.add_customuser"))
+        update_in_chunks(CustomUser.objects.all(), is_active=False)
+        self.assertFalse(self.get_user().get_all_permissions())
+
+
+class ActivityTrackerTest(TestCase):
+
+    def setUp(self):
+        self.tracker = ActivityTracker(flush_interval=0, batch_size=2)
+        self.users = [
+            CustomUser.objects.create_user(username=f"user{number}", password="x")
+            for number in range(3)
+        ]
+
+    def test_timestamps_are_coalesced_per_user_and_minute(self):
+        """Test that only the latest timestamp of each user is kept,
+        truncated to the minute, and written by bulk updates."""
+        user = self.users[0]
+        self.tracker.record_seen(
+            user.pk, datetime(2024, 5, 1, 10, 0, 59, tzinfo=timezone.utc)
+        )
+        self.tracker.record_seen(
+            user.pk, datetime(2024, 5, 1, 10, 2, 30, tzinfo=timezone.utc)
+        )
+        self.tracker.record_seen(
+            user.pk, datetime(2024, 5, 1, 10, 1, 0, tzinfo=timezone.utc)
+        )
+        self.tracker.record_login(
+            user.pk, datetime(2024, 5, 1, 9, 0, 10, tzinfo=timezone.utc)
+        )
+        for other in self.users[1:]:
+            self.tracker.record_seen(
+                other.pk, datetime(2024, 5, 1, 8, 0, tzinfo=timezone.utc)
+            )
+        self.assertEqual(len(self.tracker), 3)
+
+        # Two batches of two users
+        with self.assertNumQueries(2):
+            self.assertEqual(self.tracker.flush(), 3)
+        self.assertEqual(len(self.tracker), 0)
+
+        user.refresh_from_db()
+        self.assertEqual(
+            user.last_seen, datetime(2024, 5, 1, 10, 2, tzinfo=timezone.utc)
+        )
+        self.assertEqual(
+            user.last_login, datetime(2024, 5, 1, 9, 0, tzinfo=timezone.utc)
+        )
+        self.users[1].refresh_from_db()
+        self.assertIsNone(self.users[1].last_login)
+
+    def test_late_flush_never_moves_timestamps_back(self):
+        """Test that an older timestamp flushed after a newer one was written
+        leaves the newer one in place."""
+        user = self.users[0]
+        self.tracker.record_seen(
+            user.pk, datetime(2024, 5, 1, 10, 0, tzinfo=timezone.utc)
+        )
+        self.tracker.flush()
+        self.tracker.record_seen(
+            user.pk, datetime(2024, 5, 1, 9, 0, tzinfo=timezone.utc)
+        )
+        self.tracker.flush()
+        user.refresh_from_db()
+        self.assertEqual(
+            user.last_seen, datetime(2024, 5, 1, 10, 0, tzinfo=timezone.utc)
+        )
+
+    def test_login_and_requests_do_not_write_activity(self):
+        """Test that logging in and browsing only buffer the timestamps, which
+        are written on the next flush."""
+        user = self.users[0]
+        # The tracker of the process flushes from its own thread
+        tracker = ActivityTracker(flush_interval=0)
+        patcher = mock.patch("apps.users.activity._activity_tracker", tracker)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.assertTrue(self.client.login(username="user0", password="x"))
+        self.client.get("/admin/")
+        user.refresh_from_db()
+        self.assertIsNone(user.last_login)
+        self.assertIsNone(user.last_seen)
+
+        tracker.flush()
+        user.refresh_from_db()
+        self.assertIsNotNone(user.last_login)
+        self.assertEqual(user.last_seen.second, 0)
+        self.assertGreaterEqual(user.last_seen, user.last_login)
+
+
+class UsernameAvailabilityTest(TestCase):
+
+    def setUp(self):
+        CustomUser.objects.create_user(username="taken", password="x")
+        self.username_filter = UsernameFilter(error_rate=0.01, rebuild_interval=3600)
+
+    def test_bloom_filter_has_no_false_negatives(self):
+        """Test that every added item is reported present and that the false
+        positive rate stays close to the configured one."""
+        bloom = BloomFilter(capacity=1000, error_rate=0.01)
+        for number in range(1000):
+            bloom.add(f"user{number}")
+        self.assertTrue(all(f"user{number}" in bloom for number in range(1000)))
+        false_positives = sum(f"other{number}" in bloom for number in range(10000))
+        self.assertLess(false_positives, 300)
+        self.assertEqual(len(bloom.bits), 1199)
+        self.assertEqual(bloom.hash_count, 7)
+
+    def test_free_usernames_are_answered_without_the_database(self):
+        """Test that only possible matches of the filter are checked against
+        the database and that the avoided queries are reported."""
+        self.username_filter.build()
+        with self.assertNumQueries(0):
+            self.assertFalse(self.username_filter.is_taken("free"))
+        with self.assertNumQueries(1):
+            self.assertTrue(self.username_filter.is_taken("taken"))
+
+        report = self.username_filter.report()
+        self.assertEqual(report["lookups"], 2)
+        self.assertEqual(report["db_avoided"], 1)
+        self.assertEqual(report["db_avoidance_rate"], 0.5)
+        self.assertEqual(report["usernames"], 1)
+        self.assertGreater(report["size_bytes"], 0)
+
+    def test_stale_filter_is_rebuilt_in_the_background(self):
+        """Test that a stale filter keeps answering while it is rebuilt,
+        with a single rebuild at a time."""
+        bloom = self.username_filter.build()
+        self.username_filter.rebuild_interval = 0
+        rebuilt = threading.Event()
+        self.username_filter._rebuild = rebuilt.set
+        self.assertIs(self.username_filter.get_filter(), bloom)
+        self.assertTrue(rebuilt.wait(5))
+        # The lock is held until the rebuild ends, so no other one starts
+        rebuilt.clear()
+        self.assertIs(self.username_filter.get_filter(), bloom)
+        self.assertFalse(rebuilt.is_set())
+        self.username_filter._lock.release()
+
+    def test_new_users_are_added_on_commit(self):
+        """Test that users created by the process become unavailable once
+        their transaction commits."""
+        username_filter = get_username_filter()
+        username_filter.build()
+        with self.captureOnCommitCallbacks(execute=True):
+            CustomUser.objects.create_user(username="newcomer", password="x")
+        self.assertIn("newcomer", username_filter.get_filter())
+
+    def test_usernames_of_other_workers_are_checked(self):
+        """Test that a username created since the last rebuild is confirmed
+        against the database even when the filter lacks it, that bulk
+        created usernames are added too and that deleted usernames are
+        reported free."""
+        self.username_filter.build()
+        other_worker = UsernameFilter(error_rate=0.01, rebuild_interval=3600)
+        other_worker.build()
+        with mock.patch(
+            "apps.users.signals.get_username_filter", return_value=other_worker
+        ), self.captureOnCommitCallbacks(execute=True):
+            user = CustomUser.objects.create_user(username="newcomer", password="x")
+            CustomUser.objects.bulk_create_users(
+                [{"username": "imported", "password": "x"}], workers=1
+            )
+        self.assertNotIn("newcomer", self.username_filter.get_filter())
+        with self.assertNumQueries(1):
+            self.assertTrue(self.username_filter.is_taken("newcomer"))
+        self.assertTrue(self.username_filter.is_taken("imported"))
+        self.assertIn("imported", other_worker.get_filter())
+
+        user.delete()
+        self.assertFalse(other_worker.is_taken("newcomer"))
+
+    def test_availability_endpoint(self):
+        """Test the answers of the endpoint for free, taken and invalid
+        usernames."""
+        get_username_filter().build()
+        url = reverse("users:availability")
+        self.assertEqual(
+            self.client.get(url, {"username": "Free"}).json(),
+            {"username": "free", "available": True},
+        )
+        self.assertFalse(
+            self.client.get(url, {"username": "TAKEN"}).json()["available"]
+        )
+
+        response = self.client.get(url, {"username": "not valid"})
+        self.assertEqual(response.status_code, 400)
+        self.assertIn(
+            "Only alphanumeric characters are allowed.", response.json()["errors"]
+        )
+
+
+class UserExportTest(TestCase):
+
+    def setUp(self):
+        self.users = [
+            CustomUser.objects.create_user(username=f"user{number}", password="x")
+            for number in range(5)
+        ]
+        self.staff = CustomUser.objects.create_user(
+            username="staff", password="x", is_staff=True
+        )
+
+    def test_csv_and_jsonl_lines(self):
+        """Test that the export lists every user in id order, with a CSV
+        header or as JSON lines."""
+        lines = list(export_lines("csv", chunk_size=2))
+        self.assertEqual(lines[0], "id,username,is_active,is_staff,last_login\r\n")
+        self.assertEqual(lines[1], f"{self.users[0].pk},user0,True,False,\r\n")
+        self.assertEqual(len(lines), 7)
+
+        records = [json.loads(line) for line in export_lines("jsonl")]
+        self.assertEqual(records[-1]["username"], "staff")
+        self.assertTrue(records[-1]["is_staff"])
+        self.assertIsNone(records[-1]["last_login"])
+
+    def test_export_resumes_after_the_last_id(self):
+        """Test that only the users after the given id are exported, without
+        the header."""
+        lines = list(export_lines("csv", after_id=self.users[2].pk, header=False))
+        self.assertEqual(
+            [line.split(",")[1] for line in lines], ["user3", "user4", "staff"]
+        )
+
+    def test_command_resumes_an_interrupted_export(self):
+        """Test that --resume truncates a line cut short and appends the
+        remaining users."""
+        with tempfile.TemporaryDirectory() as directory:
+            path = Path(directory) / "users.jsonl"
+            call_command(
+                "export_users", format="jsonl", output=str(path), stdout=StringIO()
+            )
+            complete = path.read_text()
+
+            lines = complete.splitlines(keepends=True)
+            path.write_text("".join(lines[:2]) + lines[2][:10])
+            self.assertEqual(prepare_resume(path, "jsonl"), self.users[1].pk)
+            self.assertEqual(path.read_text(), "".join(lines[:2]))
+
+            path.write_text("".join(lines[:2]) + lines[2][:10])
+            call_command(
+                "export_users",
+                format="jsonl",
+                output=str(path),
+                resume=True,
+                stdout=StringIO(),
+            )
+            self.assertEqual(path.read_text(), complete)
+
+    def test_view_streams_the_export_to_staff_only(self):
+        """Test that staff users get the streamed export and others are
+        redirected to the login page."""
+        url = reverse("users:export")
+        self.client.force_login(self.users[0])
+        self.assertEqual(self.client.get(url).status_code, 302)
+
+        self.client.force_login(self.staff)
+        response = self.client.get(
+            url, {"format": "jsonl", "after_id": self.users[3].pk}
+        )
+        self.assertTrue(response.streaming)
+        self.assertEqual(response["Content-Type"], "application/x-ndjson")
+        content = b"".join(response.streaming_content).decode()
+        self.assertEqual(
+            [json.loads(line)["username"] for line in content.splitlines()],
+            ["user4", "staff"],
+        )
+        self.assertEqual(self.client.get(url, {"format": "xml"}).status_code, 400)
+
+    async def test_view_streams_asynchronously_under_asgi(self):
+        """Test that ASGI requests get an async stream, which is sent chunk
+        by chunk instead of being read whole first."""
+        await self.async_client.aforce_login(self.staff)
+        response = await self.async_client.get(reverse("users:export"))
+        self.assertTrue(response.is_async)
+        content = b"".join([chunk async for chunk in response.streaming_content])
+        self.assertEqual(len(content.decode().splitlines()), 7)
+
+
+class UserDirectoryViewTest(TestCase):
+
+    def test_directory_is_paged_with_cursors(self):
+        """Test that the directory lists every user once in sign up order
+        and rejects forged cursors."""
+        CustomUser.objects.bulk_create(
+            CustomUser(username=f"user{number}", password="!") for number in range(60)
+        )
+        url = reverse("users:directory")
+        first = self.client.get(url).json()
+        second = self.client.get(url, {"cursor": first["next"]}).json()
+        usernames = [user["username"] for user in first["results"] + second["results"]]
+        self.assertEqual(usernames, [f"user{number}" for number in range(60)])
+        self.assertIsNone(first["previous"])
+        self.assertIsNone(second["next"])
+        self.assertEqual(self.client.get(url, {"cursor": "forged"}).status_code, 400)
+
+
+@override_settings(
+    USERS_LOGIN_RATE_WINDOW=60,
+    USERS_LOGIN_IP_LIMIT=3,
+    USERS_LOGIN_USERNAME_LIMIT=2,
+    USERS_LOGIN_CHECK_WAIT=0,
+)
+class LoginAdmissionTest(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        CustomUser.objects.create_user(username="myusername", password="secret")
+        self.admission = admission.LoginAdmission(max_concurrent=1)
+        patcher = mock.patch.object(admission, "_login_admission", self.admission)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def login(self, username, password="wrong", ip="10.0.0.1", forwarded=""):
+        request = RequestFactory().post(
+            "/", REMOTE_ADDR=ip, HTTP_X_FORWARDED_FOR=forwarded
+        )
+        form = CustomAuthenticationForm(
+            request, data={"username": username, "password": password}
+        )
+        form.is_valid()
+        return form
+
+    def test_username_bucket(self):
+        """Test that attempts on a username beyond its limit are rejected
+        without checking the password, even with the right one."""
+        for ip in ("10.0.0.1", "10.0.0.2"):
+            form = self.login("MyUsername", ip=ip)
+            self.assertEqual(form.non_field_errors().as_data()[0].code, "invalid_login")
+
+        with mock.patch.object(CustomUser, "check_password") as check_password:
+            form = self.login("myusername", password="secret", ip="10.0.0.3")
+        check_password.assert_not_called()
+        self.assertEqual(form.non_field_errors().as_data()[0].code, "throttled")
+        self.assertEqual(self.admission.stats.rejected["username"], 1)
+
+    def test_ip_bucket(self):
+        """Test that an IP trying many usernames is rejected, unknown ones
+        included, while other IPs are still admitted."""
+        for number in range(3):
+            self.login(f"unknown{number}")
+        form = self.login("myusername", password="secret")
+        self.assertEqual(form.non_field_errors().as_data()[0].code, "throttled")
+        self.assertTrue(self.login("myusername", "secret", ip="10.0.0.2").is_valid())
+        self.assertEqual(self.admission.stats.rejected["ip"], 1)
+
+    def test_window_slides(self):
+        """Test that the attempts of the previous window count in proportion
+        of its overlap with the sliding window."""
+        self.admission.check_rates(None, "user", now=0)
+        self.admission.check_rates(None, "user", now=1)
+        with self.assertRaises(admission.LoginRejected):
+            self.admission.check_rates(None, "user", now=59)
+        # Two attempts weighted by a half overlap leave room for one more
+        self.admission.check_rates(None, "user", now=90)
+        with self.assertRaises(admission.LoginRejected):
+            self.admission.check_rates(None, "user", now=90)
+        self.admission.check_rates(None, "user", now=120)
+
+    def test_concurrency_cap(self):
+        """Test that no more credentials than the cap are checked at once and
+        that the metrics report the hashing time shed."""
+        with self.admission.admit(None, "first"):
+            time.sleep(0.01)
+            with self.assertRaises(admission.LoginRejected) as context:
+                with self.admission.admit(None, "second"):
+                    pass
+        self.assertEqual(context.exception.reason, "concurrency")
+        with self.admission.admit(None, "second"):
+            pass
+
+        stats = self.admission.stats.as_dict()
+        self.assertEqual(stats["admitted"], 2)
+        self.assertEqual(stats["rejected"]["concurrency"], 1)
+        self.assertGreater(stats["shed_seconds"], 0)
+
+    def test_client_ip_behind_trusted_proxies(self):
+        """Test that X-Forwarded-For gives the client IP only for requests
+        coming through the trusted proxies."""
+        factory = RequestFactory()
+        forwarded = "1.1.1.1, 2.2.2.2, 10.0.1.5"
+        request = factory.get(
+            "/", REMOTE_ADDR="10.0.0.1", HTTP_X_FORWARDED_FOR=forwarded
+        )
+        self.assertEqual(admission.client_ip(request), "10.0.0.1")
+
+        with self.settings(USERS_LOGIN_TRUSTED_PROXIES=["10.0.0.0/16"]):
+            self.assertEqual(admission.client_ip(request), "2.2.2.2")
+            request = factory.get(
+                "/", REMOTE_ADDR="10.1.0.1", HTTP_X_FORWARDED_FOR=forwarded
+            )
+            self.assertEqual(admission.client_ip(request), "10.1.0.1")
+            request = factory.get("/", REMOTE_ADDR="10.0.0.1")
+            self.assertEqual(admission.client_ip(request), "10.0.0.1")
+
+    @override_settings(USERS_LOGIN_TRUSTED_PROXIES=["10.0.0.1"])
+    def test_clients_behind_the_proxy_have_their_own_bucket(self):
+        """Test that the clients forwarded by a trusted proxy do not share
+        the IP bucket of the proxy."""
+        for number in range(3):
+            form = self.login(f"unknown{number}", forwarded=f"1.1.1.{number}")
+            self.assertEqual(form.non_field_errors().as_data()[0].code, "invalid_login")
+        form = self.login("unknown3", forwarded="1.1.1.0")
+        self.assertEqual(form.non_field_errors().as_data()[0].code, "invalid_login")
+
+    async def test_async_login_is_rejected(self):
+        """Test that ais_valid() rejects attempts beyond the limits before
+        authenticating."""
+        for _ in range(2):
+            form = CustomAuthenticationForm(
+                data={"username": "myusername", "password": "wrong"}
+            )
+            self.assertFalse(await form.ais_valid())
+
+        form = CustomAuthenticationForm(
+            data={"username": "myusername", "password": "secret"}
+        )
+        self.assertFalse(await form.ais_valid())
+        self.assertEqual(form.non_field_errors().as_data()[0].code, "throttled")
+
+
+@override_settings(USERS_POINTS_SETTLE_DELAY=0)
+class PointsTest(TestCase):
+
+    def setUp(self):
+        self.users = CustomUser.objects.bulk_create(
+            CustomUser(username=f"player{number}", password="!") for number in range(6)
+        )
+
+    def award_many(self, awards):
+        PointsEntry.objects.bulk_create(
+            PointsEntry(user=self.users[index], amount=amount, reason="test")
+            for index, amount in awards
+        )
+
+    def expected_ranking(self):
+        totals = {user.pk: 0 for user in self.users}
+        for user_id, amount in PointsEntry.objects.values_list("user_id", "amount"):
+            totals[user_id] += amount
+        return totals
+
+    def test_fenwick_tree(self):
+        """Test that the prefix sums and searches of the Fenwick tree match
+        those of a plain list of counts."""
+        counts = [random.randint(0, 3) for _ in range(100)]
+        tree = FenwickTree(100)
+        for index, count in enumerate(counts, start=1):
+            tree.add(index, count)
+        for index in range(101):
+            self.assertEqual(tree.prefix_sum(index), sum(counts[:index]))
+        for count in range(1, sum(counts) + 1):
+            index = tree.search(count)
+            self.assertGreaterEqual(sum(counts[:index]), count)
+            self.assertLess(sum(counts[: index - 1]), count)
+
+    def test_rank_and_top(self):
+        """Test that the ranks and top users match those counted from the
+        ledger, once built and after incremental refreshes."""
+        self.award_many([(0, 5), (1, 5), (2, 3000), (3, 1), (4, -2)])
+        ranking = PointsRanking()
+        ranking.build()
+        self.award_many([(3, 9), (4, 2), (1, -5), (5, 7)])
+        self.assertEqual(ranking.refresh(), 4)
+
+        totals = self.expected_ranking()
+        for user_id, points in totals.items():
+            self.assertEqual(ranking.points(user_id), points)
+            self.assertEqual(
+                ranking.rank(points),
+                1 + sum(other > points for other in totals.values() if other > 0),
+            )
+        expected = sorted(
+            ((user_id, points) for user_id, points in totals.items() if points > 0),
+            key=lambda item: (-item[1], item[0]),
+        )
+        self.assertEqual(ranking.top(10), expected)
+        self.assertEqual(ranking.top(2), expected[:2])
+        self.assertEqual(ranking.report()["ranked_users"], 4)
+        self.assertGreaterEqual(ranking.report()["buckets"], 3000)
+
+        rebuilt = PointsRanking()
+        rebuilt.build()
+        self.assertEqual(rebuilt.top(10), ranking.top(10))
+
+    def test_large_awards_share_the_last_bucket(self):
+        """Test that scores beyond the last bucket neither grow the tree past
+        it nor lose their order."""
+        self.award_many([(0, 10**9), (1, 10**9 + 1), (2, 5000), (3, 2048), (4, 7)])
+        ranking = PointsRanking(max_bucket=2048)
+        ranking.build()
+        self.assertEqual(ranking.report()["buckets"], 2048)
+
+        totals = self.expected_ranking()
+        for points in list(totals.values()) + [10**10, 3000, 2048, 2047]:
+            self.assertEqual(
+                ranking.rank(points),
+                1 + sum(other > points for other in totals.values() if other > 0),
+            )
+        users = [user.pk for user in self.users]
+        self.assertEqual(
+            ranking.top(4),
+            [
+                (users[1], 10**9 + 1),
+                (users[0], 10**9),
+                (users[2], 5000),
+                (users[3], 2048),
+            ],
+        )
+        self.assertEqual(ranking.top(1), [(users[1], 10**9 + 1)])
+
+    def test_recent_entries_wait(self):
+        """Test that entries younger than the settle delay are left for the
+        next refresh."""
+        award(self.users[0], 10, "test")
+        ranking = PointsRanking()
+        with override_settings(USERS_POINTS_SETTLE_DELAY=60):
+            ranking.build()
+        self.assertEqual(ranking.points(self.users[0].pk), 0)
+        ranking.refresh()
+        self.assertEqual(ranking.points(self.users[0].pk), 10)
+
+    def test_rollup(self):
+        """Test that rollups add the new entries to the totals of the users
+        and record how far they went."""
+        self.award_many([(0, 5), (0, 3), (1, -2)])
+        self.assertEqual(rollup_points(), 2)
+        self.award_many([(0, 4)])
+        out = StringIO()
+        call_command("rollup_points", stdout=out)
+        self.assertIn("1 users", out.getvalue())
+        self.assertEqual(rollup_points(), 0)
+
+        points = dict(CustomUser.objects.values_list("pk", "points"))
+        self.assertEqual(points, self.expected_ranking())
+        self.assertEqual(
+            PointsRollup.objects.latest("pk").last_entry_id,
+            PointsEntry.objects.latest("pk").pk,
+        )
+
+    def test_rollups_lock_the_first_rollup(self):
+        """Test that a migration creates the rollup row the rollups lock,
+        so that the first rollups wait for each other too, and that they
+        read the watermark once they hold the lock."""
+        first = PointsRollup.objects.get()
+        self.assertEqual(first.last_entry_id, 0)
+        self.award_many([(0, 5)])
+        with CaptureQueriesContext(connection) as context:
+            self.assertEqual(rollup_points(), 1)
+        selects = [
+            query["sql"] for query in context if query["sql"].startswith("SELECT")
+        ]
+        self.assertIn("ASC LIMIT 1", selects[0])
+        self.assertIn("DESC LIMIT 1", selects[1])
+
+    def test_ledger_is_append_only(self):
+        """Test that recorded entries can be neither changed nor deleted."""
+        entry = award(self.users[0], 10, "test")
+        entry.amount = 1000
+        with self.assertRaises(ValueError):
+            entry.save()
+        with self.assertRaises(ValueError):
+            entry.delete()
+
+    def test_views(self):
+        """Test that the points endpoint ranks a user and that the
+        leaderboard lists the best users."""
+        self.award_many([(0, 5), (1, 8), (2, 8)])
+        with mock.patch("apps.users.views.get_points_ranking") as get_ranking:
+            get_ranking.return_value = PointsRanking()
+            response = self.client.get(reverse("users:points", args=["Player0"]))
+            self.assertEqual(
+                response.json(), {"username": "player0", "points": 5, "rank": 3}
+            )
+            self.assertEqual(
+                self.client.get(reverse("users:points", args=["nobody"])).status_code,
+                404,
+            )
+            response = self.client.get(reverse("users:leaderboard"), {"size": 2})
+        self.assertEqual(
+            response.json()["results"],
+            [
+                {"username": "player1", "points": 8, "rank": 1},
+                {"username": "player2", "points": 8, "rank": 1},
+            ],
+        )
+
+
+class CustomUserAdminTest(TestCase):
+
+    def setUp(self):
+        self.admin = CustomUser.objects.create_superuser(
+            username="admin", password="secret"
+        )
+        CustomUser.objects.bulk_create(
+            CustomUser(username=f"user{number:03}", password="!")
+            for number in range(120)
+        )
+        self.client.force_login(self.admin)
+        self.url = reverse("admin:users_customuser_changelist")
+
+    def test_changelist_is_paged_with_cursors(self):
+        """Test that the change list walks every user with keyset cursors
+        in a constant number of queries."""
+        response = self.client.get(self.url, {"o": "1"})
+        self.assertEqual(response.status_code, 200)
+        changelist = response.context["cl"]
+        self.assertEqual(changelist.result_count, 121)
+        self.assertIsNone(changelist.previous_url)
+        usernames = [user.username for user in changelist.result_list]
+
+        # The page and the count, the user and permissions being cached
+        with self.assertNumQueries(2):
+            response = self.client.get(self.url + changelist.next_url)
+        changelist = response.context["cl"]
+        self.assertIsNone(changelist.next_url)
+        self.assertIsNotNone(changelist.previous_url)
+        usernames += [user.username for user in changelist.result_list]
+        self.assertEqual(
+            usernames, sorted(CustomUser.objects.values_list("username", flat=True))
+        )
+
+        response = self.client.get(self.url, {"cursor": "forged"})
+        self.assertRedirects(response, self.url + "?e=1")
+
+    def test_prefix_search(self):
+        """Test that searches match the usernames starting with the term,
+        whatever its case."""
+        response = self.client.get(self.url, {"q": "User11"})
+        self.assertEqual(
+            [user.username for user in response.context["cl"].result_list],
+            [f"user11{number}" for number in range(9, -1, -1)],
+        )
+        response = self.client.get(self.url, {"q": "ser1"})
+        self.assertEqual(response.context["cl"].result_list, [])
+
+    def test_deactivate_in_chunks(self):
+        """Test that the deactivate action updates the selected users in
+        chunks, sparing the administrator, and that those users can no
+        longer log in."""
+        with self.settings(USERS_ADMIN_ACTION_CHUNK_SIZE=50):
+            response = self.client.post(
+                self.url,
+                {
+                    "action": "deactivate_users",
+                    "select_across": "1",
+                    "index": "0",
+                    "_selected_action": [self.admin.pk],
+                },
+            )
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(CustomUser.objects.filter(is_active=True).get(), self.admin)
+        self.assertFalse(self.client.login(username="user001", password="!"))
+
+        users = CustomUser.objects.exclude(pk=self.admin.pk)
+        with self.assertNumQueries(3 * 2):
+            self.assertEqual(update_in_chunks(users, 50, is_active=True), 120)
+        self.assertEqual(update_in_chunks(users, 50, is_active=True), 0)
+
+    def test_estimated_count(self):
+        """Test that counts are exact on SQLite."""
+        users = CustomUser.objects.filter(username__startswith="user1")
+        self.assertEqual(estimated_count(users), users.count())
+        self.assertEqual(estimated_count(users.none()), 0)
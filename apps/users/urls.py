@@ -0,0 +1,13 @@
+from django.urls import path
+
+from apps.users import views
+
+app_name = "users"
+
+urlpatterns = [
+    path("", views.user_directory, name="directory"),
+    path("availability/", views.username_availability, name="availability"),
+    path("export/", views.export_users, name="export"),
+    path("leaderboard/", views.points_leaderboard, name="leaderboard"),
+    path("<str:username>/points/", views.user_points, name="points"),
+]
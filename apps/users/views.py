@@ -1,3 +1,143 @@
-from django.shortcuts import render
+from django.contrib.admin.views.decorators import staff_member_required
+from django.core.exceptions import ValidationError
+from django.core.handlers.asgi import ASGIRequest
+from django.http import (
+    Http404,
+    HttpResponseBadRequest,
+    JsonResponse,
+    StreamingHttpResponse,
+)
+from django.views.decorators.http import require_GET
 
-# Create your views here.
+from apps.core.instrumentation import query_budget
+from apps.core.pagination import CursorPaginator, InvalidCursor
+from apps.users.availability import get_username_filter
+from apps.users.export import EXPORT_FORMATS, aiter_chunks, export_lines, iter_chunks
+from apps.users.models import CustomUser
+from apps.users.points import get_points_ranking
+
+directory_paginator = CursorPaginator(("id",), page_size=50, salt="users.directory")
+
+# Most users listed by the points leaderboard
+LEADERBOARD_MAX_SIZE = 100
+
+
+# Building the filter on a cold process takes two more queries
+@query_budget(3)
+@require_GET
+def username_availability(request):
+    """Tells whether the 'username' parameter is valid and free, for the
+    registration form to check as the user types. Usernames missing from
+    the Bloom filter are answered without querying the database."""
+    username = CustomUser.normalize_username(request.GET.get("username", ""))
+    try:
+        CustomUser._meta.get_field("username").clean(username, None)
+    except ValidationError as error:
+        return JsonResponse(
+            {"username": username, "available": False, "errors": error.messages},
+            status=400,
+        )
+
+    available = not get_username_filter().is_taken(username)
+    return JsonResponse({"username": username, "available": available})
+
+
+@staff_member_required
+@require_GET
+def export_users(request):
+    """Streams every user as CSV or, with format=jsonl, JSON lines. The
+    'after_id' parameter resumes an interrupted download after the last
+    user received."""
+    export_format = request.GET.get("format", "csv")
+    if export_format not in EXPORT_FORMATS:
+        return HttpResponseBadRequest("Unknown format.")
+    try:
+        after_id = int(request.GET["after_id"]) if "after_id" in request.GET else None
+    except ValueError:
+        return HttpResponseBadRequest("Invalid after_id.")
+
+    lines = export_lines(export_format, after_id, header=after_id is None)
+    # Under ASGI a sync iterator would be read whole before being sent
+    chunks = (
+        aiter_chunks(lines) if isinstance(request, ASGIRequest) else iter_chunks(lines)
+    )
+    response = StreamingHttpResponse(
+        chunks,
+        content_type="text/csv" if export_format == "csv" else "application/x-ndjson",
+    )
+    response["Content-Disposition"] = f'attachment; filename="users.{export_format}"'
+    return response
+
+
+@query_budget(1)
+@require_GET
+def user_directory(request):
+    """Lists the users in sign up order, paged with the opaque 'cursor'
+    parameter."""
+    try:
+        page = directory_paginator.page(
+            CustomUser.objects.values("id", "username"),
+            request.GET.get("cursor") or None,
+        )
+    except InvalidCursor as error:
+        return JsonResponse({"error": str(error)}, status=400)
+    return JsonResponse(
+        {
+            "results": page.items,
+            "next": page.next_cursor,
+            "previous": page.previous_cursor,
+        }
+    )
+
+
+# Building the ranking on a cold process takes two more queries
+@query_budget(3)
+@require_GET
+def user_points(request, username):
+    """Returns the points of a user and their rank among all users, answered
+    by the in-memory ranking instead of counting the users ahead."""
+    try:
+        user_id, username = CustomUser.objects.values_list("pk", "username").get(
+            username=CustomUser.normalize_username(username)
+        )
+    except CustomUser.DoesNotExist:
+        raise Http404("No such user.")
+
+    ranking = get_points_ranking()
+    ranking.ensure_ready()
+    points = ranking.points(user_id)
+    return JsonResponse(
+        {"username": username, "points": points, "rank": ranking.rank(points)}
+    )
+
+
+# Building the ranking on a cold process takes two more queries
+@query_budget(3)
+@require_GET
+def points_leaderboard(request):
+    """Lists the users with the most points, up to the 'size' parameter."""
+    try:
+        size = int(request.GET.get("size", 10))
+    except ValueError:
+        return HttpResponseBadRequest("Invalid size.")
+    size = max(1, min(size, LEADERBOARD_MAX_SIZE))
+
+    ranking = get_points_ranking()
+    ranking.ensure_ready()
+    top = ranking.top(size)
+    usernames = dict(
+        CustomUser.objects.filter(pk__in=[user_id for user_id, _ in top]).values_list(
+            "pk", "username"
+        )
+    )
+    results = []
+    for user_id, points in top:
+        if user_id in usernames:
+            results.append(
+                {
+                    "username": usernames[user_id],
+                    "points": points,
+                    "rank": ranking.rank(points),
+                }
+            )
+    return JsonResponse({"results": results})
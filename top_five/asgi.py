@@ -8,9 +8,24 @@ https://docs.djangoproject.com/en/5.0/howto/deployment/asgi/
 """
 
 import os
+import time
 
+from django.conf import settings
 from django.core.asgi import get_asgi_application
 
+from apps.core.notifications import NotificationsRouter
+from top_five.lifecycle import LifespanMiddleware
+from top_five.warmup import warm_up
+
 os.environ.setdefault("DJANGO_SETTINGS_MODULE", "top_five.settings")
+# Lets the settings pick the defaults of ASGI, like that of DB_CONN_MAX_AGE
+os.environ["SERVER_GATEWAY"] = "asgi"
+
+started = time.perf_counter()
+django_application = get_asgi_application()
+
+application = LifespanMiddleware(NotificationsRouter(django_application))
 
-application = get_asgi_application()
+# Before a preloading server forks, so the workers share the warmed memory
+if settings.WARMUP_ON_IMPORT:
+    warm_up(loading_seconds=time.perf_counter() - started)
@@ -0,0 +1,64 @@
+"""
+Process lifecycle hooks shared by the WSGI and ASGI entry points.
+
+Components that keep state in memory, like buffers that must be flushed
+before the worker exits, register a shutdown hook here. ``wsgi.py`` runs the
+hooks at interpreter exit and ``asgi.py`` runs them on the ASGI lifespan
+shutdown event.
+"""
+
+import logging
+import threading
+
+from asgiref.sync import sync_to_async
+
+logger = logging.getLogger(__name__)
+
+_shutdown_hooks = []
+_shutdown_hooks_lock = threading.Lock()
+
+
+def register_shutdown_hook(hook):
+    """Registers a callable to run, once, when the worker shuts down."""
+    with _shutdown_hooks_lock:
+        if hook not in _shutdown_hooks:
+            _shutdown_hooks.append(hook)
+
+
+def run_shutdown_hooks():
+    """Runs the registered hooks in reverse registration order. A failing
+    hook is logged and does not prevent the others from running."""
+    with _shutdown_hooks_lock:
+        hooks = _shutdown_hooks[::-1]
+        _shutdown_hooks.clear()
+
+    for hook in hooks:
+        try:
+            hook()
+        except Exception:
+            logger.exception("Shutdown hook %r failed.", hook)
+
+
+class LifespanMiddleware:
+    """ASGI middleware that answers the lifespan protocol, which Django's
+    ASGI handler does not support, and runs the shutdown hooks on the
+    lifespan shutdown event."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "lifespan":
+            return await self.app(scope, receive, send)
+
+        while True:
+            message = await receive()
+            if message["type"] == "lifespan.startup":
+                await send({"type": "lifespan.startup.complete"})
+            elif message["type"] == "lifespan.shutdown":
+                # Database connections belong to the thread that opened them,
+                # so the hooks run in the thread of the sync code called from
+                # outside the requests, whose connections they close
+                await sync_to_async(run_shutdown_hooks, thread_sensitive=True)()
+                await send({"type": "lifespan.shutdown.complete"})
+                return
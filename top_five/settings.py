@@ -34,7 +34,9 @@ ALLOWED_HOSTS = []
 
 # Application definition
 CUSTOM_APPS = [
+    "apps.core",
     "apps.users",
+    "apps.tops",
 ]
 
 THIRD_APPS = []
@@ -53,11 +55,14 @@ INSTALLED_APPS = (
 )
 
 MIDDLEWARE = [
+    "apps.core.middleware.InstrumentationMiddleware",
+    "apps.core.middleware.ReplicaStickinessMiddleware",
     "django.middleware.security.SecurityMiddleware",
     "django.contrib.sessions.middleware.SessionMiddleware",
     "django.middleware.common.CommonMiddleware",
     "django.middleware.csrf.CsrfViewMiddleware",
     "django.contrib.auth.middleware.AuthenticationMiddleware",
+    "apps.users.middleware.ActivityMiddleware",
     "django.contrib.messages.middleware.MessageMiddleware",
     "django.middleware.clickjacking.XFrameOptionsMiddleware",
 ]
@@ -82,6 +87,13 @@ TEMPLATES = [
 
 WSGI_APPLICATION = "top_five.wsgi.application"
 
+# Whether wsgi.py and asgi.py warm the worker up when they are imported
+WARMUP_ON_IMPORT = os.environ.get("WARMUP_ON_IMPORT", "true").lower() in (
+    "1",
+    "true",
+    "yes",
+)
+
 
 # Database
 # https://docs.djangoproject.com/en/5.0/ref/settings/#databases
@@ -94,10 +106,97 @@ DATABASES = {
         "PASSWORD": os.environ.get("DB_PASSWORD"),
         "PORT": os.environ.get("DB_PORT"),
         "HOST": os.environ.get("DB_HOST"),
+        # Seconds a connection is reused across requests, "None" for no limit.
+        # Django runs the sync code of each ASGI request in a new thread, so
+        # a connection kept past the request would never be reused there:
+        # unless set, connections are not kept under ASGI, which needs a
+        # pooler such as PgBouncer in front instead
+        "CONN_MAX_AGE": (
+            None
+            if os.environ.get("DB_CONN_MAX_AGE") == "None"
+            else int(
+                os.environ.get(
+                    "DB_CONN_MAX_AGE",
+                    0 if os.environ.get("SERVER_GATEWAY") == "asgi" else 60,
+                )
+            )
+        ),
+        # Check that a reused connection still works before its first query
+        "CONN_HEALTH_CHECKS": os.environ.get("DB_CONN_HEALTH_CHECKS", "true").lower()
+        in ("1", "true", "yes"),
+    }
+}
+
+# Up to this many seconds are taken off the age of each connection, so the
+# connections opened together by many workers are not recycled all at once
+DATABASE_CONN_MAX_AGE_JITTER = int(os.environ.get("DB_CONN_MAX_AGE_JITTER", 10))
+
+# Read replicas, as a comma separated list of hosts sharing the credentials
+# of the primary, or of database files when the engine is SQLite. Their
+# aliases are replica_0, replica_1... and they mirror the primary in tests
+
+DATABASE_REPLICAS = []
+
+for number, replica in enumerate(
+    filter(None, os.environ.get("DB_REPLICAS", "").split(","))
+):
+    alias = f"replica_{number}"
+    location = "NAME" if "sqlite" in (DATABASES["default"]["ENGINE"] or "") else "HOST"
+    DATABASES[alias] = {
+        **DATABASES["default"],
+        location: replica.strip(),
+        "TEST": {"MIRROR": "default"},
+    }
+    DATABASE_REPLICAS.append(alias)
+
+DATABASE_ROUTERS = ["apps.core.routers.PrimaryReplicaRouter"]
+
+# Seconds during which a client that wrote keeps reading from the primary
+DATABASE_REPLICA_STICKY_SECONDS = int(os.environ.get("DB_REPLICA_STICKY_SECONDS", 5))
+
+# Seconds between two connection checks of a replica
+DATABASE_REPLICA_HEALTH_CHECK_INTERVAL = int(
+    os.environ.get("DB_REPLICA_HEALTH_CHECK_INTERVAL", 30)
+)
+
+
+# Cache
+# https://docs.djangoproject.com/en/5.0/topics/cache/
+
+CACHES = {
+    "default": {
+        "BACKEND": os.environ.get(
+            "CACHE_BACKEND", "django.core.cache.backends.locmem.LocMemCache"
+        ),
+        "LOCATION": os.environ.get("CACHE_LOCATION", ""),
     }
 }
 
 
+# Sessions
+# https://docs.djangoproject.com/en/5.0/topics/http/sessions/
+
+# Sessions are read from the cache and written through to django_session,
+# the table of the default engine, so existing sessions stay valid
+
+SESSION_ENGINE = "django.contrib.sessions.backends.cached_db"
+
+# Expired sessions deleted per query by the sweeper, and seconds it waits
+# between two batches
+
+SESSION_SWEEP_BATCH_SIZE = int(os.environ.get("SESSION_SWEEP_BATCH_SIZE", 500))
+
+SESSION_SWEEP_PAUSE = float(os.environ.get("SESSION_SWEEP_PAUSE", 0.05))
+
+
+# Authentication
+# https://docs.djangoproject.com/en/5.0/topics/auth/customizing/
+
+AUTHENTICATION_BACKENDS = [
+    "apps.users.backends.CachedModelBackend",
+]
+
+
 # Password validation
 # https://docs.djangoproject.com/en/5.0/ref/settings/#auth-password-validators
 
@@ -117,6 +216,67 @@ AUTH_PASSWORD_VALIDATORS = [
 ]
 
 
+# Logging
+# https://docs.djangoproject.com/en/5.0/topics/logging/
+
+LOGGING = {
+    "version": 1,
+    "disable_existing_loggers": False,
+    "handlers": {
+        "console": {"class": "logging.StreamHandler"},
+    },
+    "loggers": {
+        "top_five.warmup": {
+            "handlers": ["console"],
+            "level": "INFO",
+            "propagate": False,
+        },
+        "apps.core.instrumentation": {
+            "handlers": ["console"],
+            "level": os.environ.get("INSTRUMENTATION_LOG_LEVEL", "INFO"),
+            "propagate": False,
+        },
+    },
+}
+
+
+# Instrumentation
+# Fraction of the requests measured by InstrumentationMiddleware, whether
+# their measures are sent in a Server-Timing header and whether views
+# exceeding their @query_budget fail instead of logging a warning, which is
+# meant for development and which the test runner always enables
+
+INSTRUMENTATION_SAMPLE_RATE = float(os.environ.get("INSTRUMENTATION_SAMPLE_RATE", 0.0))
+
+INSTRUMENTATION_SERVER_TIMING = os.environ.get(
+    "INSTRUMENTATION_SERVER_TIMING", str(DEBUG)
+).lower() in ("1", "true", "yes")
+
+INSTRUMENTATION_ENFORCE_QUERY_BUDGETS = os.environ.get(
+    "INSTRUMENTATION_ENFORCE_QUERY_BUDGETS", "false"
+).lower() in ("1", "true", "yes")
+
+TEST_RUNNER = "apps.core.testing.QueryBudgetTestRunner"
+
+
+# Notifications
+# Broker class fanning the events out to the connections, events a slow
+# connection may lag behind before the oldest are dropped, and seconds
+# between two heartbeats and without any event before a connection is closed
+
+NOTIFICATIONS_BROKER = os.environ.get(
+    "NOTIFICATIONS_BROKER", "apps.core.notifications.InProcessBroker"
+)
+
+NOTIFICATIONS_QUEUE_SIZE = int(os.environ.get("NOTIFICATIONS_QUEUE_SIZE", 100))
+
+NOTIFICATIONS_HEARTBEAT_INTERVAL = float(
+    os.environ.get("NOTIFICATIONS_HEARTBEAT_INTERVAL", 15.0)
+)
+
+NOTIFICATIONS_IDLE_TIMEOUT = float(os.environ.get("NOTIFICATIONS_IDLE_TIMEOUT", 600.0))
+
+
 # Internationalization
 # https://docs.djangoproject.com/en/5.0/topics/i18n/
 
@@ -140,3 +300,142 @@ STATIC_URL = "static/"
 DEFAULT_AUTO_FIELD = "django.db.models.BigAutoField"
 
 AUTH_USER_MODEL = "users.CustomUser"
+
+
+# Users
+# Batch size and number of hashing processes used by
+# CustomUserManager.bulk_create_users and the import_users command
+
+USERS_BULK_CREATE_BATCH_SIZE = int(os.environ.get("USERS_BULK_CREATE_BATCH_SIZE", 1000))
+
+USERS_BULK_CREATE_WORKERS = int(
+    os.environ.get("USERS_BULK_CREATE_WORKERS", os.cpu_count() or 1)
+)
+
+# Cache alias and timeout, in seconds, of the users resolved by
+# CachedModelBackend
+
+USERS_CACHE_ALIAS = os.environ.get("USERS_CACHE_ALIAS", "default")
+
+USERS_CACHE_TIMEOUT = int(os.environ.get("USERS_CACHE_TIMEOUT", 300))
+
+# Threads used by the async account API to hash passwords without blocking
+# the event loop
+
+USERS_PASSWORD_HASHING_THREADS = int(
+    os.environ.get("USERS_PASSWORD_HASHING_THREADS", min(4, os.cpu_count() or 1))
+)
+
+# Seconds between two writes of the buffered login and last seen timestamps,
+# and users updated per query
+
+USERS_ACTIVITY_FLUSH_INTERVAL = float(
+    os.environ.get("USERS_ACTIVITY_FLUSH_INTERVAL", 60.0)
+)
+
+USERS_ACTIVITY_BATCH_SIZE = int(os.environ.get("USERS_ACTIVITY_BATCH_SIZE", 1000))
+
+# Users fetched at once by the streaming export
+
+USERS_EXPORT_CHUNK_SIZE = int(os.environ.get("USERS_EXPORT_CHUNK_SIZE", 2000))
+
+# False positive rate of the Bloom filter answering username availability
+# checks, and seconds between two rebuilds of it from the database
+
+USERS_USERNAME_FILTER_ERROR_RATE = float(
+    os.environ.get("USERS_USERNAME_FILTER_ERROR_RATE", 0.01)
+)
+
+USERS_USERNAME_FILTER_REBUILD_INTERVAL = int(
+    os.environ.get("USERS_USERNAME_FILTER_REBUILD_INTERVAL", 3600)
+)
+
+# Login admission control, checked before any password is hashed: attempts
+# allowed per client IP and per username within a sliding window of seconds
+# (0 disables a limit), credentials checked at once by a worker, seconds an
+# attempt may wait for one of those slots and the addresses or networks of
+# the reverse proxies whose X-Forwarded-For header gives the client IP
+
+USERS_LOGIN_RATE_WINDOW = int(os.environ.get("USERS_LOGIN_RATE_WINDOW", 60))
+
+USERS_LOGIN_IP_LIMIT = int(os.environ.get("USERS_LOGIN_IP_LIMIT", 30))
+
+USERS_LOGIN_USERNAME_LIMIT = int(os.environ.get("USERS_LOGIN_USERNAME_LIMIT", 10))
+
+USERS_LOGIN_MAX_CONCURRENT_CHECKS = int(
+    os.environ.get("USERS_LOGIN_MAX_CONCURRENT_CHECKS", os.cpu_count() or 1)
+)
+
+USERS_LOGIN_CHECK_WAIT = float(os.environ.get("USERS_LOGIN_CHECK_WAIT", 0.1))
+
+USERS_LOGIN_TRUSTED_PROXIES = list(
+    filter(None, os.environ.get("USERS_LOGIN_TRUSTED_PROXIES", "").split(","))
+)
+
+# Points ledger: seconds an entry waits before rollups and rankings read it,
+# so those of transactions committing late are not skipped, users updated
+# per query by a rollup and seconds between two refreshes of the ranking of
+# a process
+
+USERS_POINTS_SETTLE_DELAY = int(os.environ.get("USERS_POINTS_SETTLE_DELAY", 5))
+
+USERS_POINTS_ROLLUP_BATCH_SIZE = int(
+    os.environ.get("USERS_POINTS_ROLLUP_BATCH_SIZE", 1000)
+)
+
+USERS_POINTS_REFRESH_INTERVAL = int(os.environ.get("USERS_POINTS_REFRESH_INTERVAL", 30))
+
+# Users updated per query by the bulk actions of the admin
+
+USERS_ADMIN_ACTION_CHUNK_SIZE = int(
+    os.environ.get("USERS_ADMIN_ACTION_CHUNK_SIZE", 1000)
+)
+
+
+# Tops
+# Size and flush thresholds of the in-process buffer that coalesces votes,
+# see apps.tops.votes.VoteBuffer
+
+TOPS_VOTE_BUFFER_MAX_SIZE = int(os.environ.get("TOPS_VOTE_BUFFER_MAX_SIZE", 10000))
+
+TOPS_VOTE_BUFFER_FLUSH_SIZE = int(os.environ.get("TOPS_VOTE_BUFFER_FLUSH_SIZE", 500))
+
+TOPS_VOTE_BUFFER_FLUSH_INTERVAL = float(
+    os.environ.get("TOPS_VOTE_BUFFER_FLUSH_INTERVAL", 1.0)
+)
+
+TOPS_VOTE_BUFFER_BLOCK_TIMEOUT = float(
+    os.environ.get("TOPS_VOTE_BUFFER_BLOCK_TIMEOUT", 5.0)
+)
+
+# Home page: lists per page and the fresh/stale lifetimes, in seconds, of
+# its cached fragments
+
+TOPS_HOME_PAGE_SIZE = int(os.environ.get("TOPS_HOME_PAGE_SIZE", 20))
+
+TOPS_HOME_CACHE_ALIAS = os.environ.get("TOPS_HOME_CACHE_ALIAS", "default")
+
+TOPS_HOME_CACHE_TTL = int(os.environ.get("TOPS_HOME_CACHE_TTL", 60))
+
+TOPS_HOME_CACHE_STALE_TTL = int(os.environ.get("TOPS_HOME_CACHE_STALE_TTL", 300))
+
+# Seconds between two refreshes of the search index of a worker with the
+# changes made by the other workers, which happen in the background
+
+TOPS_SEARCH_INDEX_REFRESH_INTERVAL = float(
+    os.environ.get("TOPS_SEARCH_INDEX_REFRESH_INTERVAL", 5.0)
+)
+
+# Half life of the votes in the trending scores, set in hours, lists
+# rescored per chunk and seconds the incremental runs look back before the
+# watermark of the previous run
+
+TOPS_TRENDING_HALF_LIFE = (
+    float(os.environ.get("TOPS_TRENDING_HALF_LIFE_HOURS", 24.0)) * 3600
+)
+
+TOPS_TRENDING_CHUNK_SIZE = int(os.environ.get("TOPS_TRENDING_CHUNK_SIZE", 1000))
+
+TOPS_TRENDING_WATERMARK_OVERLAP = int(
+    os.environ.get("TOPS_TRENDING_WATERMARK_OVERLAP", 300)
+)
@@ -16,8 +16,14 @@ Including another URLconf
 """
 
 from django.contrib import admin
-from django.urls import path
+from django.urls import include, path
+
+from apps.tops.views import home
 
 urlpatterns = [
+    path("", home, name="home"),
     path("admin/", admin.site.urls),
+    path("core/", include("apps.core.urls")),
+    path("tops/", include("apps.tops.urls")),
+    path("users/", include("apps.users.urls")),
 ]
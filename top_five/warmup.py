@@ -0,0 +1,161 @@
+"""
+Warm-up of a freshly started worker, shared by the WSGI and ASGI entry points.
+
+Django builds its URL resolvers, compiled templates, translation catalogs and
+password hashers lazily, and so does the app with its in-memory indexes, so
+the first requests of every worker pay for them. ``warm_up()`` builds them up
+front. When the server imports the application
+before forking its workers, like ``gunicorn --preload``, this happens once in
+the master and the workers share the memory copy-on-write. The durations of
+application loading and of every step are logged and published under the
+``startup`` metrics, to track cold start regressions.
+"""
+
+import gc
+import logging
+import time
+from pathlib import Path
+
+from django.apps import apps
+from django.conf import settings
+from django.db import connections
+
+logger = logging.getLogger(__name__)
+
+startup_timings = {}
+
+
+def resolve_urls():
+    """Compiles the pattern of every URL and populates the reverse lookup
+    tables of the resolvers."""
+    from django.urls import URLResolver, get_resolver
+
+    def walk(patterns):
+        count = 0
+        for pattern in patterns:
+            pattern.pattern.regex
+            if isinstance(pattern, URLResolver):
+                pattern.reverse_dict
+                count += walk(pattern.url_patterns)
+            else:
+                count += 1
+        return count
+
+    resolver = get_resolver()
+    resolver.reverse_dict
+    return walk(resolver.url_patterns)
+
+
+def compile_templates():
+    """Loads every template of the template directories and installed apps,
+    which the cached loader keeps compiled."""
+    from django.template import engines
+    from django.template.backends.django import DjangoTemplates
+    from django.template.utils import get_app_template_dirs
+
+    count = 0
+    for engine in engines.all():
+        if not isinstance(engine, DjangoTemplates):
+            continue
+        directories = list(engine.engine.dirs)
+        if engine.engine.app_dirs:
+            directories += get_app_template_dirs("templates")
+        for directory in map(Path, directories):
+            for path in directory.rglob("*"):
+                if path.suffix not in (".html", ".txt", ".xml"):
+                    continue
+                try:
+                    engine.get_template(path.relative_to(directory).as_posix())
+                except Exception:
+                    # Templates of unused features may need missing tags
+                    continue
+                count += 1
+    return count
+
+
+def load_translations():
+    """Loads the catalog of the default language and evaluates the lazy
+    verbose names of the models, like those of apps/users/models.py."""
+    from django.utils import translation
+
+    count = 0
+    with translation.override(settings.LANGUAGE_CODE):
+        for model in apps.get_models():
+            str(model._meta.verbose_name)
+            str(model._meta.verbose_name_plural)
+            for field in model._meta.get_fields():
+                str(getattr(field, "verbose_name", ""))
+                count += 1
+    return count
+
+
+def prime_password_hasher():
+    """Loads the configured password hashers and the hashing backend."""
+    from django.contrib.auth.hashers import get_hasher, get_hashers
+
+    hashers = get_hashers()
+    hasher = get_hasher()
+    if hasattr(hasher, "iterations"):
+        # A single iteration loads the hashing code without its CPU cost
+        hasher.encode("warm-up", hasher.salt(), iterations=1)
+    return len(hashers)
+
+
+def build_username_filter():
+    """Builds the Bloom filter answering the username availability checks
+    from the database, instead of the first check doing it."""
+    from apps.users.availability import get_username_filter
+
+    return get_username_filter().build().count
+
+
+def build_search_index():
+    """Builds the search index of the home page filters from the database,
+    instead of the first filtered request doing it."""
+    from apps.tops.search import get_search_index
+
+    return len(get_search_index())
+
+
+STEPS = [
+    ("urls", resolve_urls),
+    ("templates", compile_templates),
+    ("translations", load_translations),
+    ("password_hasher", prime_password_hasher),
+    ("username_filter", build_username_filter),
+    ("search_index", build_search_index),
+]
+
+
+def warm_up(loading_seconds=None):
+    """Runs the warm-up steps and records their durations, along with the
+    loading_seconds the application took to load when given. The database
+    connections opened meanwhile are closed, so no socket is shared with
+    forked workers, and the objects created so far are moved out of the
+    reach of the garbage collector, which would otherwise write to their
+    pages and defeat copy-on-write."""
+    if loading_seconds is not None:
+        startup_timings["loading_ms"] = round(loading_seconds * 1000, 2)
+
+    started = time.perf_counter()
+    counts = {}
+    for name, step in STEPS:
+        step_started = time.perf_counter()
+        try:
+            counts[name] = step()
+        except Exception:
+            logger.exception("Warm-up step %s failed.", name)
+            continue
+        startup_timings[f"{name}_ms"] = round(
+            (time.perf_counter() - step_started) * 1000, 2
+        )
+    startup_timings["warm_up_ms"] = round((time.perf_counter() - started) * 1000, 2)
+
+    connections.close_all()
+    gc.freeze()
+    logger.info(
+        "Worker warmed up: %s (%s).",
+        ", ".join(f"{name} {value}" for name, value in startup_timings.items()),
+        ", ".join(f"{count} {name}" for name, count in counts.items()),
+    )
+    return dict(startup_timings)
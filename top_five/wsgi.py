@@ -7,10 +7,24 @@ For more information on this file, see
 https://docs.djangoproject.com/en/5.0/howto/deployment/wsgi/
 """
 
+import atexit
 import os
+import time
 
+from django.conf import settings
 from django.core.wsgi import get_wsgi_application
 
+from top_five.lifecycle import run_shutdown_hooks
+from top_five.warmup import warm_up
+
 os.environ.setdefault("DJANGO_SETTINGS_MODULE", "top_five.settings")
 
+started = time.perf_counter()
 application = get_wsgi_application()
+
+# Before a preloading server forks, so the workers share the warmed memory
+if settings.WARMUP_ON_IMPORT:
+    warm_up(loading_seconds=time.perf_counter() - started)
+
+# WSGI has no shutdown event, flush in-memory state when the worker exits
+atexit.register(run_shutdown_hooks)